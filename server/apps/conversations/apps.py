@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ConversationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'conversations'
+
+    def ready(self):
+        from conversations import signals  # noqa: F401
@@ -0,0 +1,455 @@
+"""
+Single-flight, resumable completions.
+
+Double clicks and retries on `/stream/` ask for the same completion again.
+Requests for the same conversation state (conversation, last message and
+config) share one upstream generation instead: the first one starts it in a
+background task that appends the SSE frames to a buffer, and every request,
+the first included, replays the buffer and then follows new frames as they
+come. The reply is saved once, by the generation, and all subscribers get
+its `saved` event.
+
+Every frame has an event id, `<generation id>:<position>`. A client that
+lost its connection sends the last one it got as `Last-Event-ID` and gets
+only the frames after it, then the live tail. The buffer keeps the last
+`STREAM_REPLAY_FRAMES` frames and outlives the generation by
+`STREAM_REPLAY_TTL` seconds.
+
+When the last subscriber leaves (its client disconnected) the generation is
+cancelled, which closes the upstream response, unless a subscriber comes
+back within `STREAM_RESUME_GRACE` seconds. The producer gets the
+`CancelledError` and may still save what it got so far.
+
+`LocalBroker` shares generations within a worker process. `SharedBroker`
+also publishes them through the cache, so that a request landing on another
+worker follows the generation instead of starting its own (this needs a
+cache shared by the workers, i.e. Redis).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import uuid
+from collections import deque
+from contextlib import aclosing
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+_broker = None
+
+
+class GenerationFailed(Exception):
+    """
+    The generation a subscriber followed failed in another worker.
+    """
+
+
+class GenerationCancelled(GenerationFailed):
+    """
+    The generation was cancelled, all its subscribers having left.
+    """
+
+
+class ReplayUnavailable(GenerationFailed):
+    """
+    The frames to replay were dropped from the buffer.
+    """
+
+
+def generation_key(conversation_id, last_message_id, config):
+    """
+    Identity of a completion: the conversation, its newest message and the
+    sampling config.
+    """
+    config_hash = hashlib.sha1(
+        json.dumps(config, sort_keys=True).encode()
+    ).hexdigest()
+    return f"{conversation_id}:{last_message_id}:{config_hash}"
+
+
+def parse_event_id(event_id):
+    """
+    `(generation id, position)` of an event id, None if it is malformed.
+    """
+    id, _, position = (event_id or "").strip().partition(":")
+    if not id or not position.isdigit():
+        return None
+    return id, int(position)
+
+
+def new_generation_id():
+    return uuid.uuid4().hex[:16]
+
+
+class Generation:
+    """
+    Frames of one upstream generation, replayable by any number of
+    subscribers. Keeps the last `STREAM_REPLAY_FRAMES` frames; lives on the
+    event loop that created it.
+    """
+
+    def __init__(self, key, id=None):
+        self.id = id or new_generation_id()
+        self.key = key
+        self.frames = deque(maxlen=settings.STREAM_REPLAY_FRAMES)
+        # Position of frames[0], the ones before it were dropped
+        self.offset = 0
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        # Pending cancellation once the last subscriber left
+        self.idle = None
+        self.task = None
+        self.loop = asyncio.get_running_loop()
+        self._changed = asyncio.Condition()
+
+    @property
+    def length(self):
+        return self.offset + len(self.frames)
+
+    async def append(self, frame):
+        async with self._changed:
+            if len(self.frames) == self.frames.maxlen:
+                self.offset += 1
+            self.frames.append(frame)
+            self._changed.notify_all()
+
+    async def finish(self, error=None):
+        async with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+    async def follow(self, position=0):
+        """
+        Yield `(position, frame)` from `position` on, waiting for new frames
+        until the generation is done; re-raises its error.
+        """
+        while True:
+            if position < self.offset:
+                raise ReplayUnavailable(f"Frame {self.id}:{position} was dropped")
+            if position < self.length:
+                frames = list(islice(self.frames, position - self.offset, None))
+                for frame in frames:
+                    yield position, frame
+                    position += 1
+                continue
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            async with self._changed:
+                await self._changed.wait_for(
+                    lambda: self.done or position < self.length
+                )
+
+
+class LocalBroker:
+    """
+    Shares running generations between requests of this process.
+    """
+
+    def __init__(self):
+        # Running generations by key, and the resumable ones by id
+        self.generations = {}
+        self.resumable = {}
+        self._tasks = set()
+
+    def running(self, key):
+        generation = self.generations.get(key)
+        # Generations can't be followed from another event loop (WSGI), nor
+        # from the start once their first frames were dropped
+        if (
+            generation is not None
+            and generation.loop is asyncio.get_running_loop()
+            and not generation.offset
+        ):
+            return generation
+        return None
+
+    async def subscribe(self, key, produce):
+        """
+        `(event id, frame)` of the generation for `key`, started with
+        `produce()` (an async iterator of frames) unless it is already running.
+        """
+        generation = self.running(key)
+        if generation is None:
+            generation = self.start(key, produce)
+        else:
+            metrics.increment("stream_generations_joined")
+        # Closed with this generator, so that follow() lets go right away
+        async with aclosing(self.follow(generation)) as events:
+            async for event in events:
+                yield event
+
+    async def resume(self, event_id, conversation_id):
+        """
+        `(event id, frame)` after `event_id`, None unless its generation (of
+        the given conversation) can still be replayed from there.
+        """
+        parsed = parse_event_id(event_id)
+        if parsed is None:
+            return None
+        id, position = parsed
+        generation = self.resumable.get(id)
+        if (
+            generation is None
+            or generation.loop is not asyncio.get_running_loop()
+            or not generation.key.startswith(f"{conversation_id}:")
+            or position + 1 < generation.offset
+        ):
+            return None
+        metrics.increment("stream_generations_resumed")
+        return self.follow(generation, position + 1)
+
+    async def follow(self, generation, position=0):
+        generation.subscribers += 1
+        if generation.idle is not None:
+            generation.idle.cancel()
+            generation.idle = None
+        try:
+            async with aclosing(generation.follow(position)) as frames:
+                async for position, frame in frames:
+                    yield f"{generation.id}:{position}", frame
+        finally:
+            generation.subscribers -= 1
+            if not generation.subscribers:
+                self.abandoned(generation)
+
+    def abandoned(self, generation):
+        """
+        The last subscriber of a generation left; it is cancelled unless one
+        comes back within the grace period.
+        """
+        if settings.STREAM_RESUME_GRACE:
+            generation.idle = generation.loop.call_later(
+                settings.STREAM_RESUME_GRACE, self.cancel, generation
+            )
+        else:
+            self.cancel(generation)
+
+    def cancel(self, generation):
+        generation.idle = None
+        if generation.subscribers or generation.done or generation.task.done():
+            return
+        metrics.increment("stream_generations_cancelled")
+        # A new request for the key starts over
+        if self.generations.get(generation.key) is generation:
+            del self.generations[generation.key]
+        self.resumable.pop(generation.id, None)
+        generation.task.cancel()
+
+    def start(self, key, produce, id=None):
+        generation = Generation(key, id)
+        self.generations[key] = generation
+        self.resumable[generation.id] = generation
+        metrics.increment("stream_generations_started")
+        generation.task = self.create_task(self.run(generation, produce()))
+        return generation
+
+    def create_task(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        # Keep a reference, the loop only holds a weak one
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def run(self, generation, frames):
+        key = generation.key
+        try:
+            async for frame in frames:
+                await generation.append(frame)
+        except asyncio.CancelledError:
+            await generation.finish(GenerationCancelled(f"Completion {key} cancelled"))
+            raise
+        except Exception as exc:
+            logger.exception("Completion %s failed", key)
+            await generation.finish(exc)
+        else:
+            await generation.finish()
+        finally:
+            if self.generations.get(key) is generation:
+                del self.generations[key]
+            # Clients that lost the connection may still replay it for a while
+            generation.loop.call_later(
+                settings.STREAM_REPLAY_TTL, self.resumable.pop, generation.id, None
+            )
+
+
+class SharedBroker(LocalBroker):
+    """
+    `LocalBroker` whose generations are also followed from other workers.
+
+    The worker that wins `cache.add` on the owner key of a completion runs
+    the generation (the key's value is the generation id) and copies its
+    frames to the cache every `STREAM_BROKER_POLL` seconds; the others poll
+    them from there, counted in a `followers` key. The owner cancels the
+    generation once neither local subscribers nor followers were left for the
+    grace period.
+    """
+
+    def __init__(self, poll=None, ttl=None):
+        super().__init__()
+        self.poll = poll or settings.STREAM_BROKER_POLL
+        self.ttl = ttl or settings.STREAM_BROKER_TTL
+
+    def owner_key(self, key):
+        return f"conversations:stream:{key}:owner"
+
+    def cache_key(self, id, part):
+        return f"conversations:stream:{id}:{part}"
+
+    def state(self, generation, length=0):
+        state = {"key": generation.key, "length": length, "done": generation.done}
+        if generation.done and generation.error is not None:
+            state["error"] = str(generation.error)
+        return state
+
+    async def subscribe(self, key, produce):
+        generation = self.running(key)
+        if generation is not None:
+            metrics.increment("stream_generations_joined")
+            events = self.follow(generation)
+        else:
+            id = new_generation_id()
+            owner = None
+            # The owner may finish between our aadd() and aget()
+            while owner is None:
+                if await cache.aadd(self.owner_key(key), id, self.ttl):
+                    owner = id
+                else:
+                    owner = await cache.aget(self.owner_key(key))
+            if owner == id:
+                generation = self.start(key, produce, id)
+                # Joiners from other workers find it right away
+                await cache.aset(
+                    self.cache_key(id, "state"), self.state(generation), self.ttl
+                )
+                self.create_task(self.publish(generation))
+                events = self.follow(generation)
+            else:
+                metrics.increment("stream_generations_joined")
+                events = self.follow_remote(owner)
+        async with aclosing(events):
+            async for event in events:
+                yield event
+
+    async def resume(self, event_id, conversation_id):
+        events = await super().resume(event_id, conversation_id)
+        parsed = parse_event_id(event_id)
+        if events is not None or parsed is None:
+            return events
+        id, position = parsed
+        state = await cache.aget(self.cache_key(id, "state"))
+        if state is None or not state["key"].startswith(f"{conversation_id}:"):
+            return None
+        metrics.increment("stream_generations_resumed")
+        return self.follow_remote(id, position + 1)
+
+    def abandoned(self, generation):
+        # Followers in other workers are checked by publish()
+        pass
+
+    async def followers(self, id):
+        return await cache.aget(self.cache_key(id, "followers"), 0)
+
+    async def publish(self, generation):
+        """
+        Copy the frames of a local generation to the cache as they come.
+        """
+        id = generation.id
+        loop = asyncio.get_running_loop()
+        published = 0
+        idle_since = None
+        while True:
+            done = generation.done
+            length = generation.length
+            start = max(published, generation.offset)
+            if length > start:
+                frames = islice(generation.frames, start - generation.offset, None)
+                await cache.aset_many(
+                    {
+                        self.cache_key(id, position): frame
+                        for position, frame in zip(range(start, length), frames)
+                    },
+                    self.ttl,
+                )
+                published = length
+            state = self.state(generation, published)
+            await cache.aset(self.cache_key(id, "state"), state, self.ttl)
+            # Still alive, keep other workers waiting
+            await cache.atouch(self.owner_key(generation.key), self.ttl)
+            if done:
+                # A new request for the key starts over, whatever the outcome;
+                # the state stays for resuming unless nothing is left to resume
+                stale = [self.owner_key(generation.key)]
+                if isinstance(generation.error, GenerationCancelled):
+                    stale.append(self.cache_key(id, "state"))
+                await cache.adelete_many(stale)
+                return
+            await asyncio.sleep(self.poll)
+            if generation.subscribers or await self.followers(id):
+                idle_since = None
+                continue
+            if idle_since is None:
+                idle_since = loop.time()
+            if loop.time() - idle_since >= settings.STREAM_RESUME_GRACE:
+                self.cancel(generation)
+
+    async def follow_remote(self, id, position=0):
+        """
+        Follow a generation running in another worker through the cache.
+        """
+        if id is None:
+            raise GenerationFailed("Completion was abandoned")
+        followers = self.cache_key(id, "followers")
+        await cache.aadd(followers, 0, self.ttl)
+        await cache.aincr(followers)
+        try:
+            async with aclosing(self.poll_remote(id, position)) as events:
+                async for event in events:
+                    yield event
+        finally:
+            await cache.adecr(followers)
+
+    async def poll_remote(self, id, position):
+        while True:
+            state = await cache.aget(self.cache_key(id, "state"))
+            if state is None:
+                raise GenerationFailed(f"Completion {id} was abandoned")
+            if state["length"] > position:
+                keys = [
+                    self.cache_key(id, number)
+                    for number in range(position, state["length"])
+                ]
+                frames = await cache.aget_many(keys)
+                if len(frames) < len(keys):
+                    raise ReplayUnavailable(f"Frames of {id} expired")
+                for frame_key in keys:
+                    yield f"{id}:{position}", frames[frame_key]
+                    position += 1
+                continue
+            if state["done"]:
+                if "error" in state:
+                    raise GenerationFailed(state["error"])
+                return
+            await asyncio.sleep(self.poll)
+
+
+BROKERS = {
+    "local": LocalBroker,
+    "shared": SharedBroker,
+}
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = BROKERS[settings.STREAM_BROKER]()
+    return _broker
@@ -0,0 +1,67 @@
+import time
+
+from django.core.cache import cache
+
+CHAT_LIST_TIMEOUT = 60 * 10
+
+
+def chat_list_key(user_id):
+    return f"conversations:list:{user_id}"
+
+
+def get_chat_list(user_id):
+    """
+    Cached first page of the user's conversation list, or None.
+    """
+    return cache.get(chat_list_key(user_id))
+
+
+def set_chat_list(user_id, data):
+    cache.set(chat_list_key(user_id), data, CHAT_LIST_TIMEOUT)
+
+
+def invalidate_chat_list(user_id):
+    cache.delete(chat_list_key(user_id))
+
+
+# Messages of a chat are cached under a version that every write bumps, so
+# a stale payload is never read again and simply expires.
+MESSAGES_TIMEOUT = 60 * 10
+
+
+def messages_version_key(conversation_id):
+    return f"conversations:messages:version:{conversation_id}"
+
+
+def messages_key(conversation_id, version):
+    return f"conversations:messages:{conversation_id}:{version}"
+
+
+def get_messages_version(conversation_id):
+    """
+    Current version of a chat's messages, a `time.time_ns()` value.
+
+    A missing counter starts from the current time rather than from 1, so it
+    can't come back to a version that still has a payload cached.
+    """
+    key = messages_version_key(conversation_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_messages_version(conversation_id):
+    cache.set(messages_version_key(conversation_id), time.time_ns(), None)
+
+
+def get_messages(conversation_id, version):
+    """
+    Cached messages payload of a chat at `version`, or None.
+    """
+    return cache.get(messages_key(conversation_id, version))
+
+
+def set_messages(conversation_id, version, payload):
+    cache.set(messages_key(conversation_id, version), payload, MESSAGES_TIMEOUT)
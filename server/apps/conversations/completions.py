@@ -0,0 +1,129 @@
+"""
+Cache of deterministic completions.
+
+With `temperature` 0 the same request gets (practically) the same reply, and
+many requests are the same: canned prompts sent as the first message of a
+chat. When `COMPLETION_CACHE` is on, the frames of such a completion are kept
+in process memory, keyed by a hash of everything sent upstream, and a repeated
+request replays them instead of calling the API. Frames are replayed with the
+chunking of the original stream, `COMPLETION_CACHE_REPLAY_INTERVAL` seconds
+apart, so a hit looks like a fast live stream.
+
+Entries are evicted least recently used first once they take more than
+`COMPLETION_CACHE_BYTES`, and expire after `COMPLETION_CACHE_TTL` seconds.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from src import metrics
+
+_cache = None
+
+
+def is_deterministic(config):
+    return config["temperature"] == 0
+
+
+def completion_key(messages, config):
+    """
+    Hash of a completion request: the model, its sampling params and the full
+    message list (system prompt included).
+    """
+    request = [
+        config["model"],
+        config["maxTokens"],
+        config["temperature"],
+        config["topP"],
+        config["frequencyPenalty"],
+        config["presencePenalty"],
+        messages,
+    ]
+    return hashlib.sha256(
+        json.dumps(request, ensure_ascii=False).encode()
+    ).hexdigest()
+
+
+class Completion:
+    """
+    Frames of a finished completion and its reply text.
+    """
+
+    __slots__ = ("frames", "reply", "size", "expires")
+
+    def __init__(self, frames, reply, ttl):
+        self.frames = tuple(frames)
+        self.reply = reply
+        self.size = sum(len(frame) for frame in self.frames) + len(reply.encode())
+        self.expires = time.monotonic() + ttl
+
+    async def replay(self, interval=None):
+        if interval is None:
+            interval = settings.COMPLETION_CACHE_REPLAY_INTERVAL
+        for number, frame in enumerate(self.frames):
+            if number and interval:
+                await asyncio.sleep(interval)
+            yield frame
+
+
+class CompletionCache:
+    """
+    LRU of completions, bounded by their total size in bytes.
+    """
+
+    def __init__(self, max_bytes=None, ttl=None):
+        self.max_bytes = max_bytes or settings.COMPLETION_CACHE_BYTES
+        self.ttl = ttl or settings.COMPLETION_CACHE_TTL
+        self.entries = OrderedDict()
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            completion = self.entries.get(key)
+            if completion is not None and completion.expires <= time.monotonic():
+                self._remove(key)
+                completion = None
+            if completion is None:
+                metrics.increment("completion_cache_misses")
+                return None
+            self.entries.move_to_end(key)
+        metrics.increment("completion_cache_hits")
+        return completion
+
+    def set(self, key, frames, reply):
+        completion = Completion(frames, reply, self.ttl)
+        if completion.size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = completion
+            self.size += completion.size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                metrics.increment("completion_cache_evictions")
+
+    def _remove(self, key):
+        self.size -= self.entries.pop(key).size
+
+    def stats(self):
+        return {"entries": len(self.entries), "bytes": self.size}
+
+
+def get_completion_cache():
+    """
+    The cache of this process, None unless `COMPLETION_CACHE` is on.
+    """
+    global _cache
+    if not settings.COMPLETION_CACHE:
+        return None
+    if _cache is None:
+        _cache = CompletionCache()
+        metrics.register_gauge("completion_cache", _cache.stats)
+    return _cache
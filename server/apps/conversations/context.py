@@ -0,0 +1,159 @@
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+FORMAT_INSTRUCTION = "The response should be returned in markdown formatting."
+
+# Context window (prompt + completion tokens) of the supported models.
+# Looked up by exact name first, then by the longest matching prefix.
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-3.5-turbo-0613": 4096,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-3.5-turbo-16k-0613": 16385,
+    "gpt-4": 8192,
+    "gpt-4-0613": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106-preview": 128000,
+    "gpt-4-0125-preview": 128000,
+    "gpt-4o": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+# Tokens OpenAI adds around every message (role, separators)
+# and to prime the assistant reply.
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+
+# All chat models above share this encoding closely enough for budgeting.
+ENCODING_NAME = "cl100k_base"
+
+
+def context_window(model):
+    if model in MODEL_CONTEXT_WINDOWS:
+        return MODEL_CONTEXT_WINDOWS[model]
+    prefixes = [name for name in MODEL_CONTEXT_WINDOWS if model.startswith(name)]
+    if prefixes:
+        return MODEL_CONTEXT_WINDOWS[max(prefixes, key=len)]
+    return DEFAULT_CONTEXT_WINDOW
+
+
+@lru_cache(maxsize=None)
+def _get_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception:
+        # The BPE ranks are downloaded on first use, offline hosts fall back
+        return None
+
+
+def count_tokens(text):
+    """
+    Number of tokens in `text`.
+
+    Uses tiktoken when available, otherwise estimates one token per four
+    bytes of UTF-8, which errs on the generous side for Cyrillic text.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text.encode("utf-8")) // 4 + 1
+    return len(encoding.encode_ordinary(text))
+
+
+def truncate_to_tokens(text, limit):
+    """
+    Keep the beginning of `text` that fits into `limit` tokens.
+    """
+    if limit <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is None:
+        # Below the `count_tokens` estimate of `limit` tokens
+        return text.encode("utf-8")[: limit * 4 - 1].decode("utf-8", "ignore")
+    return encoding.decode(encoding.encode_ordinary(text)[:limit])
+
+
+class ContextOverflow(Exception):
+    """
+    Not even a part of the newest message fits into the prompt budget.
+    """
+
+
+class ContextWindow:
+    """
+    Packs conversation history, newest message first, into the prompt budget
+    of a model: its context window minus the reply (`maxTokens`), the system
+    prompt and the formatting instruction.
+
+    The newest message is always sent, truncated if need be; when the budget
+    leaves no room for it `add` raises ContextOverflow.
+    """
+
+    def __init__(self, model, max_tokens, prompt):
+        self.model = model
+        self.budget = (
+            context_window(model)
+            - max_tokens
+            - count_tokens(prompt or "")
+            - count_tokens(FORMAT_INSTRUCTION)
+            - 2 * MESSAGE_OVERHEAD
+            - REPLY_OVERHEAD
+        )
+        self._messages = []
+
+    def add(self, role, content, tokens=None):
+        """
+        Add an older message; returns False once the budget is exhausted.
+        """
+        if tokens is None:
+            tokens = count_tokens(content)
+        cost = tokens + MESSAGE_OVERHEAD
+
+        if cost > self.budget:
+            if not self._messages:
+                # The newest message alone is too long: send what fits
+                content = truncate_to_tokens(content, self.budget - MESSAGE_OVERHEAD)
+                if not content:
+                    raise ContextOverflow(
+                        f"maxTokens and the prompt leave no room for messages "
+                        f"in the {self.model} context window."
+                    )
+                self._messages.append(self._format(role, content))
+            self.budget = 0
+            return False
+
+        self.budget -= cost
+        self._messages.append(self._format(role, content))
+        return True
+
+    def messages(self):
+        """
+        Selected messages in chronological order.
+        """
+        return self._messages[::-1]
+
+    @staticmethod
+    def _format(role, content):
+        return {"role": "user" if role == "user" else "assistant", "content": content}
+
+
+def build_context(history, model, max_tokens, prompt):
+    """
+    Select messages for a completion request.
+
+    `history` is an iterable of `(role, content, tokens)` rows ordered from
+    newest to oldest; it is consumed only as far as the budget allows.
+    """
+    window = ContextWindow(model, max_tokens, prompt)
+    for role, content, tokens in history:
+        if not window.add(role, content, tokens):
+            break
+    return window.messages()
@@ -0,0 +1,100 @@
+"""
+Set-based deletion of chats and messages.
+
+Deleting through the ORM collector runs the whole cascade in one
+transaction. Here messages are removed with plain `DELETE ... WHERE id IN
+(SELECT ... LIMIT n)` statements, each committed on its own, so locks and
+transactions stay short however long the chat is.
+
+A chat is first marked with `deletedAt`, which hides it everywhere
+(`Conversation.objects` skips it). Large chats are then reaped by a
+background thread while the API has already answered; if the process
+dies first, `manage.py reap_conversations` finishes the job.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from conversations.cache import bump_messages_version, invalidate_chat_list
+from conversations.models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def delete_messages(conversation_id, batch_size=None):
+    """
+    Delete all messages of a conversation in batches; returns how many.
+    """
+    batch_size = batch_size or settings.DELETE_BATCH_SIZE
+    messages = Message.objects.filter(conversation_id=conversation_id)
+    deleted = 0
+    while True:
+        batch = messages.order_by().values("id")[:batch_size]
+        # Messages have no delete signals nor relations, so the collector
+        # runs this as one DELETE
+        count, _ = Message.objects.filter(id__in=batch).delete()
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def is_large(conversation_id):
+    threshold = settings.BACKGROUND_DELETE_THRESHOLD
+    messages = Message.objects.filter(conversation_id=conversation_id).order_by()
+    return messages.values_list("id", flat=True)[threshold : threshold + 1].exists()
+
+
+def delete_conversation(conversation):
+    """
+    Hide a conversation and delete it, in the background if it is large.
+    Returns True if the deletion was deferred.
+    """
+    Conversation.objects.filter(id=conversation.id).update(deletedAt=timezone.now())
+    invalidate_chat_list(conversation.user_id)
+    bump_messages_version(conversation.id)
+
+    if is_large(conversation.id):
+        get_executor().submit(reap_in_background, conversation.id)
+        return True
+    reap_conversation(conversation.id)
+    return False
+
+
+def reap_conversation(conversation_id):
+    """
+    Delete a conversation marked with `deletedAt` and its messages.
+    """
+    delete_messages(conversation_id)
+    Conversation.all_objects.filter(id=conversation_id).delete()
+
+
+def reap_deleted():
+    """
+    Delete every conversation marked with `deletedAt`; returns how many.
+    """
+    pending = Conversation.all_objects.filter(deletedAt__isnull=False)
+    ids = list(pending.values_list("id", flat=True))
+    for conversation_id in ids:
+        reap_conversation(conversation_id)
+    return len(ids)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reaper")
+    return _executor
+
+
+def reap_in_background(conversation_id):
+    try:
+        reap_conversation(conversation_id)
+    except Exception:
+        logger.exception("Failed to reap conversation %s", conversation_id)
+    finally:
+        close_old_connections()
@@ -0,0 +1,180 @@
+"""
+NDJSON export of a user's conversations and messages.
+
+Each conversation is written as a `conversation` record followed by its
+`message` records, oldest first. `cursor` records are written after every
+conversation and every `CURSOR_EVERY` messages; passing the last one seen
+back resumes the export right after it. Rows are read with server-side
+cursors, so memory use does not depend on the size of the history.
+"""
+import base64
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from conversations.models import Conversation, Message
+
+CONVERSATION_FIELDS = [
+    "id",
+    "title",
+    "model",
+    "prompt",
+    "maxTokens",
+    "temperature",
+    "topP",
+    "frequencyPenalty",
+    "presencePenalty",
+    "createdAt",
+    "updatedAt",
+]
+MESSAGE_FIELDS = ["id", "conversation_id", "role", "content", "createdAt"]
+
+CHUNK_SIZE = 2000
+CURSOR_EVERY = 1000
+# Lines are joined into blocks of about this size before being sent
+BLOCK_SIZE = 64 * 1024
+
+_datetime = serializers.DateTimeField()
+
+
+def _position(row):
+    return [_datetime.to_representation(row["createdAt"]), str(row["id"])]
+
+
+def encode_cursor(conversation, message=None):
+    position = _position(conversation)
+    if message is not None:
+        position += _position(message)
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    `(conversation position, message position or None)`, positions being
+    `(createdAt, id)` pairs.
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        conversation = (_datetime.to_internal_value(position[0]), position[1])
+        message = None
+        if len(position) == 4:
+            message = (_datetime.to_internal_value(position[2]), position[3])
+    except (ValueError, TypeError, IndexError, serializers.ValidationError):
+        raise ValidationError({"cursor": "Invalid cursor."})
+    return conversation, message
+
+
+def after(position):
+    created_at, id = position
+    return Q(createdAt__gt=created_at) | Q(createdAt=created_at, id__gt=id)
+
+
+def _record(kind, row):
+    record = {"type": kind}
+    for name, value in row.items():
+        if name == "createdAt" or name == "updatedAt":
+            value = _datetime.to_representation(value)
+        elif name == "id" or name == "conversation_id":
+            value = str(value)
+        record[name] = value
+    return record
+
+
+def export_records(user_id, cursor=None):
+    """
+    Export records (dicts) of a user, starting after `cursor`.
+    The cursor is checked right away, rows are read lazily.
+    """
+    positions = decode_cursor(cursor) if cursor else (None, None)
+    return _export(user_id, *positions)
+
+
+def _export(user_id, position, message_position):
+    conversations = Conversation.objects.filter(user_id=user_id)
+    if position is not None:
+        if message_position is not None:
+            # Finish the conversation the cursor stopped in
+            current = (
+                conversations.filter(createdAt=position[0], id=position[1])
+                .values(*CONVERSATION_FIELDS)
+                .first()
+            )
+            if current is not None:
+                yield from _messages(current, message_position)
+                yield {"type": "cursor", "cursor": encode_cursor(current)}
+        conversations = conversations.filter(after(position))
+
+    conversations = conversations.order_by("createdAt", "id").values(
+        *CONVERSATION_FIELDS
+    )
+    for conversation in conversations.iterator(chunk_size=CHUNK_SIZE):
+        yield _record("conversation", conversation)
+        yield from _messages(conversation)
+        yield {"type": "cursor", "cursor": encode_cursor(conversation)}
+
+
+def _messages(conversation, position=None):
+    messages = Message.objects.filter(conversation_id=conversation["id"])
+    if position is not None:
+        messages = messages.filter(after(position))
+    messages = messages.order_by("createdAt", "id").values(*MESSAGE_FIELDS)
+    for number, message in enumerate(messages.iterator(chunk_size=CHUNK_SIZE), 1):
+        yield _record("message", message)
+        if number % CURSOR_EVERY == 0:
+            yield {"type": "cursor", "cursor": encode_cursor(conversation, message)}
+
+
+def export_lines(user_id, cursor=None):
+    records = export_records(user_id, cursor)
+    return (json.dumps(r, ensure_ascii=False).encode() + b"\n" for r in records)
+
+
+def gzip_stream(chunks):
+    """
+    Gzip-compress a stream of bytes, yielding output as the compressor
+    produces it.
+    """
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def blocks(lines, size=BLOCK_SIZE):
+    """
+    Join small lines into blocks of about `size` bytes.
+    """
+    block = []
+    length = 0
+    for line in lines:
+        block.append(line)
+        length += len(line)
+        if length >= size:
+            yield b"".join(block)
+            block = []
+            length = 0
+    if block:
+        yield b"".join(block)
+
+
+async def aiterate(iterator):
+    """
+    Drive a blocking iterator from the event loop, one item per thread hop.
+
+    Under ASGI Django reads a synchronous streaming body into memory before
+    sending it. The iterator runs in the request's thread, so its database
+    cursor stays on the connection that opened it.
+    """
+    done = object()
+    get_next = sync_to_async(next)
+    while True:
+        item = await get_next(iterator, done)
+        if item is done:
+            return
+        yield item
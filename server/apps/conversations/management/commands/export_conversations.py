@@ -0,0 +1,46 @@
+import gzip
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from conversations.export import export_lines
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Export all conversations and messages of a user as NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("email")
+        parser.add_argument(
+            "--output", help="File to write, stdout by default; .gz is compressed"
+        )
+        parser.add_argument("--cursor", help="Resume after this cursor record")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email=options["email"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['email']} does not exist")
+
+        try:
+            lines = export_lines(user.id, options["cursor"])
+        except ValidationError:
+            raise CommandError("Invalid cursor")
+
+        output = options["output"]
+        if output is None:
+            file = sys.stdout.buffer
+        elif output.endswith(".gz"):
+            file = gzip.open(output, "wb")
+        else:
+            file = open(output, "wb")
+
+        try:
+            file.writelines(lines)
+        finally:
+            if output is not None:
+                file.close()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from conversations.deletion import reap_deleted
+
+
+class Command(BaseCommand):
+    help = "Delete conversations left marked as deleted (e.g. after a restart)"
+
+    def handle(self, *args, **options):
+        count = reap_deleted()
+        self.stdout.write(self.style.SUCCESS(f"Reaped {count} conversations"))
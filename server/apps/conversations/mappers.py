@@ -0,0 +1,92 @@
+"""
+Read-only serialization of messages and conversations from `values_list()`
+rows.
+
+Produces the same data as `MessageSerializer` / `ConversationSerializer`
+without building a model instance and a set of bound fields per row: the
+converter of each column is picked once per call, and a row is turned into
+a dict in a single comprehension.
+"""
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+_datetime = serializers.DateTimeField()
+
+# Converter placeholder for datetimes, resolved for the current timezone
+DATETIME = "datetime"
+
+
+def datetime_converter():
+    """
+    `DateTimeField.to_representation` for aware datetimes, with the format
+    and the current timezone looked up once.
+    """
+    output_format = api_settings.DATETIME_FORMAT
+    if output_format is None or output_format.lower() == ISO_8601:
+        return _datetime.to_representation
+    if not settings.USE_TZ:
+        return lambda value: value.strftime(output_format)
+
+    current_timezone = timezone.get_current_timezone()
+    return lambda value: value.astimezone(current_timezone).strftime(output_format)
+
+
+class RowMapper:
+    """
+    Turns `values_list(*mapper.columns)` rows into serializer-shaped dicts.
+
+    `fields` are `(key, column, convert)` triples, `convert` being a function,
+    `DATETIME`, or None for values that are output as they are.
+    """
+
+    def __init__(self, fields):
+        self.columns = tuple(column for _, column, _ in fields)
+        self.fields = tuple((key, convert) for key, _, convert in fields)
+
+    def converters(self):
+        to_datetime = datetime_converter()
+        return tuple(
+            (key, to_datetime if convert == DATETIME else convert)
+            for key, convert in self.fields
+        )
+
+    def __call__(self, row, converters=None):
+        return {
+            key: value if convert is None else convert(value)
+            for (key, convert), value in zip(converters or self.converters(), row)
+        }
+
+    def map(self, rows):
+        converters = self.converters()
+        return [self(row, converters) for row in rows]
+
+
+# Fields of MessageSerializer
+message_mapper = RowMapper(
+    [
+        ("id", "id", str),
+        ("conversation", "conversation_id", str),
+        ("content", "content", None),
+        ("role", "role", None),
+        ("createdAt", "createdAt", DATETIME),
+    ]
+)
+
+# Fields of ConversationSerializer, without `messages`
+conversation_mapper = RowMapper(
+    [
+        ("id", "id", str),
+        ("title", "title", None),
+        ("model", "model", None),
+        ("prompt", "prompt", None),
+        ("maxTokens", "maxTokens", None),
+        ("temperature", "temperature", None),
+        ("topP", "topP", None),
+        ("frequencyPenalty", "frequencyPenalty", None),
+        ("presencePenalty", "presencePenalty", None),
+        ("createdAt", "createdAt", DATETIME),
+        ("updatedAt", "updatedAt", DATETIME),
+    ]
+)
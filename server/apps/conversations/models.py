@@ -1,8 +1,20 @@
 import uuid
 
 from django.db import models
+from django.utils import timezone
 from users.models import UserAccount
 
+from conversations.context import count_tokens
+
+
+class ConversationManager(models.Manager):
+    """
+    Conversations that are not waiting to be deleted.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deletedAt__isnull=True)
+
 
 class Conversation(models.Model):
     """
@@ -26,9 +38,20 @@ class Conversation(models.Model):
     topP = models.FloatField(default=1)
     frequencyPenalty = models.FloatField(default=0)
     presencePenalty = models.FloatField(default=0)
+    # Set when a large chat is deleted in the background, see conversations.deletion
+    deletedAt = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ConversationManager()
+    all_objects = models.Manager()
 
     class Meta:
         ordering = ["-updatedAt"]
+        indexes = [
+            models.Index(
+                fields=["user", "-updatedAt"],
+                name="conversation_user_updated",
+            ),
+        ]
 
     def __str__(self):
         return f"Conversation {self.title} - {self.user.username}"
@@ -43,10 +66,24 @@ class Message(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE)
     content = models.TextField()
     role = models.CharField(max_length=255, default="user")
-    createdAt = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: bulk imports assign increasing timestamps to keep order
+    createdAt = models.DateTimeField(default=timezone.now, editable=False)
+    # Cached size of `content` for context window packing
+    tokens = models.PositiveIntegerField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ["-createdAt"]
+        indexes = [
+            models.Index(
+                fields=["conversation", "createdAt"],
+                name="message_conversation_created",
+            ),
+        ]
 
     def __str__(self):
         return f"Message {self.id} - {self.conversation}"
+
+    def save(self, *args, **kwargs):
+        if self.tokens is None:
+            self.tokens = count_tokens(self.content)
+        super().save(*args, **kwargs)
@@ -0,0 +1,136 @@
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+POSITION_SEPARATOR = "|"
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    CursorPagination whose position is the value of every `ordering` field.
+
+    DRF keeps the first field only and skips rows sharing its value with an
+    offset, which goes wrong on previous links once the ties straddle a
+    page. Ending `ordering` with a unique field makes every position unique,
+    so a page starts strictly after (or before) it and never needs an offset.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = queryset.filter(
+                self.after_position(queryset.model, current_position, reverse)
+            )
+
+        results = list(queryset[offset : offset + self.page_size + 1])
+        self.page = results[: self.page_size]
+
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering
+            )
+        else:
+            following_position = None
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = following_position is not None
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None or offset > 0
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def after_position(self, model, position, reverse):
+        """
+        Rows past `position` in the walking direction, compared field by field.
+        """
+        values = position.split(POSITION_SEPARATOR)
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        condition = Q(pk__in=[])
+        equal = Q()
+        for order, value in zip(self.ordering, values):
+            name = order.lstrip("-")
+            try:
+                value = model._meta.get_field(name).to_python(value)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            lookup = "lt" if order.startswith("-") != reverse else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        names = [order.lstrip("-") for order in ordering]
+        if isinstance(instance, dict):
+            values = [instance[name] for name in names]
+        else:
+            values = [getattr(instance, name) for name in names]
+        return POSITION_SEPARATOR.join(str(value) for value in values)
+
+
+def _reverse_ordering(ordering):
+    return tuple(
+        order[1:] if order.startswith("-") else f"-{order}" for order in ordering
+    )
+
+
+class MessageCursorPagination(KeysetCursorPagination):
+    """
+    Keyset pagination over messages of a conversation.
+
+    Backed by the `(conversation, createdAt)` index, so every page costs the
+    same however deep into the history it is. `?order=asc` pages from the
+    oldest message, default is newest first. Messages with the same
+    `createdAt` are ordered by id, so pages don't overlap or skip any.
+    """
+
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    ordering = ("-createdAt", "-id")
+    order_query_param = "order"
+
+    def get_ordering(self, request, queryset, view):
+        if request.query_params.get(self.order_query_param) == "asc":
+            return ("createdAt", "id")
+        return ("-createdAt", "-id")
+
+
+class ConversationCursorPagination(KeysetCursorPagination):
+    """
+    Keyset pagination over the conversation sidebar, recently updated first.
+    """
+
+    page_size = 30
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    ordering = ("-updatedAt", "id")
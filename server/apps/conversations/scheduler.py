@@ -0,0 +1,257 @@
+"""
+Admission control for upstream completions.
+
+Every model has a budget of concurrent completions and of tokens per minute
+(`UPSTREAM_CONCURRENCY`, `UPSTREAM_TPM`, per model `UPSTREAM_MODEL_LIMITS`).
+A completion that doesn't fit waits in the model's queue, which is served by
+start-time fair queuing across users: each request gets a start tag, the
+later of the queue's virtual time and the finish tag of the same user's
+previous request, and a finish tag, its start tag plus its cost in tokens
+over the user's weight (1 unless set in `UPSTREAM_USER_WEIGHTS`). Requests
+are admitted in start tag order, so a user with many requests queued gets the
+same share of tokens as one with a single request instead of the whole
+upstream, and a user with weight 2 twice that share.
+
+Tokens are counted like the upstream rate limiter does: a request costs its
+estimated prompt tokens plus `maxTokens` when it starts, and the budget
+refills continuously. Limits are per worker process.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+
+from django.conf import settings
+
+from conversations.context import MESSAGE_OVERHEAD, REPLY_OVERHEAD, count_tokens
+from src import metrics
+
+_scheduler = None
+
+
+def estimate_tokens(messages, max_tokens):
+    """
+    Tokens a completion request counts against the rate limit: its prompt
+    tokens, plus the reply limit.
+    """
+    prompt = sum(
+        count_tokens(message["content"]) + MESSAGE_OVERHEAD for message in messages
+    )
+    return prompt + REPLY_OVERHEAD + max_tokens
+
+
+class Ticket:
+    """
+    A completion waiting for, or holding, an upstream slot.
+    """
+
+    def __init__(self, queue, user, cost, start, finish):
+        self.queue = queue
+        self.user = user
+        self.cost = cost
+        self.start = start
+        self.finish = finish
+        self.position = None
+        self.granted = False
+        self.released = False
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        self._changed.set()
+
+    async def wait(self):
+        """
+        Yield the position in the queue whenever it changes, until the
+        ticket is admitted.
+        """
+        reported = None
+        while not self.granted:
+            if self.position != reported:
+                reported = self.position
+                yield reported
+            self._changed.clear()
+            await self._changed.wait()
+
+    def release(self):
+        """
+        Give the slot back, or leave the queue if it wasn't admitted yet.
+        """
+        if not self.released:
+            self.released = True
+            self.queue.release(self)
+
+
+class ModelQueue:
+    """
+    Budget and queue of one model.
+    """
+
+    def __init__(self, model, concurrency, tpm):
+        self.model = model
+        self.concurrency = concurrency
+        self.tpm = tpm
+        self.tokens = tpm
+        self.refilled = time.monotonic()
+        self.running = 0
+        self.waiting = 0
+        self.heap = []
+        self.virtual_time = 0
+        # Finish tag of the latest request of each user
+        self.finish_tags = {}
+        self._sequence = itertools.count()
+        self._timer = None
+        self._refresh = None
+
+    def enqueue(self, user, cost, weight=1):
+        if self.tpm:
+            # A request larger than the whole budget would never start
+            cost = min(cost, self.tpm)
+        start = max(self.virtual_time, self.finish_tags.get(user, 0))
+        finish = start + cost / weight
+        self.finish_tags[user] = finish
+        ticket = Ticket(self, user, cost, start, finish)
+        entry = (start, next(self._sequence), ticket)
+        heapq.heappush(self.heap, entry)
+        self.waiting += 1
+        self.dispatch()
+        if not ticket.granted:
+            metrics.increment("upstream_queued")
+            # Its rank in start tag order, not the end of the queue
+            ticket.position = 1 + sum(
+                1
+                for other in self.heap
+                if other[:2] < entry[:2] and not other[2].released
+            )
+            self.schedule_refresh()
+        return ticket
+
+    def release(self, ticket):
+        if ticket.granted:
+            self.running -= 1
+        else:
+            # Stays in the heap, skipped when it gets to the top
+            self.waiting -= 1
+        self.dispatch()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.tpm, self.tokens + (now - self.refilled) * self.tpm / 60
+        )
+        self.refilled = now
+
+    def dispatch(self):
+        """
+        Admit queued requests in start tag order while the budget allows.
+        """
+        if self.tpm:
+            self.refill()
+        while self.heap and (not self.concurrency or self.running < self.concurrency):
+            start, _, ticket = self.heap[0]
+            if ticket.released:
+                heapq.heappop(self.heap)
+                continue
+            if self.tpm and self.tokens < ticket.cost:
+                self.schedule_dispatch((ticket.cost - self.tokens) * 60 / self.tpm)
+                break
+            heapq.heappop(self.heap)
+            self.tokens -= ticket.cost
+            self.running += 1
+            self.waiting -= 1
+            self.virtual_time = start
+            ticket.granted = True
+            ticket.notify()
+            metrics.increment("upstream_admitted")
+        if not self.heap:
+            # Idle: nobody is owed anything
+            self.virtual_time = 0
+            self.finish_tags.clear()
+
+    def schedule_dispatch(self, delay):
+        # The head may have changed to a cheaper request since the last one
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(
+            delay, self._dispatch_later
+        )
+
+    def _dispatch_later(self):
+        self._timer = None
+        self.dispatch()
+
+    def schedule_refresh(self):
+        if self._refresh is None:
+            self._refresh = asyncio.get_running_loop().call_later(
+                settings.UPSTREAM_QUEUE_STATUS_INTERVAL, self.refresh
+            )
+
+    def refresh(self):
+        """
+        Update the queue positions of waiting requests.
+        """
+        self._refresh = None
+        self.heap = [entry for entry in self.heap if not entry[2].released]
+        self.heap.sort()
+        for position, (_, _, ticket) in enumerate(self.heap, 1):
+            if ticket.position != position:
+                ticket.position = position
+                ticket.notify()
+        # Users whose tags are behind the virtual time start from it anyway
+        if len(self.finish_tags) > 2 * len(self.heap) + 1024:
+            self.finish_tags = {
+                user: tag
+                for user, tag in self.finish_tags.items()
+                if tag > self.virtual_time
+            }
+        if self.heap:
+            self.schedule_refresh()
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "tokens": int(self.tokens) if self.tpm else None,
+        }
+
+
+class Scheduler:
+    """
+    Queues of the models, created on first use with their limits.
+    """
+
+    def __init__(self, concurrency=None, tpm=None, model_limits=None, weights=None):
+        self.concurrency = (
+            settings.UPSTREAM_CONCURRENCY if concurrency is None else concurrency
+        )
+        self.tpm = settings.UPSTREAM_TPM if tpm is None else tpm
+        self.model_limits = (
+            settings.UPSTREAM_MODEL_LIMITS if model_limits is None else model_limits
+        )
+        self.weights = settings.UPSTREAM_USER_WEIGHTS if weights is None else weights
+        self.queues = {}
+
+    def queue(self, model):
+        if model not in self.queues:
+            limits = self.model_limits.get(model, (self.concurrency, self.tpm))
+            self.queues[model] = ModelQueue(model, *limits)
+        return self.queues[model]
+
+    def enqueue(self, model, user, cost, weight=None):
+        """
+        Ticket for a completion of `model` by `user`, costing `cost` tokens.
+        `weight` defaults to the user's one from the settings.
+        """
+        if weight is None:
+            weight = self.weights.get(user, 1)
+        return self.queue(model).enqueue(user, cost, weight)
+
+    def stats(self):
+        return {model: queue.stats() for model, queue in self.queues.items()}
+
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler()
+        metrics.register_gauge("upstream_scheduler", _scheduler.stats)
+    return _scheduler
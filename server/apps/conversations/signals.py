@@ -0,0 +1,22 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from conversations.cache import bump_messages_version, invalidate_chat_list
+from conversations.models import Conversation, Message
+
+
+@receiver(post_save, sender=Conversation)
+@receiver(post_delete, sender=Conversation)
+def conversation_changed(sender, instance, **kwargs):
+    invalidate_chat_list(instance.user_id)
+    conversation_id = instance.id
+    transaction.on_commit(lambda: bump_messages_version(conversation_id))
+
+
+# No post_delete receiver: it would stop the ORM from deleting a chat's
+# messages in one statement when the chat is deleted.
+@receiver(post_save, sender=Message)
+def message_changed(sender, instance, **kwargs):
+    conversation_id = instance.conversation_id
+    transaction.on_commit(lambda: bump_messages_version(conversation_id))
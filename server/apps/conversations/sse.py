@@ -0,0 +1,135 @@
+"""
+Server-sent event frames of the completion stream.
+
+Upstream deltas are often a few bytes each. `coalesce` merges the deltas
+that arrive within `STREAM_FRAME_WINDOW` seconds (or until about
+`STREAM_FRAME_BYTES` of content) into one frame, so a reply is written in
+tens of writes instead of thousands. `heartbeat` sends `: ping` comments while
+the upstream is silent, so that proxies don't drop an idle stream. Frames
+carry an event id (`with_id`) for clients to resume from, pings don't.
+"""
+import asyncio
+import json
+from contextlib import aclosing
+
+from django.conf import settings
+
+# Same bytes as json.dumps() of the delta dict, with one dumps() per frame
+DELTA_FRAME = 'data: {{"role": "assistant", "content": {}, "finish_reason": {}}}\n\n'
+EVENT_FRAME = "event: {}\ndata: {}\n\n"
+ID_FIELD = "id: {}\n"
+PING = ": ping\n\n"
+
+TIMEOUT = object()
+
+
+def delta_frame(content, finish_reason=None):
+    return DELTA_FRAME.format(json.dumps(content), json.dumps(finish_reason))
+
+
+def event_frame(event, data):
+    return EVENT_FRAME.format(event, json.dumps(data))
+
+
+async def with_id(events):
+    """
+    Frames of `(event id, frame)` pairs, each with its `id:` field.
+    """
+    # Closing the frames closes the events, and the broker sees the client go
+    async with aclosing(events):
+        async for event_id, frame in events:
+            yield ID_FIELD.format(event_id) + frame
+
+
+class Reader:
+    """
+    Reads an async iterator with a timeout per item. A read that times out
+    is not cancelled, the next call keeps waiting for the same item.
+    """
+
+    def __init__(self, iterator):
+        self.iterator = aiter(iterator)
+        self.pending = None
+
+    async def next(self, timeout=None):
+        """
+        The next item, `TIMEOUT` if none came within `timeout` seconds.
+        Raises `StopAsyncIteration` at the end.
+        """
+        if self.pending is None:
+            self.pending = asyncio.ensure_future(anext(self.iterator))
+        done, _ = await asyncio.wait([self.pending], timeout=timeout)
+        if not done:
+            return TIMEOUT
+        pending, self.pending = self.pending, None
+        return pending.result()
+
+    async def aclose(self):
+        if self.pending is not None:
+            self.pending.cancel()
+            # The iterator can't be closed while the read is still running
+            await asyncio.wait([self.pending])
+            self.pending = None
+        if hasattr(self.iterator, "aclose"):
+            await self.iterator.aclose()
+
+
+async def coalesce(deltas, window=None, max_bytes=None):
+    """
+    Frames for the deltas of `stream_completion`. Contents arriving within
+    `window` seconds of the first pending one are sent in a single frame,
+    earlier if they reach `max_bytes`; the final delta (with a
+    `finish_reason`) gets a frame of its own. A zero window sends one frame
+    per delta.
+    """
+    window = settings.STREAM_FRAME_WINDOW if window is None else window
+    max_bytes = settings.STREAM_FRAME_BYTES if max_bytes is None else max_bytes
+    loop = asyncio.get_running_loop()
+    reader = Reader(deltas)
+    pending = []
+    size = 0
+    deadline = None
+    try:
+        while True:
+            timeout = None if not pending else max(deadline - loop.time(), 0)
+            try:
+                delta = await reader.next(timeout)
+            except StopAsyncIteration:
+                break
+
+            if delta is not TIMEOUT and not delta["finish_reason"]:
+                if not pending:
+                    deadline = loop.time() + window
+                pending.append(delta["content"] or "")
+                size += len(pending[-1])
+                if window and size < max_bytes and loop.time() < deadline:
+                    continue
+
+            if pending:
+                yield delta_frame("".join(pending))
+                pending = []
+                size = 0
+            if delta is not TIMEOUT and delta["finish_reason"]:
+                yield delta_frame(delta["content"], delta["finish_reason"])
+        if pending:
+            yield delta_frame("".join(pending))
+    finally:
+        await reader.aclose()
+
+
+async def heartbeat(frames, interval=None):
+    """
+    Relay `frames`, adding a `: ping` comment after every `interval` seconds
+    without one.
+    """
+    interval = settings.STREAM_HEARTBEAT if interval is None else interval
+    reader = Reader(frames)
+    try:
+        while True:
+            try:
+                frame = await reader.next(interval or None)
+            except StopAsyncIteration:
+                return
+            yield PING if frame is TIMEOUT else frame
+    finally:
+        await reader.aclose()
@@ -1,22 +1,92 @@
-import json
+import asyncio
+from contextlib import aclosing
 
-import httpx
-from openai import OpenAI
+from asgiref.sync import sync_to_async
+from django.db import connections, transaction
+from django.utils import timezone
+from openai import AsyncOpenAI
 
-from src.settings import APIKEY, PROXY_URL
+from conversations.cache import bump_messages_version, invalidate_chat_list
+from conversations.completions import (
+    completion_key,
+    get_completion_cache,
+    is_deterministic,
+)
+from conversations.context import FORMAT_INSTRUCTION
+from conversations.models import Conversation, Message
+from conversations.scheduler import estimate_tokens, get_scheduler
+from conversations.sse import coalesce, event_frame
+from conversations.titles import assign_title
+from conversations.transport import (
+    build_async_http_client,
+    build_timeout,
+    build_transport,
+    pool_stats,
+)
+from src import metrics
+from src.settings import APIKEY, OPENAI_BASE_URL
 
-proxies = {
-    "all://": PROXY_URL,
-}
+transport = build_transport()
 
-client = OpenAI(
+# Retries are done by the transport (connect errors only), not by the SDK
+client = AsyncOpenAI(
     api_key=APIKEY,
-    http_client=httpx.Client(proxies=proxies),
+    base_url=OPENAI_BASE_URL,
+    max_retries=0,
+    timeout=build_timeout(),
+    http_client=build_async_http_client(transport),
 )
 
+metrics.register_gauge("openai_pool", lambda: pool_stats(transport))
+
+
+@sync_to_async
+def save_assistant_reply(conversation, content):
+    """
+    Store a finished reply and refresh the conversation in one transaction.
+
+    Runs in the generation's task, outside of any request, so nothing else
+    closes the connection it opens.
+    """
+    try:
+        with transaction.atomic():
+            message = Message.objects.create(
+                conversation_id=conversation.id, content=content, role="assistant"
+            )
+            Conversation.objects.filter(id=conversation.id).update(
+                updatedAt=timezone.now()
+            )
+            assign_title(conversation, content)
+            user_id = conversation.user_id
+            transaction.on_commit(lambda: invalidate_chat_list(user_id))
+            transaction.on_commit(lambda: bump_messages_version(conversation.id))
+    finally:
+        connections.close_all()
+    return message
 
-async def send_gpt_request_async(message_list, config):
-    response = client.chat.completions.create(
+
+def build_messages(message_list, config):
+    """
+    Messages of a completion request: the system prompt, the format
+    instruction and the chat history.
+    """
+    return [
+        {
+            "role": "system",
+            "content": f"{config['prompt']}",
+        },
+        {
+            "role": "user",
+            "content": FORMAT_INSTRUCTION,
+        },
+    ] + message_list
+
+
+async def stream_completion(message_list, config):
+    """
+    Request a completion and yield its deltas as they arrive.
+    """
+    response = await client.chat.completions.create(
         model=config["model"],
         temperature=config["temperature"],
         max_tokens=config["maxTokens"],
@@ -24,20 +94,89 @@ async def send_gpt_request_async(message_list, config):
         frequency_penalty=config["frequencyPenalty"],
         presence_penalty=config["presencePenalty"],
         stream=True,
-        messages=[
-            {
-                "role": "system",
-                "content": f"{config['prompt']}",
-                "role": "user",
-                "content": "The response should be returned in markdown formatting.",
-            },
-        ]
-        + message_list,
+        messages=build_messages(message_list, config),
     )
-    for chunk in response:
-        chunk_parsed = {
-            "role": "assistant",
-            "content": chunk.choices[0].delta.content,
-            "finish_reason": chunk.choices[0].finish_reason,
-        }
-        yield f"data: {json.dumps(chunk_parsed)}\n\n"
+    async with response:
+        async for chunk in response:
+            if not chunk.choices:
+                continue
+            yield {
+                "role": "assistant",
+                "content": chunk.choices[0].delta.content,
+                "finish_reason": chunk.choices[0].finish_reason,
+            }
+
+
+async def send_gpt_request_async(message_list, config, conversation=None):
+    """
+    Relay a completion as server-sent events, deltas coalesced into frames.
+
+    When `conversation` is given, the reply is collected while it streams
+    and saved as an assistant message once `finish_reason` arrives; its id is
+    sent as a final `saved` event. If the generation is cancelled, the part
+    received so far is saved instead, without the event.
+
+    Deterministic completions are replayed from the completion cache, if
+    enabled, and stored there once finished. Requests sent upstream wait for
+    the scheduler to admit them, with a `queue` event whenever their position
+    changes.
+    """
+    messages = build_messages(message_list, config)
+    cache = get_completion_cache() if is_deterministic(config) else None
+    cached = None
+    if cache is not None:
+        key = completion_key(messages, config)
+        cached = cache.get(key)
+
+    if cached is not None:
+        async for frame in cached.replay():
+            yield frame
+        content = cached.reply
+    else:
+        reply = []
+        frames = []
+        finished = False
+
+        async def collect(deltas):
+            nonlocal finished
+            async for delta in deltas:
+                if delta["content"]:
+                    reply.append(delta["content"])
+                finished = finished or bool(delta["finish_reason"])
+                yield delta
+
+        # Waits for an upstream slot of the model, reporting the queue position
+        ticket = get_scheduler().enqueue(
+            config["model"],
+            conversation and conversation.user_id,
+            estimate_tokens(messages, config["maxTokens"]),
+        )
+        try:
+            async for position in ticket.wait():
+                yield event_frame("queue", {"position": position})
+            # Stop reading the upstream before the slot is given back
+            deltas = collect(stream_completion(message_list, config))
+            async with aclosing(coalesce(deltas)) as coalesced:
+                async for frame in coalesced:
+                    if cache is not None:
+                        frames.append(frame)
+                    yield frame
+        except asyncio.CancelledError:
+            # Every client left: keep the part of the reply that came so far
+            if conversation is not None and reply:
+                await asyncio.shield(
+                    save_assistant_reply(conversation, "".join(reply))
+                )
+            raise
+        finally:
+            ticket.release()
+
+        if not finished:
+            return
+        content = "".join(reply)
+        if cache is not None:
+            cache.set(key, frames, content)
+
+    if conversation is not None:
+        message = await save_assistant_reply(conversation, content)
+        yield event_frame("saved", {"id": str(message.id)})
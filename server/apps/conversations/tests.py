@@ -0,0 +1,1275 @@
+import asyncio
+import json
+import uuid
+from base64 import b64encode
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from users.models import UserAccount
+
+from conversations.broker import LocalBroker, SharedBroker, get_broker
+from conversations.completions import CompletionCache, completion_key
+from conversations.context import (
+    FORMAT_INSTRUCTION,
+    MESSAGE_OVERHEAD,
+    REPLY_OVERHEAD,
+    ContextOverflow,
+    ContextWindow,
+    build_context,
+    context_window,
+    count_tokens,
+)
+from conversations.deletion import delete_conversation, delete_messages, get_executor
+from conversations.export import export_records
+from conversations.mappers import conversation_mapper, message_mapper
+from conversations.models import Conversation, Message
+from conversations.scheduler import Scheduler
+from conversations.serializers import ConversationSerializer, MessageSerializer
+from conversations.sse import PING, coalesce, delta_frame, heartbeat, with_id
+from conversations.tasks import send_gpt_request_async
+from src import metrics
+from src.testing import QueryBudgetMixin
+from src.throttling import SlidingWindowUserRateThrottle
+
+# Upper bound for a disconnect to reach the upstream
+CANCEL_TIMEOUT = 1
+
+
+class ConversationsQueryBudgetTest(QueryBudgetMixin, APITestCase):
+    """
+    Every conversations endpoint stays within its `QUERY_BUDGETS` entry.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create(email="budget@example.com")
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.chat = Conversation.objects.create(user=self.user)
+        self.message = Message.objects.create(conversation=self.chat, content="Hi")
+        # Warm the JWT user cache, as for any request after the first one
+        self.client.get("/api/v1/conversations/")
+
+    def test_chats_list_create(self):
+        self.assertQueryBudget("chats-list-create")
+        self.assertQueryBudget("chats-list-create", "post", data={"title": "New"})
+
+    def test_chat_config_update(self):
+        self.assertQueryBudget(
+            "chat-config-update",
+            "patch",
+            conversation_id=self.chat.id,
+            data={"title": "Renamed"},
+        )
+
+    def test_chat_delete(self):
+        self.assertQueryBudget("chat-delete", "delete", conversation_id=self.chat.id)
+
+    def test_delete_messages_in_chat(self):
+        self.assertQueryBudget(
+            "delete-messages-in-chat", "delete", conversation_id=self.chat.id
+        )
+
+    def test_chat_messages_list(self):
+        self.assertQueryBudget("chat-messages-list", conversation_id=self.chat.id)
+
+    def test_chat_messages_page(self):
+        self.assertQueryBudget("chat-messages-page", conversation_id=self.chat.id)
+
+    def test_message_create(self):
+        self.assertQueryBudget(
+            "message-create",
+            "post",
+            conversation_id=self.chat.id,
+            data={"content": "Answer", "role": "assistant"},
+        )
+
+    def test_messages_bulk_create(self):
+        self.assertQueryBudget(
+            "messages-bulk-create",
+            "post",
+            conversation_id=self.chat.id,
+            data=[{"content": "Question"}, {"content": "Answer", "role": "assistant"}],
+        )
+
+    def test_message_delete(self):
+        self.assertQueryBudget(
+            "message-delete",
+            "delete",
+            conversation_id=self.chat.id,
+            message_id=self.message.id,
+        )
+
+
+@override_settings(STREAM_RESUME_GRACE=0)
+class BrokerCancellationTest(SimpleTestCase):
+    """
+    A generation whose last client disconnected stops reading the upstream.
+    """
+
+    async def test_disconnect_cancels_generation(self):
+        broker = LocalBroker()
+        upstream_closed = asyncio.Event()
+
+        async def produce():
+            # Fake upstream, streams until closed
+            try:
+                while True:
+                    yield "data: {}\n\n"
+                    await asyncio.sleep(0.01)
+            finally:
+                upstream_closed.set()
+
+        frames = with_id(broker.subscribe("key", produce))
+        self.assertTrue((await anext(frames)).startswith("id: "))
+        [generation] = broker.generations.values()
+
+        # What the ASGI handler does when the client disconnects
+        await frames.aclose()
+
+        await asyncio.wait_for(upstream_closed.wait(), CANCEL_TIMEOUT)
+        await asyncio.wait_for(asyncio.wait([generation.task]), CANCEL_TIMEOUT)
+        self.assertTrue(generation.task.cancelled())
+        self.assertNotIn("key", broker.generations)
+
+    async def test_joined_generation_runs_until_last_client_leaves(self):
+        broker = LocalBroker()
+
+        async def produce():
+            while True:
+                yield "data: {}\n\n"
+                await asyncio.sleep(0.01)
+
+        first = with_id(broker.subscribe("key", produce))
+        second = with_id(broker.subscribe("key", produce))
+        await anext(first)
+        await anext(second)
+        [generation] = broker.generations.values()
+
+        await first.aclose()
+        await asyncio.sleep(0.05)
+        self.assertFalse(generation.task.done())
+
+        await second.aclose()
+        await asyncio.wait_for(asyncio.wait([generation.task]), CANCEL_TIMEOUT)
+        self.assertTrue(generation.task.cancelled())
+
+
+@override_settings(STREAM_RESUME_GRACE=0)
+class SharedBrokerTest(SimpleTestCase):
+    """
+    A finished generation doesn't hold its key in the cache.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_failed_generation_is_retried(self):
+        broker = SharedBroker(poll=0.01)
+        started = 0
+
+        async def failing():
+            nonlocal started
+            started += 1
+            yield "data: {}\n\n"
+            raise RuntimeError("upstream 500")
+
+        async def working():
+            nonlocal started
+            started += 1
+            yield "data: {}\n\n"
+
+        with self.assertRaises(RuntimeError), self.assertLogs("conversations.broker"):
+            async for _ in broker.subscribe("key", failing):
+                pass
+        # Let publish() see the end
+        await asyncio.sleep(0.1)
+        self.assertIsNone(await cache.aget(broker.owner_key("key")))
+
+        frames = [frame async for _, frame in broker.subscribe("key", working)]
+        self.assertEqual(frames, ["data: {}\n\n"])
+        self.assertEqual(started, 2)
+
+    async def test_finished_generation_can_be_resumed(self):
+        broker = SharedBroker(poll=0.01)
+
+        async def produce():
+            yield "first"
+            yield "second"
+
+        events = [event async for event in broker.subscribe("1:key", produce)]
+        await asyncio.sleep(0.1)
+        self.assertIsNone(await cache.aget(broker.owner_key("1:key")))
+        # Another worker resumes from the cache
+        other = SharedBroker(poll=0.01)
+        resumed = await other.resume(events[0][0], 1)
+        self.assertEqual([frame async for _, frame in resumed], ["second"])
+
+
+@override_settings(STREAM_RESUME_GRACE=0, COMPLETION_CACHE=False)
+class PartialReplyTest(TransactionTestCase):
+    """
+    A cancelled generation saves the part of the reply it got.
+    """
+
+    async def test_cancelled_reply_is_saved(self):
+        user = await UserAccount.objects.acreate(email="partial@example.com")
+        chat = await Conversation.objects.acreate(user=user)
+        config = {
+            "model": chat.model,
+            "prompt": chat.prompt,
+            "maxTokens": chat.maxTokens,
+            "temperature": chat.temperature,
+            "topP": chat.topP,
+            "frequencyPenalty": chat.frequencyPenalty,
+            "presencePenalty": chat.presencePenalty,
+        }
+
+        async def stream_completion(message_list, config):
+            yield {"role": "assistant", "content": "Half", "finish_reason": None}
+            # The rest never comes
+            await asyncio.Event().wait()
+
+        broker = LocalBroker()
+        with mock.patch(
+            "conversations.tasks.stream_completion", stream_completion
+        ), override_settings(STREAM_FRAME_WINDOW=0):
+            frames = with_id(
+                broker.subscribe(
+                    "key", lambda: send_gpt_request_async([], config, chat)
+                )
+            )
+            await anext(frames)
+            [generation] = broker.generations.values()
+            await frames.aclose()
+            await asyncio.wait_for(asyncio.wait([generation.task]), CANCEL_TIMEOUT)
+
+        message = await Message.objects.aget(conversation=chat)
+        self.assertEqual(message.role, "assistant")
+        self.assertEqual(message.content, "Half")
+
+
+class SchedulerTest(SimpleTestCase):
+    """
+    Fair queuing of upstream completions, one slot and no token limit.
+    """
+
+    def drain(self, tickets):
+        # Users in the order their tickets get the slot
+        order = []
+        for _ in tickets:
+            [ticket] = [t for t in tickets if t.granted and not t.released]
+            order.append(ticket.user)
+            ticket.release()
+        return order
+
+    async def test_users_take_turns(self):
+        scheduler = Scheduler(1, 0, {}, {})
+        holder = scheduler.enqueue("m", "holder", 100)
+        heavy = [scheduler.enqueue("m", "heavy", 100) for _ in range(4)]
+        light = scheduler.enqueue("m", "light", 100)
+
+        self.assertEqual([ticket.position for ticket in heavy], [1, 2, 3, 4])
+        # Ahead of the heavy user's later requests
+        self.assertEqual(light.position, 2)
+
+        holder.release()
+        order = self.drain(heavy + [light])
+        self.assertEqual(order, ["heavy", "light", "heavy", "heavy", "heavy"])
+
+    async def test_weight_sets_share(self):
+        scheduler = Scheduler(1, 0, {}, {"a": 2})
+        holder = scheduler.enqueue("m", "holder", 100)
+        tickets = [scheduler.enqueue("m", "a", 100) for _ in range(4)]
+        tickets += [scheduler.enqueue("m", "b", 100) for _ in range(2)]
+
+        holder.release()
+        self.assertEqual(self.drain(tickets), ["a", "b", "a", "a", "b", "a"])
+
+    async def test_released_ticket_leaves_queue(self):
+        scheduler = Scheduler(1, 0, {}, {})
+        holder = scheduler.enqueue("m", "holder", 100)
+        first = scheduler.enqueue("m", "first", 100)
+        second = scheduler.enqueue("m", "second", 100)
+        first.release()
+        third = scheduler.enqueue("m", "third", 100)
+
+        self.assertEqual(third.position, 2)
+        holder.release()
+        self.assertTrue(second.granted)
+        self.assertEqual(scheduler.stats()["m"]["waiting"], 1)
+
+
+CONFIG = {
+    "model": "gpt-3.5-turbo",
+    "maxTokens": 100,
+    "temperature": 0,
+    "topP": 1,
+    "frequencyPenalty": 0,
+    "presencePenalty": 0,
+}
+
+
+class CompletionCacheTest(SimpleTestCase):
+    """
+    Size-bounded LRU of finished completions.
+    """
+
+    def test_key_covers_request(self):
+        messages = [{"role": "user", "content": "Привет"}]
+        key = completion_key(messages, CONFIG)
+        self.assertEqual(key, completion_key(list(messages), dict(CONFIG)))
+        self.assertNotEqual(
+            key, completion_key([{"role": "user", "content": "Пока"}], CONFIG)
+        )
+        self.assertNotEqual(key, completion_key(messages, {**CONFIG, "model": "gpt-4"}))
+        self.assertNotEqual(key, completion_key(messages, {**CONFIG, "topP": 0.5}))
+
+    def test_least_recently_used_is_evicted(self):
+        # Room for two 10 byte entries
+        completions = CompletionCache(max_bytes=25, ttl=60)
+        completions.set("a", ["12345"], "12345")
+        completions.set("b", ["12345"], "12345")
+        completions.get("a")
+        completions.set("c", ["12345"], "12345")
+
+        self.assertIsNotNone(completions.get("a"))
+        self.assertIsNone(completions.get("b"))
+        self.assertIsNotNone(completions.get("c"))
+        self.assertEqual(completions.stats(), {"entries": 2, "bytes": 20})
+
+    def test_entry_larger_than_cap_is_skipped(self):
+        completions = CompletionCache(max_bytes=10, ttl=60)
+        completions.set("a", ["12345"], "12345")
+        completions.set("b", ["123456"], "123456")
+
+        self.assertIsNone(completions.get("b"))
+        self.assertIsNotNone(completions.get("a"))
+
+    def test_entry_expires(self):
+        completions = CompletionCache(max_bytes=100, ttl=60)
+        with mock.patch("conversations.completions.time.monotonic", return_value=0):
+            completions.set("a", ["frame"], "reply")
+        with mock.patch("conversations.completions.time.monotonic", return_value=59):
+            self.assertIsNotNone(completions.get("a"))
+        with mock.patch("conversations.completions.time.monotonic", return_value=60):
+            self.assertIsNone(completions.get("a"))
+        self.assertEqual(completions.stats(), {"entries": 0, "bytes": 0})
+
+    def test_replay_keeps_frames(self):
+        completions = CompletionCache(max_bytes=100, ttl=60)
+        completions.set("a", ["one", "two"], "onetwo")
+        completion = completions.get("a")
+
+        async def replay():
+            return [frame async for frame in completion.replay(interval=0)]
+
+        self.assertEqual(async_to_sync(replay)(), ["one", "two"])
+        self.assertEqual(completion.reply, "onetwo")
+
+
+class ASGIClient:
+    """
+    GET through `src.asgi.application` whose client disconnects once
+    `disconnected` is set.
+    """
+
+    def __init__(self, path, authorization):
+        self.scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [
+                (b"host", b"testserver"),
+                (b"authorization", authorization.encode()),
+            ],
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+        }
+        self.status = None
+        self.chunks = []
+        self.received = asyncio.Event()
+        self.disconnected = asyncio.Event()
+
+    async def get(self):
+        from src.asgi import application
+
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await self.disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                self.status = message["status"]
+            elif message.get("body"):
+                self.chunks.append(message["body"])
+                self.received.set()
+
+        await application(self.scope, receive, send)
+
+
+@override_settings(STREAM_RESUME_GRACE=0)
+class ASGIDisconnectTest(TransactionTestCase):
+    """
+    `http.disconnect` from the ASGI server closes the upstream completion.
+    """
+
+    async def test_disconnect_closes_upstream(self):
+        cache.clear()
+        user = await UserAccount.objects.acreate(email="asgi@example.com")
+        chat = await Conversation.objects.acreate(user=user)
+        await Message.objects.acreate(conversation=chat, content="Hi")
+        client = ASGIClient(
+            reverse("chat-stream", kwargs={"conversation_id": chat.id}),
+            f"Bearer {AccessToken.for_user(user)}",
+        )
+        upstream_closed = asyncio.Event()
+
+        async def upstream(*args):
+            try:
+                while True:
+                    yield "data: {}\n\n"
+                    await asyncio.sleep(0.01)
+            finally:
+                upstream_closed.set()
+
+        disconnects = metrics.snapshot()["counters"].get("streams_disconnected", 0)
+        with mock.patch(
+            "conversations.views.ChatCompletionStream.send_gpt_request_async",
+            upstream,
+        ):
+            request = asyncio.create_task(client.get())
+            await asyncio.wait_for(client.received.wait(), CANCEL_TIMEOUT)
+            self.assertEqual(client.status, 200)
+            self.assertFalse(upstream_closed.is_set())
+
+            client.disconnected.set()
+            await asyncio.wait_for(request, CANCEL_TIMEOUT)
+            await asyncio.wait_for(upstream_closed.wait(), CANCEL_TIMEOUT)
+
+        self.assertEqual(
+            metrics.snapshot()["counters"]["streams_disconnected"], disconnects + 1
+        )
+
+
+@override_settings(STREAM_RESUME_GRACE=0)
+class StreamResumeTest(TransactionTestCase):
+    """
+    A client reconnecting with `Last-Event-ID` gets only what it missed.
+    """
+
+    async def create_chat(self):
+        cache.clear()
+        user = await UserAccount.objects.acreate(email="resume@example.com")
+        self.chat = await Conversation.objects.acreate(user=user)
+        self.url = reverse("chat-stream", kwargs={"conversation_id": self.chat.id})
+        self.auth = f"Bearer {AccessToken.for_user(user)}"
+
+    async def stream(self, last_event_id):
+        response = await self.async_client.get(
+            self.url,
+            headers={"Authorization": self.auth, "Last-Event-ID": last_event_id},
+        )
+        if response.status_code != 200:
+            return response, []
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        return response, [frame for frame in body.decode().split("\n\n") if frame]
+
+    async def test_resume_replays_frames_after_event_id(self):
+        await self.create_chat()
+
+        async def produce():
+            for number in range(4):
+                yield f"data: {number}\n\n"
+
+        generation = get_broker().start(f"{self.chat.id}:last:config", produce)
+        await asyncio.wait([generation.task])
+
+        response, frames = await self.stream(f"{generation.id}:1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            frames,
+            [
+                f"id: {generation.id}:2\ndata: 2",
+                f"id: {generation.id}:3\ndata: 3",
+            ],
+        )
+
+    async def test_nothing_to_resume(self):
+        await self.create_chat()
+
+        async def produce():
+            yield "data: 0\n\n"
+
+        # Of another conversation
+        generation = get_broker().start("other:last:config", produce)
+        await asyncio.wait([generation.task])
+
+        for event_id in ["0123456789abcdef:0", "malformed", f"{generation.id}:0"]:
+            response, _ = await self.stream(event_id)
+            self.assertEqual(response.status_code, 204, event_id)
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop whose clock jumps to the next timer instead of waiting for it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.now = 0
+
+    def time(self):
+        return self.now
+
+    def _run_once(self):
+        if not self._ready and self._scheduled:
+            self.now = max(self.now, self._scheduled[0].when())
+        super()._run_once()
+
+
+def run_virtual(coroutine):
+    loop = VirtualTimeLoop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def timed_deltas(*deltas):
+    """
+    Deltas of `(seconds after the previous one, content, finish_reason)`.
+    """
+    for delay, content, finish_reason in deltas:
+        await asyncio.sleep(delay)
+        yield {"role": "assistant", "content": content, "finish_reason": finish_reason}
+
+
+async def collect_frames(frames):
+    loop = asyncio.get_running_loop()
+    return [(loop.time(), frame) async for frame in frames]
+
+
+class CoalesceTest(SimpleTestCase):
+    """
+    Deltas merged into frames by time window and size, on a virtual clock.
+    """
+
+    def test_deltas_within_window_share_frame(self):
+        deltas = timed_deltas(
+            (0, "a", None), (0.01, "b", None), (0.5, "c", None), (0, None, "stop")
+        )
+        frames = run_virtual(
+            collect_frames(coalesce(deltas, window=0.1, max_bytes=1024))
+        )
+        self.assertEqual(
+            frames,
+            [
+                (0.1, delta_frame("ab")),
+                (0.51, delta_frame("c")),
+                (0.51, delta_frame(None, "stop")),
+            ],
+        )
+
+    def test_size_flushes_before_window(self):
+        deltas = timed_deltas(
+            (0, "ab", None), (0, "cd", None), (0, "e", None), (0, None, "stop")
+        )
+        frames = run_virtual(collect_frames(coalesce(deltas, window=1, max_bytes=3)))
+        self.assertEqual(
+            [frame for _, frame in frames],
+            [delta_frame("abcd"), delta_frame("e"), delta_frame(None, "stop")],
+        )
+        self.assertEqual(frames[0][0], 0)
+
+    def test_zero_window_sends_every_delta(self):
+        deltas = timed_deltas((0, "a", None), (0, "b", None), (0, None, "stop"))
+        frames = run_virtual(collect_frames(coalesce(deltas, window=0, max_bytes=1)))
+        self.assertEqual(
+            [frame for _, frame in frames],
+            [delta_frame("a"), delta_frame("b"), delta_frame(None, "stop")],
+        )
+
+    def test_heartbeat_pings_while_idle(self):
+        async def frames():
+            yield "one"
+            await asyncio.sleep(40)
+            yield "two"
+
+        sent = run_virtual(collect_frames(heartbeat(frames(), interval=15)))
+        self.assertEqual(sent, [(0, "one"), (15, PING), (30, PING), (40, "two")])
+
+    def test_no_heartbeat_without_interval(self):
+        async def frames():
+            yield "one"
+            await asyncio.sleep(40)
+            yield "two"
+
+        sent = run_virtual(collect_frames(heartbeat(frames(), interval=0)))
+        self.assertEqual(sent, [(0, "one"), (40, "two")])
+
+
+class RowMapperTest(TestCase):
+    """
+    Row mappers render the same bytes as the serializers they replace.
+    """
+
+    def setUp(self):
+        user = UserAccount.objects.create(email="mapper@example.com")
+        self.chat = Conversation.objects.create(
+            user=user, title="Чат «1»", temperature=0.3, topP=0.95
+        )
+        for number, role in enumerate(["user", "assistant", "user"]):
+            Message.objects.create(
+                conversation=self.chat,
+                content=f"Сообщение {number} \u2014 ok",
+                role=role,
+            )
+        self.chat.refresh_from_db()
+
+    def render_both(self):
+        messages = Message.objects.filter(conversation=self.chat).order_by("createdAt")
+        serialized = ConversationSerializer(self.chat).data
+        serialized["messages"] = MessageSerializer(messages, many=True).data
+        mapped = conversation_mapper(
+            Conversation.objects.values_list(*conversation_mapper.columns).get(
+                id=self.chat.id
+            )
+        )
+        mapped["messages"] = message_mapper.map(
+            messages.values_list(*message_mapper.columns)
+        )
+        return JSONRenderer().render(serialized), JSONRenderer().render(mapped)
+
+    def test_same_output(self):
+        serialized, mapped = self.render_both()
+        self.assertEqual(mapped, serialized)
+
+    @override_settings(TIME_ZONE="Europe/Moscow")
+    def test_same_output_in_local_time(self):
+        with timezone.override("Asia/Vladivostok"):
+            serialized, mapped = self.render_both()
+        self.assertEqual(mapped, serialized)
+
+    def test_same_output_with_datetime_format(self):
+        with override_settings(REST_FRAMEWORK={"DATETIME_FORMAT": "%d.%m.%Y %H:%M"}):
+            serialized, mapped = self.render_both()
+        self.assertEqual(mapped, serialized)
+        self.assertRegex(mapped, rb'"createdAt":"\d\d\.\d\d\.\d{4} ')
+
+
+class DeletionTest(APITestCase):
+    """
+    Soft-deleted chats are hidden at once and reaped in batches.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create(email="delete@example.com")
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.chat = Conversation.objects.create(user=self.user)
+        self.other = Conversation.objects.create(user=self.user)
+        for chat in (self.chat, self.other):
+            Message.objects.bulk_create(
+                Message(conversation=chat, content=str(number)) for number in range(7)
+            )
+
+    def test_messages_deleted_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(delete_messages(self.chat.id, batch_size=3), 7)
+        deletes = [q for q in queries if q["sql"].startswith("DELETE")]
+        self.assertEqual(len(deletes), 3)
+        self.assertFalse(Message.objects.filter(conversation=self.chat).exists())
+        self.assertEqual(Message.objects.filter(conversation=self.other).count(), 7)
+
+    @override_settings(BACKGROUND_DELETE_THRESHOLD=5)
+    @mock.patch("conversations.deletion.get_executor")
+    def test_large_chat_is_hidden_until_reaped(self, get_executor):
+        url = reverse("chat-delete", kwargs={"conversation_id": self.chat.id})
+        self.assertEqual(self.client.delete(url).status_code, 202)
+        get_executor.return_value.submit.assert_called_once()
+
+        chats = self.client.get(reverse("chats-list-create")).json()
+        ids = [chat["id"] for chat in chats.get("results", chats)]
+        self.assertEqual(ids, [str(self.other.id)])
+        messages_url = reverse(
+            "chat-messages-list", kwargs={"conversation_id": self.chat.id}
+        )
+        self.assertEqual(self.client.get(messages_url).status_code, 404)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        # Still there until the reaper runs
+        self.assertTrue(Conversation.all_objects.filter(id=self.chat.id).exists())
+
+        out = StringIO()
+        call_command("reap_conversations", stdout=out)
+        self.assertIn("Reaped 1 conversations", out.getvalue())
+        self.assertFalse(Conversation.all_objects.filter(id=self.chat.id).exists())
+        self.assertFalse(Message.objects.filter(conversation_id=self.chat.id).exists())
+        self.assertEqual(Message.objects.filter(conversation=self.other).count(), 7)
+
+    def test_small_chat_is_deleted_at_once(self):
+        url = reverse("chat-delete", kwargs={"conversation_id": self.chat.id})
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertFalse(Conversation.all_objects.filter(id=self.chat.id).exists())
+        self.assertFalse(Message.objects.filter(conversation_id=self.chat.id).exists())
+
+
+class BackgroundDeletionTest(TransactionTestCase):
+    """
+    Large chats are reaped by the background thread.
+    """
+
+    @override_settings(BACKGROUND_DELETE_THRESHOLD=5, DELETE_BATCH_SIZE=3)
+    def test_large_chat_is_reaped_in_background(self):
+        user = UserAccount.objects.create(email="reaper@example.com")
+        chat = Conversation.objects.create(user=user)
+        Message.objects.bulk_create(
+            Message(conversation=chat, content=str(number)) for number in range(7)
+        )
+
+        self.assertTrue(delete_conversation(chat))
+        # The pool has one thread, so this runs after the reap
+        get_executor().submit(lambda: None).result(timeout=5)
+        self.assertFalse(Conversation.all_objects.filter(id=chat.id).exists())
+        self.assertFalse(Message.objects.filter(conversation_id=chat.id).exists())
+
+
+@mock.patch("conversations.export.CURSOR_EVERY", 2)
+class ExportTest(APITestCase):
+    """
+    An export resumed from any of its cursors goes on right after it.
+    """
+
+    def setUp(self):
+        self.user = UserAccount.objects.create(email="export@example.com")
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        moment = timezone.now()
+        for number in range(3):
+            chat = Conversation.objects.create(user=self.user, title=str(number))
+            Message.objects.bulk_create(
+                Message(conversation=chat, content=f"{number}.{message}")
+                for message in range(5)
+            )
+        # Ties on createdAt are broken by id
+        Conversation.objects.update(createdAt=moment)
+        Message.objects.filter(content__in=["0.1", "0.2", "0.3", "1.2"]).update(
+            createdAt=moment
+        )
+        other = UserAccount.objects.create(email="other@example.com")
+        Conversation.objects.create(user=other)
+
+    def test_resume_from_every_cursor(self):
+        records = list(export_records(self.user.id))
+        data = [record for record in records if record["type"] != "cursor"]
+        self.assertEqual(len(data), 3 + 3 * 5)
+        self.assertEqual(len({record["id"] for record in data}), len(data))
+
+        for index, record in enumerate(records):
+            if record["type"] != "cursor":
+                continue
+            resumed = [
+                record
+                for record in export_records(self.user.id, record["cursor"])
+                if record["type"] != "cursor"
+            ]
+            expected = [
+                record for record in records[index + 1 :] if record["type"] != "cursor"
+            ]
+            self.assertEqual(resumed, expected)
+
+    def test_endpoint_resumes_from_trailing_cursor(self):
+        url = reverse("conversations-export")
+        lines = self.stream_lines(url)
+        # As if the connection dropped right after the first cursor
+        first_cursor = next(
+            number for number, line in enumerate(lines) if line["type"] == "cursor"
+        )
+        cursor = lines[first_cursor]["cursor"]
+        # It is inside the first chat, after CURSOR_EVERY messages
+        self.assertEqual(lines[first_cursor - 1]["type"], "message")
+        resumed = self.stream_lines(url, {"cursor": cursor})
+        self.assertEqual(resumed, lines[first_cursor + 1 :])
+
+    def test_invalid_cursor(self):
+        url = reverse("conversations-export")
+        response = self.client.get(url, {"cursor": "nonsense"})
+        self.assertEqual(response.status_code, 400)
+
+    def stream_lines(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+
+        async def read():
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        body = async_to_sync(read)()
+        return [json.loads(line) for line in body.splitlines()]
+
+
+class MessagesBulkCreateTest(APITestCase):
+    """
+    Bulk import keeps the order of the payload and is all or nothing.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create(email="bulk@example.com")
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.chat = Conversation.objects.create(user=self.user)
+        self.url = reverse(
+            "messages-bulk-create", kwargs={"conversation_id": self.chat.id}
+        )
+
+    def stored(self):
+        return list(
+            Message.objects.filter(conversation=self.chat)
+            .order_by("createdAt")
+            .values_list("id", "role", "content")
+        )
+
+    def test_order_is_kept(self):
+        items = [
+            {"content": str(number), "role": ("user", "assistant")[number % 2]}
+            for number in range(50)
+        ]
+        response = self.client.post(self.url, items, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["count"], 50)
+        stored = self.stored()
+        self.assertEqual(
+            [(role, content) for _, role, content in stored],
+            [(item["role"], item["content"]) for item in items],
+        )
+        self.assertEqual(response.data["ids"], [id for id, _, _ in stored])
+
+    def test_ndjson_body(self):
+        body = (
+            '{"content": "Вопрос"}\n' "\n" '{"content": "Ответ", "role": "assistant"}\n'
+        )
+        response = self.client.post(
+            self.url, body.encode(), content_type="application/x-ndjson"
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [(role, content) for _, role, content in self.stored()],
+            [("user", "Вопрос"), ("assistant", "Ответ")],
+        )
+
+    def test_bad_line_is_rejected(self):
+        body = '{"content": "Вопрос"}\n{"content": \n'
+        response = self.client.post(
+            self.url, body.encode(), content_type="application/x-ndjson"
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("line 2", response.data["detail"])
+        self.assertEqual(self.stored(), [])
+
+    def test_invalid_message_rejects_all(self):
+        items = [{"content": "Вопрос"}, {"content": "Ответ", "role": "system"}]
+        response = self.client.post(self.url, items, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stored(), [])
+
+    def test_not_a_list(self):
+        response = self.client.post(self.url, {"content": "Вопрос"}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch("conversations.views.MessagesBulkCreate.BULK_MAX_MESSAGES", 2)
+    def test_too_many_messages(self):
+        items = [{"content": str(number)} for number in range(3)]
+        response = self.client.post(self.url, items, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stored(), [])
+
+
+class MessagesListETagTest(APITransactionTestCase):
+    """
+    The messages list is revalidated with an ETag that every write changes.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create(email="etag@example.com")
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.chat = Conversation.objects.create(user=self.user)
+        Message.objects.create(conversation=self.chat, content="Hi")
+        self.url = reverse(
+            "chat-messages-list", kwargs={"conversation_id": self.chat.id}
+        )
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Last-Modified", response)
+
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again["ETag"], response["ETag"])
+
+    def test_write_changes_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        create = reverse("message-create", kwargs={"conversation_id": self.chat.id})
+        self.client.post(create, {"content": "Again"}, format="json")
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.data["messages"]), 2)
+
+    def test_config_change_changes_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        config = reverse("chat-config-update", kwargs={"conversation_id": self.chat.id})
+        self.client.patch(config, {"title": "Renamed"}, format="json")
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["title"], "Renamed")
+
+
+class FourPerMinute(SlidingWindowUserRateThrottle):
+    rate = "4/min"
+
+
+class SlidingWindowThrottleTest(SimpleTestCase):
+    """
+    Sliding window estimate at window edges, on a fake clock.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.request = mock.Mock(user=mock.Mock(pk=1, is_authenticated=True))
+        self.now = 600  # Start of a window
+
+    def allow(self, count=1):
+        results = []
+        for _ in range(count):
+            throttle = FourPerMinute()
+            throttle.timer = lambda: self.now
+            results.append(throttle.allow_request(self.request, None))
+        self.throttle = throttle
+        return results
+
+    def test_limit_within_window(self):
+        self.assertEqual(self.allow(5), [True, True, True, True, False])
+        self.assertEqual(self.throttle.wait(), 60)
+
+    def test_previous_window_counts_in_full_at_its_end(self):
+        self.allow(4)
+        self.now = 660
+        self.assertEqual(self.allow(), [False])
+        # Once a quarter of the previous window is out of range
+        self.assertEqual(self.throttle.wait(), 15)
+
+    def test_previous_window_decays(self):
+        self.allow(4)
+        self.now = 690
+        # 1 + 4 * 0.5, 2 + 4 * 0.5, 3 + 4 * 0.5
+        self.assertEqual(self.allow(3), [True, True, False])
+
+    def test_older_windows_are_forgotten(self):
+        self.allow(5)
+        self.now = 720
+        self.assertEqual(self.allow(5), [True, True, True, True, False])
+
+    def test_clients_are_counted_apart(self):
+        self.allow(5)
+        self.request = mock.Mock(user=mock.Mock(pk=2, is_authenticated=True))
+        self.assertEqual(self.allow(), [True])
+
+
+@override_settings(STREAM_RESUME_GRACE=0)
+class StreamSlotTest(TransactionTestCase):
+    """
+    `ConcurrentStreamThrottle` gives its slot back however a stream ends.
+    """
+
+    async def create_chat(self):
+        cache.clear()
+        self.user = await UserAccount.objects.acreate(email="slots@example.com")
+        self.chat = await Conversation.objects.acreate(user=self.user)
+        await Message.objects.acreate(conversation=self.chat, content="Hi")
+        self.auth = f"Bearer {AccessToken.for_user(self.user)}"
+
+    async def slots(self):
+        return await cache.aget(f"throttle_stream_{self.user.id}", 0)
+
+    async def open_stream(self, conversation_id=None):
+        url = reverse(
+            "chat-stream", kwargs={"conversation_id": conversation_id or self.chat.id}
+        )
+        return await self.async_client.get(url, headers={"Authorization": self.auth})
+
+    async def test_released_after_disconnect(self):
+        await self.create_chat()
+
+        async def endless(*args):
+            while True:
+                yield "data: {}\n\n"
+                await asyncio.sleep(0.01)
+
+        url = reverse("chat-stream", kwargs={"conversation_id": self.chat.id})
+        clients = [ASGIClient(url, self.auth) for _ in range(4)]
+        with mock.patch(
+            "conversations.views.ChatCompletionStream.send_gpt_request_async", endless
+        ):
+            tasks = []
+            # One at a time: the file cache of the tests doesn't incr atomically
+            for client in clients[:3]:
+                tasks.append(asyncio.create_task(client.get()))
+                await asyncio.wait_for(client.received.wait(), CANCEL_TIMEOUT)
+            self.assertEqual(await self.slots(), 3)
+            # Over STREAM_CONCURRENCY
+            await clients[3].get()
+            self.assertEqual(clients[3].status, 429)
+
+            for number, (client, task) in enumerate(zip(clients, tasks), 1):
+                client.disconnected.set()
+                await asyncio.wait_for(task, CANCEL_TIMEOUT)
+                self.assertEqual(await self.slots(), 3 - number)
+
+    async def test_released_after_error(self):
+        await self.create_chat()
+
+        async def failing(*args):
+            yield "data: {}\n\n"
+            raise RuntimeError("upstream 500")
+
+        with mock.patch(
+            "conversations.views.ChatCompletionStream.send_gpt_request_async", failing
+        ), self.assertLogs("conversations.broker"):
+            response = await self.open_stream()
+            with self.assertRaises(RuntimeError):
+                async for _ in response.streaming_content:
+                    pass
+        self.assertEqual(await self.slots(), 0)
+
+    async def test_released_when_history_does_not_fit(self):
+        await self.create_chat()
+        await Conversation.objects.filter(id=self.chat.id).aupdate(maxTokens=10**6)
+        response = await self.open_stream()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(await self.slots(), 0)
+
+    async def test_released_on_not_found(self):
+        await self.create_chat()
+        response = await self.open_stream(uuid.uuid4())
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(await self.slots(), 0)
+
+
+class CursorPaginationTest(APITestCase):
+    """
+    Keyset pages of messages and chats, walked both ways.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create(email="pages@example.com")
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.chat = Conversation.objects.create(user=self.user)
+        Message.objects.bulk_create(
+            Message(conversation=self.chat, content=str(number)) for number in range(4)
+        )
+        # Ties on createdAt, between pages and within them
+        moment = timezone.now()
+        Message.objects.bulk_create(
+            Message(conversation=self.chat, content=f"tie {number}", createdAt=moment)
+            for number in range(6)
+        )
+        self.url = reverse(
+            "chat-messages-page", kwargs={"conversation_id": self.chat.id}
+        )
+
+    def walk(self, url, params, link="next"):
+        """
+        Ids of every page from `url` on, following `link`, and the last page.
+        """
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([item["id"] for item in response.data["results"]])
+            if response.data[link] is None:
+                return pages, response
+            response = self.client.get(response.data[link])
+
+    def expected(self, descending):
+        ids = Message.objects.filter(conversation=self.chat).order_by(
+            *(("-createdAt", "-id") if descending else ("createdAt", "id"))
+        )
+        return [str(id) for id in ids.values_list("id", flat=True)]
+
+    def test_newest_first(self):
+        pages, _ = self.walk(self.url, {"page_size": 3})
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 1])
+        self.assertEqual(sum(pages, []), self.expected(descending=True))
+
+    def test_oldest_first(self):
+        pages, _ = self.walk(self.url, {"page_size": 3, "order": "asc"})
+        self.assertEqual(sum(pages, []), self.expected(descending=False))
+
+    def test_previous_links_walk_back(self):
+        for order in ("desc", "asc"):
+            with self.subTest(order=order):
+                pages, last = self.walk(self.url, {"page_size": 4, "order": order})
+                back, _ = self.walk(last.data["previous"], None, "previous")
+                self.assertEqual(back, pages[-2::-1])
+
+    def test_page_size_is_capped(self):
+        response = self.client.get(self.url, {"page_size": 100_000})
+        self.assertEqual(len(response.data["results"]), 10)
+
+    def test_invalid_cursor(self):
+        for cursor in ("nonsense", b64encode(b"p=nonsense").decode()):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(self.url, {"cursor": cursor})
+                self.assertEqual(response.status_code, 404)
+
+    def test_chats_with_same_update_time(self):
+        Conversation.objects.bulk_create(
+            Conversation(user=self.user, title=str(number)) for number in range(6)
+        )
+        Conversation.objects.update(updatedAt=timezone.now())
+        url = reverse("chats-list-create")
+
+        pages, last = self.walk(url, {"page_size": 2})
+        back, _ = self.walk(last.data["previous"], None, "previous")
+        self.assertEqual(back, pages[-2::-1])
+        ids = sum(pages, [])
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(
+            ids,
+            [
+                str(id)
+                for id in Conversation.objects.order_by("id").values_list(
+                    "id", flat=True
+                )
+            ],
+        )
+
+
+class ContextWindowTest(SimpleTestCase):
+    """
+    History packed into the prompt budget of a model.
+    """
+
+    def window(self, budget, prompt=""):
+        """
+        A gpt-4 window with `budget` tokens left for messages.
+        """
+        spare = ContextWindow("gpt-4", 0, prompt).budget
+        return ContextWindow("gpt-4", spare - budget, prompt)
+
+    def test_budget(self):
+        prompt = "You are a helpful assistant"
+        window = ContextWindow("gpt-4-0613", 500, prompt)
+        self.assertEqual(
+            window.budget,
+            context_window("gpt-4-0613")
+            - 500
+            - count_tokens(prompt)
+            - count_tokens(FORMAT_INSTRUCTION)
+            - 2 * MESSAGE_OVERHEAD
+            - REPLY_OVERHEAD,
+        )
+
+    def test_newest_messages_in_chronological_order(self):
+        window = self.window(3 * (10 + MESSAGE_OVERHEAD))
+        self.assertTrue(window.add("assistant", "third", 10))
+        self.assertTrue(window.add("user", "second", 10))
+        self.assertTrue(window.add("system", "first", 10))
+        self.assertFalse(window.add("user", "zeroth", 1))
+        self.assertEqual(
+            window.messages(),
+            [
+                {"role": "assistant", "content": "first"},
+                {"role": "user", "content": "second"},
+                {"role": "assistant", "content": "third"},
+            ],
+        )
+
+    def test_tokens_are_counted_when_missing(self):
+        window = self.window(100)
+        window.add("user", "Привет, как дела?")
+        self.assertEqual(
+            window.budget, 100 - count_tokens("Привет, как дела?") - MESSAGE_OVERHEAD
+        )
+
+    def test_build_context_stops_reading_history(self):
+        history = iter([("user", "new", 10), ("assistant", "old", 10)] * 3)
+        messages = build_context(history, "gpt-4", 0, "")
+        self.assertEqual(len(messages), 6)
+
+        history = iter(
+            [("user", "new", 10), ("assistant", "old", 100), ("user", "", 0)]
+        )
+        spare = ContextWindow("gpt-4", 0, "").budget
+        messages = build_context(history, "gpt-4", spare - 50, "")
+        self.assertEqual(messages, [{"role": "user", "content": "new"}])
+        # The row after the one that didn't fit is left unread
+        self.assertEqual(list(history), [("user", "", 0)])
+
+    def test_long_newest_message_is_truncated(self):
+        content = "word " * 1000
+        window = self.window(20 + MESSAGE_OVERHEAD)
+        self.assertFalse(window.add("user", content))
+        self.assertFalse(window.add("assistant", "older", 1))
+
+        [message] = window.messages()
+        self.assertEqual(message["role"], "user")
+        self.assertTrue(message["content"])
+        self.assertTrue(content.startswith(message["content"]))
+        self.assertLessEqual(count_tokens(message["content"]), 20)
+
+    def test_no_room_for_the_newest_message(self):
+        for budget in (MESSAGE_OVERHEAD, 0, -500):
+            with self.subTest(budget=budget):
+                window = self.window(budget)
+                with self.assertRaises(ContextOverflow):
+                    window.add("user", "Hi", 1)
+                with self.assertRaises(ContextOverflow):
+                    build_context([("user", "Hi", 1)], "gpt-4", 10**6, "")
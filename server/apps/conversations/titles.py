@@ -0,0 +1,121 @@
+"""
+Conversation titles.
+
+A conversation gets its title once, from the first assistant reply: right
+away the opening words of the reply, and with `TITLE_SUMMARY` enabled a short
+summary of the first exchange generated in a background thread, so the
+request never waits for the upstream.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from openai import OpenAI
+
+from conversations.cache import bump_messages_version, invalidate_chat_list
+from conversations.models import Conversation, Message
+from conversations.transport import build_http_client, build_timeout
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TITLE = Conversation._meta.get_field("title").default
+TITLE_LENGTH = 60
+
+SUMMARY_INSTRUCTION = (
+    "Write a title for this conversation, at most six words, in the language "
+    "of the conversation. Reply with the title only, no quotes."
+)
+
+_executor = None
+_client = None
+
+
+def fallback_title(content):
+    return f"{content[:24]}..."
+
+
+def assign_title(conversation, reply):
+    """
+    Title an untitled conversation after its first reply.
+
+    Only the `title` column is written, and only while it still holds the
+    default, so concurrent replies and renames by the user win. Returns the
+    new title, or None if the conversation already had one.
+    """
+    if conversation.title != DEFAULT_TITLE:
+        return None
+
+    title = fallback_title(reply)
+    untitled = Conversation.objects.filter(id=conversation.id, title=DEFAULT_TITLE)
+    if not untitled.update(title=title):
+        return None
+
+    conversation.title = title
+    user_id = conversation.user_id
+    conversation_id = conversation.id
+    transaction.on_commit(lambda: invalidate_chat_list(user_id))
+    transaction.on_commit(lambda: bump_messages_version(conversation_id))
+    if settings.TITLE_SUMMARY:
+        transaction.on_commit(
+            lambda: get_executor().submit(
+                summarize, conversation_id, user_id, title, reply
+            )
+        )
+    return title
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.TITLE_WORKERS, thread_name_prefix="titles"
+        )
+    return _executor
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = OpenAI(
+            api_key=settings.APIKEY,
+            base_url=settings.OPENAI_BASE_URL,
+            max_retries=1,
+            timeout=build_timeout(),
+            http_client=build_http_client(),
+        )
+    return _client
+
+
+def summarize(conversation_id, user_id, title, reply):
+    """
+    Replace the fallback `title` with a summary of the first exchange.
+    Runs in the title worker pool.
+    """
+    try:
+        question = (
+            Message.objects.filter(conversation_id=conversation_id, role="user")
+            .order_by("createdAt")
+            .values_list("content", flat=True)
+            .first()
+        )
+        response = get_client().chat.completions.create(
+            model=settings.TITLE_MODEL,
+            temperature=0.3,
+            max_tokens=24,
+            messages=[
+                {"role": "system", "content": SUMMARY_INSTRUCTION},
+                {"role": "user", "content": question or ""},
+                {"role": "assistant", "content": reply},
+            ],
+        )
+        summary = (response.choices[0].message.content or "").strip().strip("\"'«»")
+        if summary and Conversation.objects.filter(
+            id=conversation_id, title=title
+        ).update(title=summary[:TITLE_LENGTH]):
+            invalidate_chat_list(user_id)
+            bump_messages_version(conversation_id)
+    except Exception:
+        logger.exception("Title summary failed for conversation %s", conversation_id)
+    finally:
+        close_old_connections()
@@ -0,0 +1,124 @@
+import asyncio
+import random
+
+import httpx
+from django.conf import settings
+
+
+class RetryTransport(httpx.AsyncHTTPTransport):
+    """
+    Async transport that retries requests which failed to connect.
+
+    Only connection errors are retried: the request never reached the upstream,
+    so repeating it can't double a completion. Delays use exponential backoff
+    with full jitter to avoid synchronized reconnect storms through the proxy.
+    """
+
+    def __init__(self, connect_retries=3, backoff=0.25, **kwargs):
+        super().__init__(**kwargs)
+        self.connect_retries = connect_retries
+        self.backoff = backoff
+
+    async def handle_async_request(self, request):
+        attempt = 0
+        while True:
+            try:
+                return await super().handle_async_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if attempt >= self.connect_retries:
+                    raise
+                await asyncio.sleep(random.uniform(0, self.backoff * 2**attempt))
+                attempt += 1
+
+
+def build_timeout():
+    config = settings.OPENAI_HTTP
+    return httpx.Timeout(
+        connect=config["CONNECT_TIMEOUT"],
+        read=config["READ_TIMEOUT"],
+        write=config["WRITE_TIMEOUT"],
+        pool=config["POOL_TIMEOUT"],
+    )
+
+
+def build_limits():
+    config = settings.OPENAI_HTTP
+    return httpx.Limits(
+        max_connections=config["MAX_CONNECTIONS"],
+        max_keepalive_connections=config["MAX_KEEPALIVE_CONNECTIONS"],
+        keepalive_expiry=config["KEEPALIVE_EXPIRY"],
+    )
+
+
+def build_proxy():
+    """
+    `proxy` argument of the httpx transports, empty without `PROXY_URL`.
+    """
+    return {"proxy": settings.PROXY_URL} if settings.PROXY_URL else {}
+
+
+def build_transport():
+    config = settings.OPENAI_HTTP
+    return RetryTransport(
+        connect_retries=config["CONNECT_RETRIES"],
+        backoff=config["RETRY_BACKOFF"],
+        http2=config["HTTP2"],
+        limits=build_limits(),
+        **build_proxy(),
+    )
+
+
+def build_async_http_client(transport=None):
+    """
+    Shared httpx client for the upstream API built from `OPENAI_HTTP` settings.
+    """
+    return httpx.AsyncClient(
+        transport=transport or build_transport(),
+        timeout=build_timeout(),
+    )
+
+
+def build_http_client():
+    """
+    Blocking counterpart of `build_async_http_client` for worker threads.
+    """
+    config = settings.OPENAI_HTTP
+    return httpx.Client(
+        transport=httpx.HTTPTransport(
+            retries=config["CONNECT_RETRIES"],
+            http2=config["HTTP2"],
+            limits=build_limits(),
+            **build_proxy(),
+        ),
+        timeout=build_timeout(),
+    )
+
+
+def pool_stats(transport):
+    """
+    Connection pool usage of a transport: open, idle and busy connections
+    and requests waiting for a free connection.
+
+    Read from httpcore internals; the values it no longer exposes are None.
+    """
+    stats = {
+        "connections": None,
+        "idle": None,
+        "active": None,
+        "waiting": None,
+        "max_connections": settings.OPENAI_HTTP["MAX_CONNECTIONS"],
+    }
+    try:
+        pool = transport._pool
+        connections = list(pool.connections)
+        idle = sum(1 for connection in connections if connection.is_idle())
+    except (AttributeError, TypeError):
+        return stats
+    stats.update(
+        connections=len(connections), idle=idle, active=len(connections) - idle
+    )
+    try:
+        stats["waiting"] = sum(1 for request in pool._requests if request.is_queued())
+    except (AttributeError, TypeError):
+        pass
+    return stats
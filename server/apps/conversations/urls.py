@@ -5,14 +5,20 @@ from conversations.views.ChatConfigUpdate import ChatConfigUpdate
 from conversations.views.ChatDelete import ChatDelete
 from conversations.views.ChatListCreate import ChatListCreate
 from conversations.views.ChatMessagesDelete import DeleteMessagesInChatView
+from conversations.views.ConversationsExport import ConversationsExport
 from conversations.views.MessageCreate import MessageCreate
 from conversations.views.MessageDelete import MessageDelete
+from conversations.views.MessagesBulkCreate import MessagesBulkCreate
 from conversations.views.MessagesList import MessagesList
+from conversations.views.MessagesPage import MessagesPage
 
 urlpatterns = [
     # Create and list chats
     path("", ChatListCreate.as_view(), name="chats-list-create"),
 
+    # Export all chats with messages as NDJSON
+    path("export/", ConversationsExport.as_view(), name="conversations-export"),
+
     # Retrieve, update conversation
     path(
         "<uuid:conversation_id>/config/",
@@ -38,6 +44,13 @@ urlpatterns = [
         name="chat-messages-list",
     ),
 
+    # Page through messages in a current chat
+    path(
+        "<uuid:conversation_id>/messages/",
+        MessagesPage.as_view(),
+        name="chat-messages-page",
+    ),
+
     # Create a message in a conversation
     path(
         "<uuid:conversation_id>/messages/create/",
@@ -45,6 +58,13 @@ urlpatterns = [
         name="message-create",
     ),
 
+    # Append many messages to a conversation
+    path(
+        "<uuid:conversation_id>/messages/bulk/",
+        MessagesBulkCreate.as_view(),
+        name="messages-bulk-create",
+    ),
+
     # Delete a message in a current chat
     path(
         "<uuid:conversation_id>/<uuid:message_id>/delete/",
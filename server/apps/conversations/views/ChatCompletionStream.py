@@ -1,13 +1,51 @@
-from django.http import StreamingHttpResponse
-from django.shortcuts import get_object_or_404
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.renderers import BaseRenderer
-from rest_framework.views import APIView
+from rest_framework.settings import api_settings
 
+from conversations.broker import generation_key, get_broker
+from conversations.context import ContextOverflow, ContextWindow
 from conversations.models import Conversation, Message
+from conversations.sse import heartbeat, with_id
 from conversations.tasks import send_gpt_request_async
+from conversations.views.AsyncAPIView import AsyncAPIView
+from src.throttling import ConcurrentStreamThrottle, release_stream_slot
+
+HISTORY_PAGE_SIZE = 100
+
+
+async def load_context(conversation):
+    """
+    Newest messages of a conversation that fit into its model's context window,
+    and the id of the newest one.
+    """
+    window = ContextWindow(
+        conversation.model, conversation.maxTokens, conversation.prompt
+    )
+    history = (
+        Message.objects.filter(conversation=conversation)
+        .order_by("-createdAt")
+        .values_list("id", "role", "content", "tokens")
+    )
+    last_message_id = None
+    offset = 0
+    while True:
+        page = [
+            row async for row in history[offset : offset + HISTORY_PAGE_SIZE]
+        ]
+        if page and last_message_id is None:
+            last_message_id = page[0][0]
+        for _, role, content, tokens in page:
+            if not window.add(role, content, tokens):
+                return window.messages(), last_message_id
+        if len(page) < HISTORY_PAGE_SIZE:
+            return window.messages(), last_message_id
+        offset += HISTORY_PAGE_SIZE
 
 
 class ServerSentEventRenderer(BaseRenderer):
@@ -18,13 +56,26 @@ class ServerSentEventRenderer(BaseRenderer):
         return data
 
 
-class ChatCompletionStream(APIView):
+class ChatCompletionStream(AsyncAPIView):
     """
     Send a request to OpenAI API.
     """
 
     permission_classes = [IsAuthenticated]
     renderer_classes = [ServerSentEventRenderer]
+    # Only the user id is needed, skip the user lookup
+    jwt_claims_only = True
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES + [
+        ConcurrentStreamThrottle
+    ]
+
+    def check_throttles(self, request):
+        # Another throttle may reject the request after a stream slot was taken
+        try:
+            super().check_throttles(request)
+        except Exception:
+            release_stream_slot(request)
+            raise
 
     @swagger_auto_schema(
         tags=["GPT API"],
@@ -39,32 +90,67 @@ class ChatCompletionStream(APIView):
             ),
         ],
     )
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
         """
         ### ПОЛУЧЕНИЕ ОТВЕТА ОТ GPT API.
-        Берет 5 последних сообщений из чата и отправляет запрос на получение ответа от GPT API.
+        Берет последние сообщения из чата, сколько помещается в контекст модели
+        (за вычетом `maxTokens` и системного промпта), и отправляет запрос
+        на получение ответа от GPT API. Последнее сообщение отправляется всегда,
+        если нужно - обрезанным; если `maxTokens` и системный промпт не оставляют
+        места даже для него, возвращается `400`.
         Предвартительно текст запроса необходимо сохранить как сообщение в текущий чат
         `POST /conversations/{conversation_id}/messages/create/` (`role` = 'user')
-        Полученный ответ возвращается в виде потока.
-        Далее, после манипуляций с ответом на фронтэнде, необходимо сохранить его
-        как сообщение в текущий чат. (`role` = 'assistant')
+        Если лимит одновременных запросов или токенов в минуту для модели
+        исчерпан, запрос ждет в очереди (очередь общая для всех пользователей,
+        но запросы разных пользователей чередуются), пока ждет - приходят
+        события `queue`: `{"position": <номер в очереди>}`.
+        Полученный ответ возвращается в виде потока. Части ответа, пришедшие
+        почти одновременно, объединяются в одно событие; пока GPT API молчит,
+        раз в 15 секунд приходит комментарий `: ping`.
+        После получения `finish_reason` ответ сохраняется в текущий чат
+        (`role` = 'assistant'), id сохраненного сообщения приходит последним
+        событием `saved`: `{"id": "<uuid>"}`.
+        Повторно сохранять ответ через `messages/create/` не нужно.
+        Повторный запрос (двойной клик, переподключение), пока ответ еще
+        генерируется, не создает нового запроса к GPT API: он получает уже
+        отправленные части ответа и продолжает получать новые.
+        У каждого события есть `id`. Переподключившись с заголовком
+        `Last-Event-ID` (EventSource делает это сам), клиент получает только
+        пропущенные события и продолжение ответа. Если ответ уже недоступен
+        (прошло больше `STREAM_REPLAY_TTL` секунд), возвращается `204`,
+        сохраненный ответ есть в сообщениях чата.
+        Когда отключается последний клиент, ожидающий ответ, и никто
+        не переподключается в течение `STREAM_RESUME_GRACE` секунд, запрос
+        к GPT API прерывается, а уже полученная часть ответа сохраняется
+        в текущий чат (`role` = 'assistant').
         """
 
-        conversation = get_object_or_404(
-            Conversation, id=self.kwargs["conversation_id"], user=self.request.user
-        )
-
-        messages = Message.objects.filter(conversation=conversation).order_by(
-            "-createdAt"
-        )[:5][::-1]
+        try:
+            conversation = await Conversation.objects.aget(
+                id=self.kwargs["conversation_id"], user_id=self.request.user.id
+            )
+            last_event_id = request.headers.get("Last-Event-ID")
+            if last_event_id is None:
+                try:
+                    message_list, last_message_id = await load_context(conversation)
+                except ContextOverflow as exc:
+                    raise ValidationError({"maxTokens": [str(exc)]})
+            # Don't hold a database connection (or a pool slot) while relaying
+            # tokens, the reply is saved on a fresh one
+            await sync_to_async(connections.close_all)()
+        except BaseException as exc:
+            await sync_to_async(release_stream_slot)(request)
+            if isinstance(exc, Conversation.DoesNotExist):
+                raise Http404
+            raise
 
-        message_list = []
-        for msg in messages:
-            if msg.role == "user":
-                message_list.append({"role": "user", "content": msg.content})
-            else:
-                message_list.append(
-                    {"role": "assistant", "content": msg.content})
+        if last_event_id is not None:
+            events = await get_broker().resume(last_event_id, conversation.id)
+            if events is None:
+                # Nothing to resume; a 204 also stops EventSource reconnecting
+                await sync_to_async(release_stream_slot)(request)
+                return HttpResponse(status=204)
+            return self.event_stream(request, events)
 
         # Build config for GPT from Conversation fields
         conversation_fields = [
@@ -79,11 +165,24 @@ class ChatCompletionStream(APIView):
         config = {field: getattr(conversation, field)
                   for field in conversation_fields}
 
+        # Identical requests in flight share one upstream generation
+        key = generation_key(conversation.id, last_message_id, config)
+        events = get_broker().subscribe(
+            key, lambda: send_gpt_request_async(message_list, config, conversation)
+        )
+        return self.event_stream(request, events)
+
+    def event_stream(self, request, events):
         response = StreamingHttpResponse(
-            send_gpt_request_async(message_list, config),
-            content_type="text/event-stream",
+            self.stream(request, events), content_type="text/event-stream"
         )
         response["X-Accel-Buffering"] = "no"
         response["Cache-Control"] = "no-cache"
-
         return response
+
+    async def stream(self, request, events):
+        try:
+            async for frame in heartbeat(with_id(events)):
+                yield frame
+        finally:
+            await sync_to_async(release_stream_slot)(request)
@@ -7,6 +7,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from conversations.deletion import delete_conversation
 from conversations.models import Conversation
 
 User = get_user_model()
@@ -33,6 +34,7 @@ class ChatDelete(APIView):
             ),
         ],
         responses={
+            202: "ACCEPTED",
             204: "NO CONTENT",
             400: "BAD REQUEST",
             403: "FORBIDDEN",
@@ -42,9 +44,12 @@ class ChatDelete(APIView):
     def delete(self, request, conversation_id):
         """
         ### Удаление конкретного чата аутентифицированного пользователя.
+        Чат сразу пропадает из списка. Большие чаты удаляются в фоне,
+        тогда ответ - `202`.
         """
         conversation = get_object_or_404(
             Conversation, id=conversation_id, user=request.user
         )
-        conversation.delete()
+        if delete_conversation(conversation):
+            return Response(status=status.HTTP_202_ACCEPTED)
         return Response(status=status.HTTP_204_NO_CONTENT)
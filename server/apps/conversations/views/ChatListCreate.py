@@ -5,7 +5,9 @@ from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from conversations.cache import get_chat_list, set_chat_list
 from conversations.models import Conversation
+from conversations.pagination import ConversationCursorPagination
 from conversations.serializers import ConversationListSerializer, ConversationSerializer
 
 User = get_user_model()
@@ -18,6 +20,7 @@ class ChatListCreate(generics.ListCreateAPIView):
     """
 
     serializer_class = ConversationSerializer
+    pagination_class = ConversationCursorPagination
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -39,21 +42,48 @@ class ChatListCreate(generics.ListCreateAPIView):
     )
     def get(self, request, *args, **kwargs):
         """
-        ### Получает список всех чатов, созданных аутентифицированным пользователем,
-        расположенные по дате обновления, от новых к старым.
+        ### Получает список чатов, созданных аутентифицированным пользователем,
+        расположенные по дате обновления, от новых к старым, постранично.
 
-        Значения:
+        Структура ответа:
+        - `next`: ссылка на следующую страницу (`null`, если это последняя), \n
+        - `previous`: ссылка на предыдущую страницу,
+        - `results`: [список чатов]
+
+        Значения для results:
         - `id`: id чата в формате uuid, \n
         - `title`: Заголовок чата,
         - `createdAt`: Дата создания,
         - `updatedAt`: Дата обновления
+
+        Параметры:
+        - `cursor`: курсор из `next` / `previous`, \n
+        - `page_size`: размер страницы (по умолчанию 30, максимум 200)
         """
         return self.list(request, *args, **kwargs)
 
-    def list(self, request):
-        queryset = self.get_queryset()
-        serializer = ConversationListSerializer(queryset, many=True)
-        return Response(serializer.data)
+    def list(self, request, *args, **kwargs):
+        # The first page is what every sidebar refresh asks for
+        first_page = not (
+            request.query_params.get(self.paginator.cursor_query_param)
+            or request.query_params.get(self.paginator.page_size_query_param)
+        )
+        if first_page:
+            data = get_chat_list(request.user.id)
+            if data is not None:
+                return Response(data)
+
+        # values() skips loading the large `prompt` column
+        queryset = self.get_queryset().values(
+            *ConversationListSerializer.Meta.fields
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = ConversationListSerializer(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+
+        if first_page:
+            set_chat_list(request.user.id, response.data)
+        return response
 
     @swagger_auto_schema(
         tags=["Conversations"],
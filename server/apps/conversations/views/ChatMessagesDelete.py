@@ -1,11 +1,14 @@
 from django.contrib.auth import get_user_model
+from django.shortcuts import get_object_or_404
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from conversations.models import Message
+from conversations.cache import bump_messages_version
+from conversations.deletion import delete_messages
+from conversations.models import Conversation, Message
 from conversations.serializers import MessageSerializer
 
 User = get_user_model()
@@ -35,6 +38,9 @@ class DeleteMessagesInChatView(generics.DestroyAPIView):
         """
         ### Удаление всех сообщений из чата аутентифицированного пользователя.
         """
-        conversation_id = self.kwargs["conversation_id"]
-        Message.objects.filter(conversation_id=conversation_id).delete()
+        conversation = get_object_or_404(
+            Conversation, id=self.kwargs["conversation_id"], user=request.user
+        )
+        delete_messages(conversation.id)
+        bump_messages_version(conversation.id)
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,63 @@
+from django.http import StreamingHttpResponse
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+
+from conversations.export import aiterate, blocks, export_lines, gzip_stream
+
+
+class ConversationsExport(APIView):
+    """
+    Export all chats of the user with their messages.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        tags=["Conversations"],
+        operation_id="conversations_export",
+        operation_summary="Выгрузка всех чатов и сообщений (NDJSON).",
+        manual_parameters=[
+            openapi.Parameter(
+                "cursor",
+                openapi.IN_QUERY,
+                description="Продолжить выгрузку после записи `cursor`.",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "compression",
+                openapi.IN_QUERY,
+                description="`gzip` - выгрузить в сжатом виде.",
+                type=openapi.TYPE_STRING,
+                enum=["gzip"],
+            ),
+        ],
+        responses={200: "NDJSON"},
+    )
+    def get(self, request, *args, **kwargs):
+        """
+        ### Выгрузка всех чатов аутентифицированного пользователя в формате NDJSON.
+        Каждая строка - JSON-объект с полем `type`:
+        - `conversation`: чат со всеми настройками, \n
+        - `message`: сообщение чата (после своего чата, от старых к новым),
+        - `cursor`: позиция выгрузки; запрос с `?cursor=<значение>` продолжает
+          выгрузку сразу после нее (например, после обрыва соединения).
+
+        Ответ передается потоком, объем истории не ограничен.
+        """
+
+        lines = export_lines(request.user.id, request.query_params.get("cursor"))
+        chunks = blocks(lines)
+        filename = "conversations.ndjson"
+        if request.query_params.get("compression") == "gzip":
+            chunks = gzip_stream(chunks)
+            content_type = "application/gzip"
+            filename += ".gz"
+        else:
+            content_type = "application/x-ndjson"
+
+        response = StreamingHttpResponse(aiterate(chunks), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        response["X-Accel-Buffering"] = "no"
+        return response
@@ -1,4 +1,6 @@
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
@@ -6,8 +8,10 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from conversations.cache import invalidate_chat_list
 from conversations.models import Conversation
 from conversations.serializers import MessageSerializer
+from conversations.titles import assign_title
 
 
 class MessageCreate(APIView):
@@ -51,10 +55,18 @@ class MessageCreate(APIView):
         serializer = MessageSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        if request.data['role'] == 'assistant':
-            conversation.title = f"{request.data['content'][:24]}..."
-            conversation.save()
+        if serializer.validated_data.get("role") != "assistant":
+            serializer.save(conversation=conversation)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        serializer.save(conversation=conversation)
+        # A reply moves the chat up the sidebar, as in save_assistant_reply()
+        with transaction.atomic():
+            serializer.save(conversation=conversation)
+            Conversation.objects.filter(id=conversation.id).update(
+                updatedAt=timezone.now()
+            )
+            assign_title(conversation, serializer.validated_data["content"])
+            user_id = conversation.user_id
+            transaction.on_commit(lambda: invalidate_chat_list(user_id))
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
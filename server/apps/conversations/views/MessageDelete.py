@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
@@ -7,6 +8,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from conversations.cache import bump_messages_version
 from conversations.models import Conversation, Message
 
 User = get_user_model()
@@ -48,6 +50,8 @@ class MessageDelete(APIView):
             message = get_object_or_404(
                 Message,
                 id=message_id,
+                conversation=conversation,
             )
             message.delete()
+            transaction.on_commit(lambda: bump_messages_version(conversation.id))
         return Response(status=status.HTTP_204_NO_CONTENT)
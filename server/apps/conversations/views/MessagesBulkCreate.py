@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import serializers, status
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from conversations.cache import bump_messages_version, invalidate_chat_list
+from conversations.context import count_tokens
+from conversations.models import Conversation, Message
+from conversations.parsers import NDJSONParser
+from conversations.serializers import MessageSerializer
+from conversations.titles import assign_title
+
+BULK_MAX_MESSAGES = 10_000
+BULK_BATCH_SIZE = 1000
+
+
+class MessagesBulkCreate(APIView):
+    """
+    Append many messages to a chat at once.
+    """
+
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, NDJSONParser]
+
+    @swagger_auto_schema(
+        tags=["Conversation messages"],
+        request_body=MessageSerializer(many=True),
+        responses={
+            201: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "count": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "ids": openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(type=openapi.TYPE_STRING),
+                    ),
+                },
+            ),
+        },
+        operation_id="chat_messages_bulk_create",
+        operation_summary="Добавить несколько сообщений в текущий чат.",
+        manual_parameters=[
+            openapi.Parameter(
+                "conversation_id",
+                openapi.IN_PATH,
+                description="ID чата в котором работаем.",
+                type=openapi.TYPE_STRING,
+            ),
+        ],
+    )
+    def post(self, request, *args, **kwargs):
+        """
+        ### Добавить несколько сообщений в текущий чат (импорт, восстановление).
+
+        Тело запроса - JSON-массив (`application/json`) или по одному объекту
+        на строку (`application/x-ndjson`), не более 10000 сообщений.
+        Поля сообщения:
+        - `content`: текст сообщения, \n
+        - `role`: исполнитель сообщения (`user` или `assistant`)
+
+        Сообщения сохраняются в переданном порядке, все или ни одного.
+        Возвращает `count` и `ids` созданных сообщений в том же порядке.
+        """
+
+        conversation = get_object_or_404(
+            Conversation, id=self.kwargs["conversation_id"], user=self.request.user
+        )
+
+        if not isinstance(request.data, list):
+            raise serializers.ValidationError("Expected a list of messages.")
+        if len(request.data) > BULK_MAX_MESSAGES:
+            raise serializers.ValidationError(
+                f"Too many messages, the limit is {BULK_MAX_MESSAGES}."
+            )
+
+        serializer = MessageSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        # Strictly increasing timestamps keep the order of the payload
+        now = timezone.now()
+        messages = [
+            Message(
+                conversation=conversation,
+                content=item["content"],
+                role=item.get("role", "user"),
+                tokens=count_tokens(item["content"]),
+                createdAt=now + timedelta(microseconds=number),
+            )
+            for number, item in enumerate(serializer.validated_data)
+        ]
+
+        with transaction.atomic():
+            Message.objects.bulk_create(messages, batch_size=BULK_BATCH_SIZE)
+            Conversation.objects.filter(id=conversation.id).update(
+                updatedAt=timezone.now()
+            )
+            first_reply = next(
+                (message for message in messages if message.role == "assistant"), None
+            )
+            if first_reply is not None:
+                assign_title(conversation, first_reply.content)
+            user_id = conversation.user_id
+            transaction.on_commit(lambda: invalidate_chat_list(user_id))
+            transaction.on_commit(lambda: bump_messages_version(conversation.id))
+
+        return Response(
+            {"count": len(messages), "ids": [message.id for message in messages]},
+            status=status.HTTP_201_CREATED,
+        )
@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
+from django.http import Http404
+from django.utils.cache import get_conditional_response
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
@@ -7,6 +8,8 @@ from rest_framework.generics import RetrieveAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from conversations.cache import get_messages, get_messages_version, set_messages
+from conversations.mappers import conversation_mapper, message_mapper
 from conversations.models import Conversation, Message
 from conversations.serializers import ConversationSerializer
 
@@ -61,29 +64,45 @@ class MessagesList(RetrieveAPIView):
         - `content`: текст запроса / ответа,
         - `role`: источник сообщения (пользователь или бот),
         - `createdAt`: время создания сообщения в формате ISO 8601
+
+        Ответ кэшируется до следующего изменения чата. Заголовок `ETag`
+        позволяет повторять запрос с `If-None-Match` и получать
+        `304 Not Modified` без тела.
         """
 
-        chat = get_object_or_404(
-            Conversation, id=self.kwargs["conversation_id"], user=self.request.user
-        )
-        messages = Message.objects.filter(
-            conversation=chat).order_by("createdAt")
+        conversation_id = self.kwargs["conversation_id"]
+        version = get_messages_version(conversation_id)
+        payload = get_messages(conversation_id, version)
+        if payload is None:
+            payload = self.render_payload(conversation_id, version)
+            set_messages(conversation_id, version, payload)
+        elif payload["user_id"] != request.user.id:
+            raise Http404
 
-        serializer = self.get_serializer(
-            {
-                "id": chat.id,
-                "title": chat.title,
-                "model": chat.model,
-                "prompt": chat.prompt,
-                "maxTokens": chat.maxTokens,
-                "temperature": chat.temperature,
-                "topP": chat.topP,
-                "frequencyPenalty": chat.frequencyPenalty,
-                "presencePenalty": chat.presencePenalty,
-                "createdAt": chat.createdAt,
-                "updatedAt": chat.updatedAt,
-                "messages": messages,
-            }
+        # No Last-Modified: it has whole seconds, and two changes within one
+        # would get the same date, so If-Modified-Since would miss the second
+        etag = f'"{version}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(payload["data"], status=status.HTTP_200_OK)
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+    def render_payload(self, conversation_id, version):
+        chat = (
+            Conversation.objects.filter(id=conversation_id, user=self.request.user)
+            .values_list(*conversation_mapper.columns, named=True)
+            .first()
+        )
+        if chat is None:
+            raise Http404
+        messages = (
+            Message.objects.filter(conversation_id=conversation_id)
+            .order_by("createdAt")
+            .values_list(*message_mapper.columns)
         )
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        data = conversation_mapper(chat)
+        data["messages"] = message_mapper.map(messages)
+        return {"user_id": self.request.user.id, "data": data}
@@ -0,0 +1,71 @@
+from django.shortcuts import get_object_or_404
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import generics
+from rest_framework.permissions import IsAuthenticated
+
+from conversations.mappers import message_mapper
+from conversations.models import Conversation, Message
+from conversations.pagination import MessageCursorPagination
+from conversations.serializers import MessageSerializer
+
+
+class MessagesPage(generics.ListAPIView):
+    """
+    Page through messages in a current chat.
+    """
+
+    serializer_class = MessageSerializer
+    pagination_class = MessageCursorPagination
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        conversation = get_object_or_404(
+            Conversation, id=self.kwargs["conversation_id"], user=self.request.user
+        )
+        return Message.objects.filter(conversation=conversation).values_list(
+            *message_mapper.columns, named=True
+        )
+
+    @swagger_auto_schema(
+        tags=["Conversation messages"],
+        operation_id="chat_messages_page",
+        operation_summary="Постраничный список сообщений в выбранном чате.",
+        manual_parameters=[
+            openapi.Parameter(
+                "conversation_id",
+                openapi.IN_PATH,
+                description="ID чата из которого получаем сообщения.",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "order",
+                openapi.IN_QUERY,
+                description="`desc` - от новых к старым (по умолчанию), "
+                "`asc` - от старых к новым.",
+                type=openapi.TYPE_STRING,
+                enum=["desc", "asc"],
+            ),
+        ],
+    )
+    def get(self, request, *args, **kwargs):
+        """
+        ### Получает страницу сообщений из беседы аутентифицированного пользователя.
+        Время ответа не зависит от длины истории: страницы выбираются по курсору,
+        а не по смещению.
+
+        Структура ответа:
+        - `next`: ссылка на следующую страницу (`null`, если это последняя), \n
+        - `previous`: ссылка на предыдущую страницу,
+        - `results`: [список сообщений]
+
+        Параметры:
+        - `cursor`: непрозрачный курсор из `next` / `previous`, \n
+        - `page_size`: размер страницы (по умолчанию 50, максимум 500),
+        - `order`: `desc` или `asc`
+        """
+        return self.list(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        return self.get_paginated_response(message_mapper.map(page))
@@ -0,0 +1,98 @@
+import gzip
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+from django.utils.http import parse_etags
+
+from prompts.models import SystemPrompt
+from prompts.serializers import SystemPromptListSerializer, SystemPromptSerializer
+from src.renderers import FastJSONRenderer
+
+CATALOGUE_VERSION_KEY = "prompts:version"
+CATALOGUE_TIMEOUT = 60 * 60 * 24
+
+SERIALIZERS = {
+    "full": SystemPromptSerializer,
+    "lite": SystemPromptListSerializer,
+}
+
+# Rendered catalogues of the current version in this process, by mode
+_local = {"version": None, "catalogues": {}}
+
+
+class Catalogue:
+    """
+    Rendered prompt list: the JSON body as DRF would render it, its gzip
+    compressed copy and a strong ETag per encoding.
+    """
+
+    def __init__(self, body, compressed):
+        self.body = body
+        self.compressed = compressed
+        self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        self.gzip_etag = self.etag[:-1] + '-gzip"'
+        self._items = None
+
+    @classmethod
+    def render(cls, mode):
+        prompts = SystemPrompt.objects.order_by("id")
+        data = SERIALIZERS[mode](prompts, many=True).data
+        body = FastJSONRenderer().render(data)
+        return cls(body, gzip.compress(body, compresslevel=9, mtime=0))
+
+    def matches(self, if_none_match):
+        """
+        Whether an `If-None-Match` header names this catalogue (either encoding).
+        """
+        etags = [etag.removeprefix("W/") for etag in parse_etags(if_none_match)]
+        return "*" in etags or self.etag in etags or self.gzip_etag in etags
+
+    def items(self):
+        """
+        Prompts by id, parsed from the body on first use.
+        """
+        if self._items is None:
+            self._items = {item["id"]: item for item in json.loads(self.body)}
+        return self._items
+
+
+def catalogue_version():
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOGUE_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(CATALOGUE_VERSION_KEY)
+    return version
+
+
+def bump_catalogue_version():
+    """
+    Invalidate the catalogue in every worker: cached copies are keyed by version.
+    """
+    cache.set(CATALOGUE_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def get_catalogue(mode="full"):
+    """
+    Current catalogue: from process memory, the shared cache or the database.
+    """
+    version = catalogue_version()
+    if _local["version"] != version:
+        _local["version"] = version
+        _local["catalogues"] = {}
+
+    catalogue = _local["catalogues"].get(mode)
+    if catalogue is not None:
+        return catalogue
+
+    key = f"prompts:catalogue:{version}:{mode}"
+    cached = cache.get(key)
+    if cached is not None:
+        catalogue = Catalogue(*cached)
+    else:
+        catalogue = Catalogue.render(mode)
+        cache.set(key, (catalogue.body, catalogue.compressed), CATALOGUE_TIMEOUT)
+
+    _local["catalogues"][mode] = catalogue
+    return catalogue
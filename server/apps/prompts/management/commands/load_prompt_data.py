@@ -2,31 +2,98 @@ import json
 from pathlib import Path
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
+from prompts.cache import bump_catalogue_version
 from prompts.models import SystemPrompt
 
 current_dir = Path(__file__).resolve().parent
 system_prompts_data_file = current_dir / "system_prompts_data.json"
 
+SYNCED_FIELDS = ("description", "prompt")
+
 
 class Command(BaseCommand):
-    help = "Load common data from JSON file"
+    help = (
+        "Sync system prompts with a JSON file: create new titles, update changed "
+        "descriptions and texts, optionally delete prompts missing from the file"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", default=system_prompts_data_file)
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Delete prompts whose title is not in the file",
+        )
+        parser.add_argument("--batch-size", type=int, default=100)
 
     def handle(self, *args, **options):
-        with open(system_prompts_data_file, "r") as file:
+        # Read whole: the catalogue is small, and the sync needs every title
+        with open(options["file"], "r") as file:
             data = json.load(file)
 
-        for item in data:
-            prompt, created = SystemPrompt.objects.get_or_create(
-                title=item["title"],
-                defaults={"description": item["description"], "prompt": item["prompt"]},
+        # Title is the natural key, the last entry wins on duplicates
+        items = {item["title"]: item for item in data}
+        batch_size = options["batch_size"]
+
+        with transaction.atomic():
+            existing = {
+                prompt.title: prompt
+                for prompt in SystemPrompt.objects.only("id", "title", *SYNCED_FIELDS)
+            }
+
+            to_create = []
+            to_update = []
+            for title, item in items.items():
+                prompt = existing.get(title)
+                if prompt is None:
+                    to_create.append(
+                        SystemPrompt(
+                            title=title,
+                            description=item["description"],
+                            prompt=item["prompt"],
+                        )
+                    )
+                    continue
+                changed = False
+                for field in SYNCED_FIELDS:
+                    if getattr(prompt, field) != item[field]:
+                        setattr(prompt, field, item[field])
+                        changed = True
+                if changed:
+                    to_update.append(prompt)
+
+            SystemPrompt.objects.bulk_create(to_create, batch_size=batch_size)
+            SystemPrompt.objects.bulk_update(
+                to_update, SYNCED_FIELDS, batch_size=batch_size
             )
 
-            if created:
-                self.stdout.write(
-                    self.style.SUCCESS(f"Created System Prompt: {prompt.title}")
-                )
-            else:
-                self.stdout.write(
-                    self.style.SUCCESS(f"System Prompt already exists: {prompt.title}")
-                )
+            stale = [
+                prompt.id for title, prompt in existing.items() if title not in items
+            ]
+            deleted = 0
+            if options["prune"] and stale:
+                deleted, _ = SystemPrompt.objects.filter(id__in=stale).delete()
+
+            # Bulk operations don't send model signals
+            if to_create or to_update or deleted:
+                transaction.on_commit(bump_catalogue_version)
+
+        if options["verbosity"] > 1:
+            for prompt in to_create:
+                self.stdout.write(f"Created System Prompt: {prompt.title}")
+            for prompt in to_update:
+                self.stdout.write(f"Updated System Prompt: {prompt.title}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"System prompts: {len(to_create)} created, {len(to_update)} updated, "
+                f"{deleted} deleted, {len(existing) - len(to_update) - len(stale)} "
+                "unchanged"
+            )
+        )
+        if stale and not options["prune"]:
+            self.stdout.write(
+                f"{len(stale)} prompts are not in the file, use --prune to delete them"
+            )
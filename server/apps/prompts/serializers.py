@@ -8,3 +8,14 @@ class SystemPromptSerializer(serializers.ModelSerializer):
         model = SystemPrompt
         fields = ("id", "title", "description", "prompt")
         read_only_fields = ("id", "title", "description", "prompt")
+
+
+class SystemPromptListSerializer(serializers.ModelSerializer):
+    """
+    Prompt picker entry without the prompt text.
+    """
+
+    class Meta:
+        model = SystemPrompt
+        fields = ("id", "title", "description")
+        read_only_fields = ("id", "title", "description")
@@ -0,0 +1,13 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from prompts.cache import bump_catalogue_version
+from prompts.models import SystemPrompt
+
+
+@receiver(post_save, sender=SystemPrompt)
+@receiver(post_delete, sender=SystemPrompt)
+def system_prompt_changed(sender, instance, **kwargs):
+    # After commit: a worker rendering the new version must see the change
+    transaction.on_commit(bump_catalogue_version)
@@ -0,0 +1,193 @@
+import gzip
+import json
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from users.models import UserAccount
+
+from prompts.models import SystemPrompt
+from prompts.views.SystemPrompts import accepts_gzip
+from src.testing import QueryBudgetMixin
+
+
+class SystemPromptsQueryBudgetTest(QueryBudgetMixin, APITestCase):
+    """
+    System prompt endpoints stay within their `QUERY_BUDGETS` entries.
+    """
+
+    def setUp(self):
+        cache.clear()
+        user = UserAccount.objects.create(email="budget@example.com")
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}"
+        )
+        self.prompt = SystemPrompt.objects.create(
+            title="Translator", description="Translates", prompt="Translate"
+        )
+
+    def test_systemprompt_list(self):
+        self.assertQueryBudget("systemprompt-list")
+
+    def test_systemprompt_detail(self):
+        self.assertQueryBudget("systemprompt-detail", pk=self.prompt.id)
+
+
+class LoadPromptDataTest(TestCase):
+    """
+    `load_prompt_data` syncs the prompts with a JSON file by title.
+    """
+
+    def setUp(self):
+        SystemPrompt.objects.bulk_create(
+            [
+                SystemPrompt(title="Same", description="Same", prompt="Same"),
+                SystemPrompt(title="Changed", description="Old", prompt="Old"),
+                SystemPrompt(title="Removed", description="Gone", prompt="Gone"),
+            ]
+        )
+        self.data = [
+            {"title": "Same", "description": "Same", "prompt": "Same"},
+            {"title": "Changed", "description": "New", "prompt": "New"},
+            {"title": "Added", "description": "Added", "prompt": "Added"},
+        ]
+
+    def load(self, *args):
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as file:
+            json.dump(self.data, file)
+            file.flush()
+            out = StringIO()
+            call_command("load_prompt_data", "--file", file.name, *args, stdout=out)
+        return out.getvalue()
+
+    def prompts(self):
+        return {
+            title: (description, prompt)
+            for title, description, prompt in SystemPrompt.objects.values_list(
+                "title", "description", "prompt"
+            )
+        }
+
+    def test_sync_keeps_missing_prompts(self):
+        same_id = SystemPrompt.objects.get(title="Same").id
+        out = self.load()
+
+        self.assertIn("1 created, 1 updated, 0 deleted, 1 unchanged", out)
+        self.assertIn("1 prompts are not in the file", out)
+        self.assertEqual(
+            self.prompts(),
+            {
+                "Same": ("Same", "Same"),
+                "Changed": ("New", "New"),
+                "Added": ("Added", "Added"),
+                "Removed": ("Gone", "Gone"),
+            },
+        )
+        # Rows are updated in place
+        self.assertEqual(SystemPrompt.objects.get(title="Same").id, same_id)
+
+    def test_prune_deletes_missing_prompts(self):
+        out = self.load("--prune")
+
+        self.assertIn("1 created, 1 updated, 1 deleted", out)
+        self.assertEqual(set(self.prompts()), {"Same", "Changed", "Added"})
+
+    def test_second_run_changes_nothing(self):
+        self.load("--prune")
+        out = self.load("--prune")
+        self.assertIn("0 created, 0 updated, 0 deleted, 3 unchanged", out)
+
+    def test_last_duplicate_wins(self):
+        self.data.append({"title": "Added", "description": "Last", "prompt": "Last"})
+        self.load()
+        self.assertEqual(self.prompts()["Added"], ("Last", "Last"))
+
+
+class AcceptsGzipTest(SimpleTestCase):
+    """
+    `Accept-Encoding` parsing, q-values included.
+    """
+
+    def test_accept_encoding(self):
+        for header, expected in [
+            ("", False),
+            ("gzip", True),
+            ("deflate, gzip;q=0.5", True),
+            ("gzip;q=0", False),
+            ("GZIP; Q=0.0", False),
+            ("br, gzip;q=0, *", False),
+            ("br, *", True),
+            ("*;q=0", False),
+            ("x-gzip", True),
+            ("identity", False),
+            ("gzip;q=nonsense", False),
+        ]:
+            with self.subTest(header=header):
+                self.assertEqual(accepts_gzip(header), expected)
+
+
+class SystemPromptsETagTest(APITestCase):
+    """
+    The prompt list is revalidated with its ETag, per content encoding.
+    """
+
+    def setUp(self):
+        cache.clear()
+        user = UserAccount.objects.create(email="etag@example.com")
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}"
+        )
+        self.prompt = SystemPrompt.objects.create(
+            title="Translator", description="Translates", prompt="Translate"
+        )
+        self.url = reverse("systemprompt-list")
+
+    def get(self, **headers):
+        return self.client.get(self.url, HTTP_ACCEPT="application/json", **headers)
+
+    def test_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(json.loads(response.content)[0]["title"], "Translator")
+
+        again = self.get(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again["ETag"], response["ETag"])
+        self.assertEqual(again.content, b"")
+
+    def test_gzip_has_own_etag(self):
+        plain = self.get()
+        compressed = self.get(HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertNotEqual(compressed["ETag"], plain["ETag"])
+        self.assertIn("Accept-Encoding", compressed["Vary"])
+
+        again = self.get(
+            HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=compressed["ETag"]
+        )
+        self.assertEqual(again.status_code, 304)
+
+    def test_gzip_refused(self):
+        response = self.get(HTTP_ACCEPT_ENCODING="gzip;q=0, identity")
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(json.loads(response.content)[0]["title"], "Translator")
+
+    def test_etag_changes_with_catalogue(self):
+        etag = self.get()["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prompt.prompt = "Translate into English"
+            self.prompt.save()
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(
+            json.loads(response.content)[0]["prompt"], "Translate into English"
+        )
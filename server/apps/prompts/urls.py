@@ -1,7 +1,13 @@
 from django.urls import path
 
+from .views.SystemPromptDetail import SystemPromptDetail
 from .views.SystemPrompts import SystemPromptList
 
 urlpatterns = [
     path("systemprompts/", SystemPromptList.as_view(), name="systemprompt-list"),
+    path(
+        "systemprompts/<int:pk>/",
+        SystemPromptDetail.as_view(),
+        name="systemprompt-detail",
+    ),
 ]
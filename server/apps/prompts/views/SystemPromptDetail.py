@@ -0,0 +1,31 @@
+from django.http import Http404
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import generics
+from rest_framework.response import Response
+
+from prompts.cache import get_catalogue
+from prompts.models import SystemPrompt
+from prompts.serializers import SystemPromptSerializer
+
+
+class SystemPromptDetail(generics.RetrieveAPIView):
+    queryset = SystemPrompt.objects.all()
+    serializer_class = SystemPromptSerializer
+    jwt_claims_only = True
+
+    @swagger_auto_schema(
+        tags=["System prompts"],
+        responses={
+            200: SystemPromptSerializer,
+        },
+        operation_summary="Системный промпт.",
+        operation_description="""
+        ### Получает системный промпт по id, вместе с текстом промпта.
+        Используется вместе со списком `?mode=lite`.
+        """,
+    )
+    def get(self, request, *args, **kwargs):
+        item = get_catalogue("full").items().get(self.kwargs["pk"])
+        if item is None:
+            raise Http404
+        return Response(item)
@@ -1,19 +1,64 @@
+import json
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import generics
+from rest_framework.response import Response
 
+from prompts.cache import get_catalogue
 from prompts.models import SystemPrompt
 from prompts.serializers import SystemPromptSerializer
 
+JSON = "application/json"
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Whether an `Accept-Encoding` header allows gzip: listed (or `*`) with
+    a q-value above 0.
+    """
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
 
 class SystemPromptList(generics.ListAPIView):
     queryset = SystemPrompt.objects.all()
     serializer_class = SystemPromptSerializer
+    # The catalogue is the same for everyone, skip the user lookup
+    jwt_claims_only = True
 
     @swagger_auto_schema(
         tags=["System prompts"],
         responses={
             200: SystemPromptSerializer(many=True),
+            304: "Каталог не изменился (`If-None-Match`).",
         },
+        manual_parameters=[
+            openapi.Parameter(
+                "mode",
+                openapi.IN_QUERY,
+                description="`full` - с текстом промптов (по умолчанию), "
+                "`lite` - без поля `prompt`.",
+                type=openapi.TYPE_STRING,
+                enum=["full", "lite"],
+            ),
+        ],
         operation_summary="Список системных промптов.",
         operation_description="""
         ### Получает все системные промпты. Загружаются из файла/вносятся через административную панель.
@@ -22,9 +67,31 @@ class SystemPromptList(generics.ListAPIView):
         - `id`: id записи, \n
         - `title` - Название промпта
         - `description` - Краткое описание промпта
-        - `prompt` - Текст системного промта для запроса к chatGPT
+        - `prompt` - Текст системного промта для запроса к chatGPT (кроме `mode=lite`)
+
+        Ответ кэшируется и отдается с заголовком `ETag`: при повторном запросе
+        с `If-None-Match` и неизменном каталоге возвращается `304`.
+        Текст промпта по id - `GET /prompts/systemprompts/{id}/`.
         """,
     )
     def get(self, request, *args, **kwargs):
-        response = super().get(request, *args, **kwargs)
+        mode = "lite" if request.query_params.get("mode") == "lite" else "full"
+        catalogue = get_catalogue(mode)
+
+        if request.accepted_renderer.format != "json":
+            # Browsable API
+            return Response(json.loads(catalogue.body))
+
+        compressed = accepts_gzip(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if catalogue.matches(request.META.get("HTTP_IF_NONE_MATCH", "")):
+            response = HttpResponseNotModified()
+        elif compressed:
+            response = HttpResponse(catalogue.compressed, content_type=JSON)
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = HttpResponse(catalogue.body, content_type=JSON)
+
+        response["ETag"] = catalogue.gzip_etag if compressed else catalogue.etag
+        response["Cache-Control"] = "no-cache"
+        patch_vary_headers(response, ["Accept-Encoding"])
         return response
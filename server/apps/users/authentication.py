@@ -1,22 +1,95 @@
+from uuid import uuid4
+
 from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+# Never cached: a cached user has them deferred, loaded from the database if
+# a view needs them
+UNCACHED_USER_FIELDS = ("password", "last_login")
+
+
+def user_cache_key(user_id, jti):
+    return f"auth:user:{user_id}:{jti}"
+
+
+def user_version_key(user_id):
+    return f"auth:user_version:{user_id}"
+
+
+def invalidate_cached_user(user_id):
+    """
+    Drop every cached lookup of the user, whichever token it was made for.
+    """
+    cache.set(user_version_key(user_id), uuid4().hex, None)
 
 
 class CustomJWTAuthentication(JWTAuthentication):
+    """
+    JWT from the `Authorization` header or the `access` cookie.
+
+    The user behind a token is cached for `JWT_USER_CACHE_TTL` seconds, keyed
+    by user id and token `jti`; saving or deleting the user invalidates it.
+    The password hash and `last_login` are left out of the cache
+    (`UNCACHED_USER_FIELDS`), a cached user has them deferred.
+    Views with `jwt_claims_only = True` get a `TokenUser` built from the token
+    claims and never touch the database or the cache.
+    """
+
     def authenticate(self, request):
-        try:
-            header = self.get_header(request)
+        header = self.get_header(request)
 
-            if header is None:
-                raw_token = request.COOKIES.get(settings.AUTH_COOKIE)
-            else:
-                raw_token = self.get_raw_token(header)
+        if header is None:
+            raw_token = request.COOKIES.get(settings.AUTH_COOKIE)
+        else:
+            raw_token = self.get_raw_token(header)
 
-            if raw_token is None:
-                return None
+        if raw_token is None:
+            return None
 
+        try:
             validated_token = self.get_validated_token(raw_token)
 
+            view = request.parser_context.get("view")
+            if getattr(view, "jwt_claims_only", False):
+                return api_settings.TOKEN_USER_CLASS(validated_token), validated_token
+
             return self.get_user(validated_token), validated_token
-        except:
+        except AuthenticationFailed:
+            # Invalid token, unknown or inactive user: leave the request
+            # to the next authentication class, as anonymous
             return None
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        if user_id is None or jti is None:
+            return super().get_user(validated_token)
+
+        key = user_cache_key(user_id, jti)
+        version_key = user_version_key(user_id)
+        cached = cache.get_many([key, version_key])
+        version = cached.get(version_key)
+        fields = self.cached_fields()
+        if version is not None and key in cached and cached[key][0] == version:
+            return self.user_model.from_db(DEFAULT_DB_ALIAS, fields, cached[key][1])
+
+        user = super().get_user(validated_token)
+
+        if version is None:
+            cache.add(version_key, uuid4().hex, None)
+            version = cache.get(version_key)
+        values = [getattr(user, field) for field in fields]
+        cache.set(key, (version, values), settings.JWT_USER_CACHE_TTL)
+        return user
+
+    def cached_fields(self):
+        # In model field order, as from_db() expects them
+        return [
+            field.attname
+            for field in self.user_model._meta.concrete_fields
+            if field.attname not in UNCACHED_USER_FIELDS
+        ]
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.authentication import invalidate_cached_user
+from users.models import UserAccount
+
+
+@receiver(post_save, sender=UserAccount)
+@receiver(post_delete, sender=UserAccount)
+def user_changed(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
@@ -0,0 +1,41 @@
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from src.testing import QueryBudgetMixin
+from users.models import UserAccount
+
+
+class UsersQueryBudgetTest(QueryBudgetMixin, APITestCase):
+    """
+    A warm JWT user cache serves the user without any query.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create(
+            email="budget@example.com", first_name="Ivan", last_name="Petrov"
+        )
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.client.get(reverse("useraccount-me"))
+
+    def test_user_me(self):
+        response = self.assertQueryBudget("useraccount-me")
+        self.assertEqual(
+            response.data,
+            {
+                "email": "budget@example.com",
+                "id": self.user.id,
+                "first_name": "Ivan",
+                "last_name": "Petrov",
+            },
+        )
+
+    def test_saved_user_is_not_served_stale(self):
+        self.user.first_name = "Petr"
+        self.user.save()
+        response = self.client.get(reverse("useraccount-me"))
+        self.assertEqual(response.data["first_name"], "Petr")
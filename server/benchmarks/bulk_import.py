@@ -0,0 +1,84 @@
+"""
+Message import throughput: one MessageCreate request per message against
+one bulk request with a JSON array or NDJSON body.
+
+    python -m benchmarks.bulk_import --messages 10000 --single 1000
+"""
+import argparse
+import json
+import time
+
+from benchmarks import django_env
+
+
+def run(messages=10000, single=1000):
+    from conversations.models import Conversation
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from django.urls import reverse
+    from rest_framework_simplejwt.tokens import AccessToken
+    from users.models import UserAccount
+
+    user, _ = UserAccount.objects.get_or_create(email="bench@example.com")
+    client = Client(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+    items = [
+        {
+            "role": "user" if number % 2 == 0 else "assistant",
+            "content": f"Imported message #{number}. " * 8,
+        }
+        for number in range(messages)
+    ]
+
+    def measure(name, count, send):
+        conversation = Conversation.objects.create(user=user)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            send(conversation.id)
+            elapsed = time.perf_counter() - started
+        return name, {
+            "messages": count,
+            "seconds": round(elapsed, 3),
+            "messages_per_second": round(count / elapsed),
+            "queries": len(queries),
+        }
+
+    def one_by_one(conversation_id):
+        url = reverse("message-create", kwargs={"conversation_id": conversation_id})
+        for item in items[:single]:
+            response = client.post(url, item, content_type="application/json")
+            assert response.status_code == 201, response.content
+
+    def bulk(content_type, body):
+        def send(conversation_id):
+            url = reverse(
+                "messages-bulk-create", kwargs={"conversation_id": conversation_id}
+            )
+            response = client.post(url, body, content_type=content_type)
+            assert response.status_code == 201, response.content
+
+        return send
+
+    json_body = json.dumps(items)
+    ndjson_body = "\n".join(json.dumps(item) for item in items)
+    return dict(
+        [
+            measure("message_create", single, one_by_one),
+            measure("bulk_json", messages, bulk("application/json", json_body)),
+            measure("bulk_ndjson", messages, bulk("application/x-ndjson", ndjson_body)),
+        ]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--single", type=int, default=1000)
+    parser.add_argument("--db", choices=["sqlite", "postgres"], default="sqlite")
+    args = parser.parse_args()
+    django_env.setup(args.db)
+    print(json.dumps(run(args.messages, args.single), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Compare two `benchmarks.load` results and flag regressions.
+
+    python -m benchmarks.compare bench_results/old.json bench_results/new.json
+
+Exits with status 1 when a latency percentile grows or throughput drops by
+more than `--threshold` percent.
+"""
+import argparse
+import json
+import sys
+
+# (section, key, True if higher is better)
+METRICS = [
+    ("latency_ms", "p50", False),
+    ("latency_ms", "p95", False),
+    ("latency_ms", "p99", False),
+    ("ttfb_ms", "p50", False),
+    ("ttfb_ms", "p95", False),
+    (None, "rps_per_worker", True),
+    (None, "errors", False),
+]
+
+
+def value(result, section, key):
+    data = result.get(section) if section else result
+    return (data or {}).get(key)
+
+
+def compare(old, new, threshold):
+    """
+    Yields `(scenario, metric, old, new, change %, regressed)`.
+    """
+    for scenario, result in new["scenarios"].items():
+        previous = old["scenarios"].get(scenario)
+        if previous is None:
+            continue
+        for section, key, higher_is_better in METRICS:
+            before, after = value(previous, section, key), value(result, section, key)
+            if before is None or after is None:
+                continue
+            metric = f"{section}.{key}" if section else key
+            if before == 0:
+                change = 0.0 if after == 0 else float("inf")
+            else:
+                change = (after - before) / before * 100
+            worse = -change if higher_is_better else change
+            yield scenario, metric, before, after, change, worse > threshold
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10, help="percent")
+    args = parser.parse_args()
+
+    with open(args.old) as file:
+        old = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+
+    for name in ("db", "workers", "concurrency", "data", "upstream"):
+        if old.get(name) != new.get(name):
+            print(f"warning: {name} differs: {old.get(name)} -> {new.get(name)}")
+
+    print(f"{old['commit']} -> {new['commit']}")
+    regressions = 0
+    for scenario, metric, before, after, change, regressed in compare(
+        old, new, args.threshold
+    ):
+        regressions += regressed
+        mark = "REGRESSION" if regressed else ""
+        print(
+            f"{scenario:<20} {metric:<18} {before:>10} {after:>10} "
+            f"{change:>+8.1f}% {mark}"
+        )
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
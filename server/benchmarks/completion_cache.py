@@ -0,0 +1,165 @@
+"""
+Completion stream of a canned prompt with `temperature` 0, with the
+completion cache off and on.
+
+Runs the ASGI application in this process against `benchmarks.fake_openai`,
+streams `--streams` chats with the same messages at once per mode and
+reports the upstream requests, time to the first frame and to the end of the
+stream. Exits with status 1 unless the cached streams carry the same frames
+as the live one that filled the cache.
+
+    python -m benchmarks.completion_cache --streams 20 --tokens 300
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks import SERVER_DIR, django_env
+from benchmarks.load import free_port, percentiles, seed, wait_for_port
+
+EVENT_ID = re.compile(rb"^id: .*\n", re.MULTILINE)
+
+
+async def stream(application, token, conversation_id):
+    """
+    Request one completion; returns `(seconds to first frame, seconds, frames)`.
+    """
+    started = time.perf_counter()
+    first = None
+    body = []
+    requested = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal first
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200, message
+        elif message["type"] == "http.response.body" and message.get("body"):
+            first = first or time.perf_counter() - started
+            body.append(message["body"])
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": f"/api/v1/conversations/{conversation_id}/stream/",
+        "raw_path": b"",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"localhost"),
+            (b"authorization", f"Bearer {token}".encode()),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 80),
+    }
+    await application(scope, receive, send)
+    disconnected.set()
+    frames = EVENT_ID.sub(b"", b"".join(body)).split(b"\n\n")
+    # Without the `saved` event, its message id differs
+    frames = [frame for frame in frames if frame.startswith(b"data:")]
+    return first, time.perf_counter() - started, frames
+
+
+async def run_mode(application, upstream, token, conversation_ids, enabled):
+    from django.conf import settings
+
+    settings.COMPLETION_CACHE = enabled
+    before = (await upstream.get("/stats")).json()["completions"]
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(stream(application, token, id) for id in conversation_ids)
+    )
+    elapsed = time.perf_counter() - started
+    after = (await upstream.get("/stats")).json()["completions"]
+    return {
+        "cache": enabled,
+        "streams": len(conversation_ids),
+        "upstream_completions": after - before,
+        "first_frame_ms": percentiles([result[0] for result in results]),
+        "stream_ms": percentiles([result[1] for result in results]),
+        "seconds": round(elapsed, 2),
+    }, [result[2] for result in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--streams", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument("--tokens-per-second", type=float, default=50)
+    parser.add_argument("--ttft-ms", type=int, default=300)
+    args = parser.parse_args()
+
+    env = django_env.configure()
+    port = free_port()
+    fake = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.fake_openai",
+            "--port", str(port),
+            "--ttft-ms", str(args.ttft_ms),
+            "--tokens-per-second", str(args.tokens_per_second),
+            "--tokens", str(args.tokens),
+        ],
+        cwd=SERVER_DIR,
+        env=env,
+    )
+    try:
+        wait_for_port(port, fake)
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+        os.environ["OPENAI_HTTP2"] = "False"
+        os.environ["STREAM_CONCURRENCY"] = str(args.streams)
+        django_env.setup()
+
+        from conversations.models import Conversation
+
+        from src.asgi import application
+
+        [(token, conversation_ids)] = seed(1, args.streams * 2 + 1, 1)
+        Conversation.objects.update(temperature=0)
+
+        async def run_all():
+            upstream = httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}")
+            async with upstream:
+                off, _ = await run_mode(
+                    application, upstream, token, conversation_ids[1:][::2], False
+                )
+                # Fills the cache
+                live, [frames] = await run_mode(
+                    application, upstream, token, conversation_ids[:1], True
+                )
+                on, replayed = await run_mode(
+                    application, upstream, token, conversation_ids[2:][::2], True
+                )
+            identical = all(other == frames for other in replayed)
+            return [off, live, on], identical
+
+        results, identical = asyncio.run(run_all())
+        print(json.dumps(results, indent=2))
+        print(json.dumps({"replayed_frames_identical": identical}))
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
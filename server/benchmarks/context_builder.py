@@ -0,0 +1,83 @@
+"""
+Context window builder on long conversations.
+
+    python -m benchmarks.context_builder --messages 10000
+"""
+import argparse
+import json
+import random
+import time
+
+from conversations.context import ContextWindow, build_context, count_tokens
+
+MODELS = ["gpt-3.5-turbo-0613", "gpt-4", "gpt-4-turbo"]
+WORDS = "the quick brown fox jumps over a lazy dog привет как дела".split()
+
+
+def make_history(size, seed=0):
+    """
+    `size` messages newest first, from a one-liner to a few pages long.
+    """
+    rnd = random.Random(seed)
+    history = []
+    for i in range(size):
+        length = int(rnd.lognormvariate(3.5, 1.2))
+        content = " ".join(rnd.choice(WORDS) for _ in range(length))
+        history.append(("user" if i % 2 else "assistant", content))
+    return history
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(messages=10000, repeat=5):
+    history = make_history(messages)
+    cached = [(role, content, count_tokens(content)) for role, content in history]
+    uncached = [(role, content, None) for role, content in history]
+
+    results = {}
+    for model in MODELS:
+        warm, selected = timed(
+            lambda: build_context(cached, model, 500, "You are a helpful assistant"),
+            repeat,
+        )
+        cold, _ = timed(
+            lambda: build_context(uncached, model, 500, "You are a helpful assistant"),
+            repeat,
+        )
+        # What the old "last 5 messages" rule would have sent
+        window = ContextWindow(model, 500, "You are a helpful assistant")
+        last_five = sum(tokens for _, _, tokens in cached[:5])
+        results[model] = {
+            "selected_messages": len(selected),
+            "budget_tokens": window.budget,
+            "last_five_tokens": last_five,
+            "cached_counts_ms": round(warm * 1000, 3),
+            "uncached_counts_ms": round(cold * 1000, 3),
+        }
+
+    counted, _ = timed(lambda: [count_tokens(content) for _, content in history], 1)
+    return {
+        "messages": messages,
+        "count_tokens_per_message_us": round(counted / messages * 1e6, 2),
+        "models": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.messages, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
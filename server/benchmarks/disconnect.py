@@ -0,0 +1,126 @@
+"""
+Upstream release on client disconnect.
+
+Starts `benchmarks.fake_openai` (with long replies) and the API, opens
+`--streams` completion streams, drops each client connection after the first
+frame and measures how long the fake upstream keeps them open afterwards. Exits with
+status 1 if any is still open `--max-seconds` after the resume grace period
+(`--grace`, `STREAM_RESUME_GRACE`).
+
+    python -m benchmarks.disconnect --streams 20 --max-seconds 2 --grace 0
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+
+from benchmarks import django_env
+from benchmarks.load import seed, start_servers
+
+
+async def open_stream(client, token, conversation_id):
+    """
+    Start a completion stream and read up to its first frame.
+    """
+    request = client.build_request(
+        "GET",
+        f"/api/v1/conversations/{conversation_id}/stream/",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    response = await client.send(request, stream=True)
+    response.raise_for_status()
+    # Keep the iterator referenced, its finalizer would close the response
+    response.chunks = response.aiter_raw()
+    while b"\ndata:" not in await anext(response.chunks):
+        pass
+    return response
+
+
+async def run(base_url, upstream_url, token, conversation_ids, staff_token, limit):
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        async with httpx.AsyncClient(base_url=upstream_url) as upstream:
+            responses = await asyncio.gather(
+                *(open_stream(client, token, id) for id in conversation_ids)
+            )
+            opened = (await upstream.get("/stats")).json()["open_streams"]
+
+            # Closing a response that is not read to the end closes its
+            # connection
+            dropped = time.perf_counter()
+            for response in responses:
+                await response.aclose()
+
+            stats = (await upstream.get("/stats")).json()
+            while stats["open_streams"] and time.perf_counter() - dropped < limit:
+                await asyncio.sleep(0.01)
+                stats = (await upstream.get("/stats")).json()
+            released = time.perf_counter() - dropped
+
+            metrics = await client.get(
+                "/api/v1/metrics/", headers={"Authorization": f"Bearer {staff_token}"}
+            )
+            counters = metrics.json()["counters"]
+
+    return {
+        "streams": len(conversation_ids),
+        "upstream_open_before_drop": opened,
+        "upstream_open_after": stats["open_streams"],
+        "upstream_disconnects": stats["disconnects"],
+        "released_seconds": round(released, 3),
+        "streams_disconnected": counters.get("streams_disconnected", 0),
+        "generations_cancelled": counters.get("stream_generations_cancelled", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--streams", type=int, default=20)
+    parser.add_argument("--max-seconds", type=float, default=2)
+    parser.add_argument("--grace", type=float, default=0)
+    parser.add_argument("--ttft-ms", type=float, default=100)
+    parser.add_argument("--tokens-per-second", type=float, default=20)
+    parser.add_argument("--tokens", type=int, default=2000)
+    args = parser.parse_args()
+    args.workers = 1
+    args.concurrency = args.streams
+
+    django_env.setup()
+    env = django_env.configure()
+    env["STREAM_RESUME_GRACE"] = str(args.grace)
+    [(token, conversation_ids)] = seed(1, args.streams, 2)
+
+    from rest_framework_simplejwt.tokens import AccessToken
+    from users.models import UserAccount
+
+    staff = UserAccount.objects.create(email="staff@example.com", is_staff=True)
+    staff_token = str(AccessToken.for_user(staff))
+
+    processes, base_url = start_servers(env, args)
+    fake_args = processes[0].args
+    fake_port = fake_args[fake_args.index("--port") + 1]
+    try:
+        result = asyncio.run(
+            run(
+                base_url,
+                f"http://127.0.0.1:{fake_port}",
+                token,
+                conversation_ids,
+                staff_token,
+                args.grace + args.max_seconds,
+            )
+        )
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    print(json.dumps(result, indent=2))
+    if result["upstream_open_after"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
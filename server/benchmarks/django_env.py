@@ -0,0 +1,50 @@
+"""
+Django setup for benchmarks: a throwaway SQLite database (or the Postgres
+configured by the SQL_* variables with `--db postgres`) and a local cache,
+so benchmarks never touch the development database.
+"""
+import os
+import tempfile
+
+from benchmarks import SERVER_DIR
+
+BENCH_ENV = {
+    "DJANGO_SETTINGS_MODULE": "src.settings",
+    "DEVELOPMENT_MODE": "True",
+    "DJANGO_SECRET_KEY": "benchmark-secret-key",
+    "REDIRECT_URLS": "http://localhost:3000",
+    "CSRF_TRUSTED_ORIGINS": "http://localhost:3000",
+    "CACHE_BACKEND": "locmem",
+    "OPENAI_APIKEY": "sk-benchmark",
+}
+
+
+def configure(db="sqlite"):
+    """
+    Set the environment for `src.settings`; call before importing Django models.
+    Returns the environment, so it can be passed on to server subprocesses.
+    """
+    os.chdir(SERVER_DIR)
+    for name, value in BENCH_ENV.items():
+        os.environ.setdefault(name, value)
+    if db == "postgres":
+        os.environ["DEVELOPMENT_MODE"] = "False"
+    else:
+        os.environ.setdefault(
+            "SQLITE_NAME", os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+        )
+    return dict(os.environ)
+
+
+def setup(db="sqlite"):
+    """
+    Configure and initialize Django, creating the schema.
+    """
+    configure(db)
+
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    # Migrations are not kept in the repository, build tables from models
+    call_command("migrate", run_syncdb=True, verbosity=0)
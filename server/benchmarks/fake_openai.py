@@ -0,0 +1,167 @@
+"""
+Fake OpenAI chat completions server for benchmarks.
+
+Streams `chat.completion.chunk` events like the real API, at a configurable
+time to first token, token rate and reply length.
+
+    python -m benchmarks.fake_openai --port 9100 --ttft-ms 300 --tokens-per-second 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import uvicorn
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do".split()
+
+
+class FakeOpenAI:
+    def __init__(self, ttft_ms=300, tokens_per_second=50, tokens=200, jitter=0.2):
+        self.ttft = ttft_ms / 1000
+        self.interval = 1 / tokens_per_second if tokens_per_second else 0
+        self.tokens = tokens
+        self.jitter = jitter
+        self.open_streams = 0
+        self.completions = 0
+        self.disconnects = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        if scope["path"].endswith("/stats"):
+            await self.send_json(
+                send,
+                {
+                    "open_streams": self.open_streams,
+                    "completions": self.completions,
+                    "disconnects": self.disconnects,
+                },
+            )
+            return
+
+        self.completions += 1
+        request = json.loads(body or b"{}")
+        model = request.get("model", "gpt-3.5-turbo")
+        if not request.get("stream"):
+            await asyncio.sleep(self.ttft)
+            await self.send_json(send, self.completion(model))
+            return
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/event-stream")],
+            }
+        )
+        self.open_streams += 1
+        # uvicorn drops writes to a closed connection, stop streaming instead
+        streaming = asyncio.create_task(self.stream(send, model))
+        disconnect = asyncio.create_task(receive())
+        try:
+            await asyncio.wait(
+                [streaming, disconnect], return_when=asyncio.FIRST_COMPLETED
+            )
+            if not streaming.done():
+                self.disconnects += 1
+                streaming.cancel()
+        finally:
+            disconnect.cancel()
+            self.open_streams -= 1
+
+    def completion(self, model):
+        content = " ".join(WORDS[i % len(WORDS)] for i in range(self.tokens))
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": 0,
+                "completion_tokens": self.tokens,
+                "total_tokens": self.tokens,
+            },
+        }
+
+    async def stream(self, send, model):
+        created = int(time.time())
+
+        async def event(delta, finish_reason=None):
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+            }
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": f"data: {json.dumps(chunk)}\n\n".encode(),
+                    "more_body": True,
+                }
+            )
+
+        await asyncio.sleep(self.ttft)
+        await event({"role": "assistant", "content": ""})
+        for i in range(self.tokens):
+            await event({"content": f"{WORDS[i % len(WORDS)]} "})
+            if self.interval:
+                delay = self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+                await asyncio.sleep(delay)
+        await event({}, "stop")
+        await send({"type": "http.response.body", "body": b"data: [DONE]\n\n"})
+
+    @staticmethod
+    async def send_json(send, data):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/json")],
+            }
+        )
+        await send({"type": "http.response.body", "body": json.dumps(data).encode()})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-second", type=float, default=50)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    args = parser.parse_args()
+
+    app = FakeOpenAI(args.ttft_ms, args.tokens_per_second, args.tokens, args.jitter)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+JWT authentication latency: database lookup, cached user and claims only.
+
+    python -m benchmarks.jwt_auth --iterations 5000
+"""
+import argparse
+import json
+import time
+
+from benchmarks import django_env
+
+
+def measure(func, iterations):
+    func()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def run(iterations=5000):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.tokens import AccessToken
+    from users.authentication import CustomJWTAuthentication
+    from users.models import UserAccount
+
+    user, _ = UserAccount.objects.get_or_create(email="bench@example.com")
+    token = str(AccessToken.for_user(user))
+    factory = APIRequestFactory()
+
+    class View:
+        jwt_claims_only = False
+
+    class ClaimsOnlyView:
+        jwt_claims_only = True
+
+    def make_request(view):
+        return Request(
+            factory.get("/", HTTP_AUTHORIZATION=f"Bearer {token}"),
+            parser_context={"view": view},
+        )
+
+    request = make_request(View())
+    claims_request = make_request(ClaimsOnlyView())
+    uncached = JWTAuthentication()
+    cached = CustomJWTAuthentication()
+
+    paths = {
+        "database": lambda: uncached.authenticate(request),
+        "cached": lambda: cached.authenticate(request),
+        "claims_only": lambda: cached.authenticate(claims_request),
+    }
+    results = {}
+    for name, func in paths.items():
+        func()
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        results[name] = {
+            "us_per_request": round(measure(func, iterations), 2),
+            "queries_per_request": len(queries),
+        }
+    return {"iterations": iterations, "paths": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--db", choices=["sqlite", "postgres"], default="sqlite")
+    args = parser.parse_args()
+    django_env.setup(args.db)
+    print(json.dumps(run(args.iterations), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Load test of the conversations API under uvicorn against a fake upstream.
+
+Seeds a throwaway database, starts `benchmarks.fake_openai` and the API in
+subprocesses, then drives each scenario with closed-loop virtual users and
+stores latency percentiles, time to first byte of the completion stream and
+throughput per worker as JSON, one file per commit and database.
+
+    python -m benchmarks.load --db sqlite --workers 2 --concurrency 32
+    python -m benchmarks.compare bench_results/old.json bench_results/new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from itertools import cycle
+
+import httpx
+
+from benchmarks import SERVER_DIR, django_env
+
+SCENARIOS = ["chat-stream", "message-create", "chat-messages-list", "chats-list-create"]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Port {port} did not open in {timeout}s")
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def rank(p):
+        return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 2)
+
+    return {
+        "p50": rank(0.50),
+        "p95": rank(0.95),
+        "p99": rank(0.99),
+        "mean": round(sum(values) / len(values) * 1000, 2),
+    }
+
+
+def seed(users, conversations, messages):
+    """
+    Create `users`, each with `conversations` chats of `messages` messages.
+    Returns `(access token, [conversation ids])` per user.
+    """
+    from conversations.context import count_tokens
+    from conversations.models import Conversation, Message
+    from rest_framework_simplejwt.tokens import AccessToken
+    from users.models import UserAccount
+
+    sample = [
+        "Расскажи, как работает индекс в PostgreSQL и когда он не используется.",
+        "A B-tree index keeps keys sorted so lookups, range scans and ordered "
+        "reads touch only a few pages instead of the whole table. " * 4,
+    ]
+    seeded = []
+    for i in range(users):
+        user = UserAccount.objects.create(email=f"bench{i}@example.com")
+        chats = Conversation.objects.bulk_create(
+            Conversation(user=user, title=f"Bench {j}") for j in range(conversations)
+        )
+        for chat in chats:
+            Message.objects.bulk_create(
+                (
+                    Message(
+                        conversation=chat,
+                        role="user" if k % 2 == 0 else "assistant",
+                        content=sample[k % 2],
+                        tokens=count_tokens(sample[k % 2]),
+                    )
+                    for k in range(messages)
+                ),
+                batch_size=1000,
+            )
+        seeded.append((str(AccessToken.for_user(user)), [str(c.id) for c in chats]))
+    return seeded
+
+
+def start_servers(env, args):
+    fake_port, api_port = free_port(), free_port()
+    fake = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.fake_openai",
+            "--port", str(fake_port),
+            "--ttft-ms", str(args.ttft_ms),
+            "--tokens-per-second", str(args.tokens_per_second),
+            "--tokens", str(args.tokens),
+        ],
+        cwd=SERVER_DIR,
+        env=env,
+    )
+    api_env = {
+        **env,
+        "PYTHONPATH": str(SERVER_DIR),
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "OPENAI_HTTP2": "False",
+        "STREAM_CONCURRENCY": str(args.concurrency),
+    }
+    api = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "src.asgi:application",
+            "--port", str(api_port),
+            "--workers", str(args.workers),
+            "--log-level", "warning",
+            "--no-access-log",
+        ],
+        cwd=SERVER_DIR,
+        env=api_env,
+    )
+    wait_for_port(fake_port, fake)
+    wait_for_port(api_port, api)
+    return [fake, api], f"http://127.0.0.1:{api_port}"
+
+
+async def request(client, scenario, conversation_id):
+    """
+    Send one request; returns `(seconds to first body byte, total seconds)`.
+    """
+    base = f"/api/v1/conversations/{conversation_id}"
+    if scenario == "chat-stream":
+        method, url, body = "GET", f"{base}/stream/", None
+    elif scenario == "message-create":
+        content = "Benchmark question #%d" % random.randrange(10**6)
+        body = {"content": content, "role": "user"}
+        method, url = "POST", f"{base}/messages/create/"
+    elif scenario == "chat-messages-list":
+        method, url, body = "GET", f"{base}/messages/list/", None
+    else:
+        method, url, body = "GET", "/api/v1/conversations/", None
+
+    started = time.perf_counter()
+    first_byte = None
+    async with client.stream(method, url, json=body) as response:
+        async for _ in response.aiter_raw():
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+        response.raise_for_status()
+    return first_byte, time.perf_counter() - started
+
+
+async def run_scenario(base_url, scenario, seeded, concurrency, duration):
+    latencies, ttfb, errors = [], [], 0
+    deadline = time.perf_counter() + duration
+
+    async def virtual_user(token, conversations):
+        nonlocal errors
+        async with httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=120,
+        ) as client:
+            while time.perf_counter() < deadline:
+                try:
+                    first_byte, total = await request(
+                        client, scenario, next(conversations)
+                    )
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(total)
+                if first_byte is not None:
+                    ttfb.append(first_byte)
+
+    users = []
+    for i in range(concurrency):
+        token, conversations = seeded[i % len(seeded)]
+        users.append(virtual_user(token, cycle(conversations)))
+    started = time.perf_counter()
+    await asyncio.gather(*users)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": percentiles(latencies),
+        "ttfb_ms": percentiles(ttfb),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", choices=["sqlite", "postgres"], default="sqlite")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument(
+        "--warmup", type=float, default=2, help="unmeasured seconds per scenario"
+    )
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--conversations", type=int, default=20, help="per user")
+    parser.add_argument("--messages", type=int, default=200, help="per chat")
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-second", type=float, default=50)
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS)
+    parser.add_argument("--output", default="bench_results")
+    args = parser.parse_args()
+
+    django_env.setup(args.db)
+    env = dict(os.environ)
+    seeded = seed(args.users, args.conversations, args.messages)
+
+    processes, base_url = start_servers(env, args)
+    results = {}
+    try:
+        for scenario in args.scenario or SCENARIOS:
+            # Lazy imports, tokenizer loading and the upstream connection pool
+            # make first requests of every worker slower
+            load = (base_url, scenario, seeded, args.concurrency)
+            asyncio.run(run_scenario(*load, args.warmup))
+            result = asyncio.run(run_scenario(*load, args.duration))
+            result["rps_per_worker"] = round(result["rps"] / args.workers, 2)
+            results[scenario] = result
+            print(scenario, json.dumps(result), flush=True)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "db": args.db,
+        "workers": args.workers,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "data": {
+            "users": args.users,
+            "conversations_per_user": args.conversations,
+            "messages_per_conversation": args.messages,
+        },
+        "upstream": {
+            "ttft_ms": args.ttft_ms,
+            "tokens_per_second": args.tokens_per_second,
+            "tokens": args.tokens,
+        },
+        "scenarios": results,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{commit}-{args.db}-w{args.workers}.json")
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    main()
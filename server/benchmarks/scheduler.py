@@ -0,0 +1,164 @@
+"""
+Upstream scheduler under simulated load.
+
+Thousands of light users send one completion each at random times, while a
+few heavy users keep `--heavy-streams` completions each in flight for the
+whole run. All of them go through `conversations.scheduler` to a fake
+upstream that checks the concurrency limit. The same load is run through the
+fair scheduler and through a single FIFO queue (every request from the same
+user), and the queue wait of light and heavy users is reported for both.
+Exits with status 1 if the upstream saw more completions at once than the
+limit, or admitted more tokens than the per-minute budget allows.
+
+    python -m benchmarks.scheduler --users 3000 --heavy-users 30 --seconds 20
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+
+from benchmarks import django_env
+from benchmarks.load import percentiles
+
+
+class FakeUpstream:
+    """
+    Streams a reply of `tokens` tokens after `ttft` seconds.
+    """
+
+    def __init__(self, ttft, tokens_per_second):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.active = 0
+        self.peak = 0
+        self.completions = 0
+
+    async def __call__(self, tokens):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.ttft + tokens / self.tokens_per_second)
+        finally:
+            self.active -= 1
+            self.completions += 1
+
+
+async def complete(scheduler, upstream, user, cost, reply, results):
+    loop = asyncio.get_running_loop()
+    arrived = loop.time()
+    ticket = scheduler.enqueue("gpt-3.5-turbo", user, cost)
+    events = 0
+    try:
+        async for _ in ticket.wait():
+            events += 1
+        results.append((arrived, loop.time() - arrived, events, cost))
+        await upstream(reply)
+    finally:
+        ticket.release()
+
+
+async def simulate(args, fair):
+    from conversations.scheduler import Scheduler, estimate_tokens
+
+    rnd = random.Random(args.seed)
+    scheduler = Scheduler(args.concurrency, args.tpm, {})
+    upstream = FakeUpstream(args.ttft_ms / 1000, args.tokens_per_second)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + args.seconds
+    prompt = [{"role": "user", "content": "x" * args.prompt_chars}]
+    cost = estimate_tokens(prompt, args.max_tokens)
+    light, heavy = [], []
+
+    def user(name):
+        return name if fair else None
+
+    async def light_user(number):
+        await asyncio.sleep(rnd.uniform(0, args.seconds))
+        reply = rnd.randint(args.max_tokens // 10, args.max_tokens)
+        name = user(f"light{number}")
+        await complete(scheduler, upstream, name, cost, reply, light)
+
+    async def heavy_stream(number):
+        while loop.time() < deadline:
+            reply = rnd.randint(args.max_tokens // 10, args.max_tokens)
+            name = user(f"heavy{number}")
+            await complete(scheduler, upstream, name, cost, reply, heavy)
+
+    await asyncio.gather(
+        *(light_user(number) for number in range(args.users)),
+        *(
+            heavy_stream(number)
+            for number in range(args.heavy_users)
+            for _ in range(args.heavy_streams)
+        ),
+    )
+    elapsed = loop.time() - started
+
+    admitted = sorted(
+        (arrived + wait, cost) for arrived, wait, _, cost in light + heavy
+    )
+    # Most tokens admitted within any minute
+    peak_tokens = 0
+    window = 0
+    first = 0
+    for at, cost in admitted:
+        window += cost
+        while admitted[first][0] <= at - 60:
+            window -= admitted[first][1]
+            first += 1
+        peak_tokens = max(peak_tokens, window)
+
+    heavy_tokens = sum(cost for *_, cost in heavy)
+    total_tokens = sum(cost for _, cost in admitted)
+    return {
+        "scheduler": "fair" if fair else "fifo",
+        "seconds": round(elapsed, 2),
+        "completions": upstream.completions,
+        "upstream_peak_concurrency": upstream.peak,
+        "peak_tokens_per_minute": peak_tokens,
+        "light_wait_ms": percentiles([wait for _, wait, _, _ in light]),
+        "heavy_wait_ms": percentiles([wait for _, wait, _, _ in heavy]),
+        "heavy_token_share": round(heavy_tokens / max(total_tokens, 1), 3),
+        "queue_events_per_request": round(
+            sum(events for _, _, events, _ in light + heavy) / len(light + heavy), 2
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=3000)
+    parser.add_argument("--heavy-users", type=int, default=30)
+    parser.add_argument("--heavy-streams", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--tpm", type=int, default=0)
+    parser.add_argument("--ttft-ms", type=float, default=50)
+    parser.add_argument("--tokens-per-second", type=float, default=1000)
+    parser.add_argument("--max-tokens", type=int, default=300)
+    parser.add_argument("--prompt-chars", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    django_env.configure()
+    import django
+
+    django.setup()
+
+    results = [asyncio.run(simulate(args, fair)) for fair in (False, True)]
+    print(json.dumps(results, indent=2))
+
+    for result in results:
+        over_concurrency = (
+            args.concurrency and result["upstream_peak_concurrency"] > args.concurrency
+        )
+        # A full bucket plus a minute of refill
+        over_tpm = args.tpm and result["peak_tokens_per_minute"] > 2 * args.tpm
+        if over_concurrency or over_tpm:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Serializing a long chat: `ConversationSerializer` + `JSONRenderer` against
+`values_list()` rows through `conversations.mappers` + `FastJSONRenderer`.
+Checks that both produce the same bytes.
+
+    python -m benchmarks.serialization --messages 10000
+"""
+import argparse
+import json
+from datetime import timedelta
+
+from benchmarks import django_env
+from benchmarks.context_builder import timed
+
+
+def run(messages=10000, repeat=5):
+    from conversations.mappers import conversation_mapper, message_mapper
+    from conversations.models import Conversation, Message
+    from conversations.serializers import ConversationSerializer
+    from django.utils import timezone
+    from rest_framework.renderers import JSONRenderer
+    from users.models import UserAccount
+
+    from src.renderers import FastJSONRenderer
+
+    user, _ = UserAccount.objects.get_or_create(email="bench@example.com")
+    conversation = Conversation.objects.create(user=user, temperature=0.3)
+    now = timezone.now()
+    Message.objects.bulk_create(
+        [
+            Message(
+                conversation=conversation,
+                role="user" if number % 2 == 0 else "assistant",
+                content=f"Сообщение №{number}  with \"quotes\" и emoji 🙂. " * 6,
+                createdAt=now + timedelta(microseconds=number),
+            )
+            for number in range(messages)
+        ],
+        batch_size=1000,
+    )
+
+    def current():
+        # What MessagesList used to do
+        chat = Conversation.objects.get(id=conversation.id)
+        messages = Message.objects.filter(conversation=chat).order_by("createdAt")
+        fields = ConversationSerializer.Meta.fields
+        instance = {name: getattr(chat, name) for name in fields if name != "messages"}
+        data = ConversationSerializer({**instance, "messages": messages}).data
+        return JSONRenderer().render(data)
+
+    def fast():
+        chat = (
+            Conversation.objects.filter(id=conversation.id)
+            .values_list(*conversation_mapper.columns)
+            .first()
+        )
+        messages = (
+            Message.objects.filter(conversation_id=conversation.id)
+            .order_by("createdAt")
+            .values_list(*message_mapper.columns)
+        )
+        data = conversation_mapper(chat)
+        data["messages"] = message_mapper.map(messages)
+        return FastJSONRenderer().render(data)
+
+    current_seconds, current_body = timed(current, repeat)
+    fast_seconds, fast_body = timed(fast, repeat)
+    assert current_body == fast_body, "outputs differ"
+    return {
+        "messages": messages,
+        "bytes": len(fast_body),
+        "serializer_ms": round(current_seconds * 1000, 1),
+        "fast_ms": round(fast_seconds * 1000, 1),
+        "speedup": round(current_seconds / fast_seconds, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db", choices=["sqlite", "postgres"], default="sqlite")
+    args = parser.parse_args()
+    django_env.setup(args.db)
+    print(json.dumps(run(args.messages, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Completion stream output: one SSE frame per upstream delta (window 0, the
+old behaviour) against coalesced frames.
+
+Runs the ASGI application in this process against `benchmarks.fake_openai`
+and counts the `http.response.body` messages it sends (each one is a write,
+usually one `send()` syscall, in uvicorn) and the CPU time it spends.
+
+    python -m benchmarks.sse_writer --streams 20 --tokens 500 --windows 0 0.02
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks import SERVER_DIR, django_env
+from benchmarks.load import free_port, seed, wait_for_port
+
+
+async def stream(application, token, conversation_id):
+    """
+    Request one completion; returns `(writes, bytes, pings)`.
+    """
+    counts = {"writes": 0, "bytes": 0, "pings": 0}
+    disconnected = asyncio.Event()
+
+    async def receive():
+        if not counts.get("sent_request"):
+            counts["sent_request"] = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200, message
+        elif message["type"] == "http.response.body" and message.get("body"):
+            counts["writes"] += 1
+            counts["bytes"] += len(message["body"])
+            counts["pings"] += message["body"].count(b": ping\n\n")
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": f"/api/v1/conversations/{conversation_id}/stream/",
+        "raw_path": b"",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"localhost"),
+            (b"authorization", f"Bearer {token}".encode()),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 80),
+    }
+    await application(scope, receive, send)
+    disconnected.set()
+    return counts["writes"], counts["bytes"], counts["pings"]
+
+
+async def run_window(application, token, conversation_ids, window):
+    from django.conf import settings
+
+    settings.STREAM_FRAME_WINDOW = window
+    cpu = time.process_time()
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(stream(application, token, id) for id in conversation_ids)
+    )
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu
+    writes = sum(result[0] for result in results)
+    streams = len(conversation_ids)
+    return {
+        "window_ms": window * 1000,
+        "streams": streams,
+        "writes_per_stream": round(writes / streams, 1),
+        "bytes_per_stream": round(sum(result[1] for result in results) / streams),
+        "pings": sum(result[2] for result in results),
+        "cpu_ms_per_stream": round(cpu * 1000 / streams, 2),
+        "seconds": round(elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--streams", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=500)
+    parser.add_argument("--tokens-per-second", type=float, default=200)
+    parser.add_argument("--ttft-ms", type=int, default=200)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 0.02])
+    args = parser.parse_args()
+
+    env = django_env.configure()
+    port = free_port()
+    fake = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.fake_openai",
+            "--port", str(port),
+            "--ttft-ms", str(args.ttft_ms),
+            "--tokens-per-second", str(args.tokens_per_second),
+            "--tokens", str(args.tokens),
+        ],
+        cwd=SERVER_DIR,
+        env=env,
+    )
+    try:
+        wait_for_port(port, fake)
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+        os.environ["OPENAI_HTTP2"] = "False"
+        os.environ["STREAM_CONCURRENCY"] = str(args.streams)
+        django_env.setup()
+
+        from src.asgi import application
+
+        [(token, conversation_ids)] = seed(1, args.streams * len(args.windows), 2)
+
+        async def run_all():
+            # Warm up the client and the token counter; the upstream client
+            # is bound to this event loop, so everything runs in one
+            await run_window(application, token, conversation_ids[:1], 0)
+            results = []
+            for number, window in enumerate(args.windows):
+                ids = conversation_ids[number * args.streams :][: args.streams]
+                results.append(await run_window(application, token, ids, window))
+            return results
+
+        print(json.dumps(asyncio.run(run_all()), indent=2))
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,4 +4,5 @@
 /opt/venv/bin/python manage.py makemigrations prompts
 /opt/venv/bin/python manage.py makemigrations conversations
 /opt/venv/bin/python manage.py makemigrations
-/opt/venv/bin/python manage.py migrate
\ No newline at end of file
+/opt/venv/bin/python manage.py migrate
+/opt/venv/bin/python manage.py createcachetable
\ No newline at end of file
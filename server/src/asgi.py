@@ -7,10 +7,68 @@ For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 
+import asyncio
+import contextvars
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+
+from src import metrics
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'src.settings')
 
-application = get_asgi_application()
+_receive = contextvars.ContextVar('receive')
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    ASGIHandler that stops streaming responses when the client disconnects.
+
+    Django 4.2 doesn't read from the connection after the request body, so
+    a stream whose client is gone keeps running until its iterator is
+    exhausted. Here `http.disconnect` is awaited while a streaming response
+    is sent and cancels the sending; the response iterator gets a
+    CancelledError and closes its resources (e.g. the upstream completion).
+    """
+
+    async def handle(self, scope, receive, send):
+        _receive.set(receive)
+        await super().handle(scope, receive, send)
+
+    async def send_response(self, response, send):
+        receive = _receive.get(None)
+        if not response.streaming or receive is None:
+            return await super().send_response(response, send)
+
+        sending = asyncio.create_task(super().send_response(response, send))
+        disconnect = asyncio.create_task(self.wait_for_disconnect(receive))
+        try:
+            await asyncio.wait(
+                [sending, disconnect], return_when=asyncio.FIRST_COMPLETED
+            )
+        except asyncio.CancelledError:
+            sending.cancel()
+            raise
+        finally:
+            disconnect.cancel()
+        if sending.done():
+            return sending.result()
+
+        sending.cancel()
+        try:
+            await sending
+        except asyncio.CancelledError:
+            pass
+        # Not reached by the cancelled send_response(), fires request_finished
+        await sync_to_async(response.close, thread_sensitive=True)()
+        metrics.increment('streams_disconnected')
+
+    async def wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+
+django.setup(set_prefix=False)
+application = StreamingASGIHandler()
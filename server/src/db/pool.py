@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of DB-API connections.
+
+    `acquire` hands out an idle connection (most recently used first, so
+    surplus connections age out), opens a new one while the pool is below
+    `max_size`, or blocks up to `timeout` seconds for one to be released.
+    Blocking is fine under ASGI: Django runs the ORM in worker threads,
+    never on the event loop.
+
+    `reset(connection)` is called on release and returns False when the
+    connection can't be reused; `check(connection)` is called before handing
+    out a connection that was idle for more than `check_after` seconds.
+    """
+
+    def __init__(
+        self,
+        connect,
+        reset,
+        check,
+        max_size=10,
+        timeout=10,
+        max_lifetime=3600,
+        max_idle=300,
+        check_after=30,
+    ):
+        self._connect = connect
+        self._reset = reset
+        self._check = check
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_after = check_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, released at)
+        self._opened_at = {}  # id(connection) -> opened at
+        self._size = 0
+        self._waiting = 0
+
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        stale = []
+        try:
+            with self._cond:
+                while True:
+                    connection, released_at = self._take_idle(stale)
+                    if connection is not None or self._size < self.max_size:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(
+                            f"No database connection available in {self.timeout}s "
+                            f"({self.max_size} in use)"
+                        )
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if connection is None:
+                    # Reserve a slot, connect outside the lock
+                    self._size += 1
+        finally:
+            for connection_ in stale:
+                self._close(connection_)
+
+        if connection is not None:
+            if time.monotonic() - released_at > self.check_after and not self._check(
+                connection
+            ):
+                self._discard(connection)
+                return self.acquire()
+        else:
+            try:
+                connection = self._connect()
+            except BaseException:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            self._opened_at[id(connection)] = time.monotonic()
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return connection
+
+    def release(self, connection, discard=False):
+        if not discard:
+            try:
+                discard = not self._reset(connection)
+            except Exception:
+                discard = True
+        if discard or self._expired(connection):
+            self._discard(connection)
+            return
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                "waiting": self._waiting,
+                "max_size": self.max_size,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(
+                    self.wait_total / self.checkouts * 1000 if self.checkouts else 0, 3
+                ),
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+    def _take_idle(self, stale):
+        """
+        Pop the most recently released usable connection. Expired ones give
+        up their slot and are moved to `stale`, to be closed outside the lock.
+        """
+        now = time.monotonic()
+        # The oldest entries sit on the left
+        while self._idle and now - self._idle[0][1] > self.max_idle:
+            stale.append(self._forget(self._idle.popleft()[0]))
+        while self._idle:
+            connection, released_at = self._idle.pop()
+            if self._expired(connection):
+                stale.append(self._forget(connection))
+                continue
+            return connection, released_at
+        return None, None
+
+    def _forget(self, connection):
+        self._opened_at.pop(id(connection), None)
+        self._size -= 1
+        self._cond.notify()
+        return connection
+
+    def _expired(self, connection):
+        opened_at = self._opened_at.get(id(connection), 0)
+        return time.monotonic() - opened_at > self.max_lifetime
+
+    def _discard(self, connection):
+        with self._cond:
+            self._forget(connection)
+        self._close(connection)
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
@@ -0,0 +1,82 @@
+"""
+PostgreSQL backend that takes connections from a process-wide pool.
+
+Enabled with `DB_POOL_MODE=pool`. `close()` (called by Django at the end
+of every request, `CONN_MAX_AGE` is 0) gives the connection back to the pool
+instead of closing it, so the per-request cost is a rollback check rather
+than a TCP + auth handshake. Pool settings come from the `POOL` key of the
+database settings.
+"""
+import os
+import threading
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from src import metrics
+from src.db.pool import ConnectionPool, PoolTimeout
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def reset_connection(connection):
+    """
+    Roll back whatever the request left open; False if the connection is broken.
+    """
+    if connection.closed:
+        return False
+    status = connection.info.transaction_status
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status != extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+    return True
+
+
+def check_connection(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except base.Database.Error:
+        return False
+    return reset_connection(connection)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_pool(self, conn_params=None):
+        # Keyed by pid as well: a forked worker must not reuse the parent's sockets
+        key = (self.alias, os.getpid())
+        pool = _pools.get(key)
+        if pool is None and conn_params is not None:
+            with _pools_lock:
+                pool = _pools.get(key)
+                if pool is None:
+                    pool = ConnectionPool(
+                        connect=lambda: super(DatabaseWrapper, self).get_new_connection(
+                            conn_params
+                        ),
+                        reset=reset_connection,
+                        check=check_connection,
+                        **self.settings_dict.get("POOL", {}),
+                    )
+                    _pools[key] = pool
+                    metrics.register_gauge(f"db_pool_{self.alias}", pool.stats)
+        return pool
+
+    def get_new_connection(self, conn_params):
+        try:
+            return self.get_pool(conn_params).acquire()
+        except PoolTimeout as exc:
+            # Surfaces as django.db.OperationalError
+            raise self.Database.OperationalError(str(exc)) from exc
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool = self.get_pool()
+        if pool is None:
+            super()._close()
+            return
+        # Closed inside atomic(): the transaction state is unknown, don't reuse
+        pool.release(self.connection, discard=self.in_atomic_block)
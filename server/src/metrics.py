@@ -0,0 +1,31 @@
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+
+
+def increment(name, value=1):
+    """
+    Increase a process-wide counter.
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def register_gauge(name, callback):
+    """
+    Register a callable that returns the current value of a gauge.
+    """
+    _gauges[name] = callback
+
+
+def snapshot():
+    """
+    Current values of all counters and gauges of this worker process.
+    """
+    with _lock:
+        counters = dict(_counters)
+    gauges = {name: callback() for name, callback in _gauges.items()}
+    return {"counters": counters, "gauges": gauges}
+
@@ -0,0 +1,108 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+
+logger = logging.getLogger("instrumentation")
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting queries and the time spent in them.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Per-request query count, database time, render time and response size.
+
+    Reported as a `Server-Timing` header and as one log line per request on
+    the `instrumentation` logger. Enabled with `REQUEST_INSTRUMENTATION=True`.
+    For streamed responses only the work done before the first byte is
+    counted, and the size is not known.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with self.count_queries(counter):
+            response = self.get_response(request)
+        return self.report(request, response, counter, started)
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with self.count_queries(counter):
+            response = await self.get_response(request)
+        return self.report(request, response, counter, started)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered (serialized) after all template
+        # response middleware has run
+        started = time.perf_counter()
+
+        def rendered(response):
+            request.render_duration = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def count_queries(counter):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        return stack
+
+    def report(self, request, response, counter, started):
+        total = time.perf_counter() - started
+        render = getattr(request, "render_duration", 0.0)
+        size = None if response.streaming else len(response.content)
+        match = request.resolver_match
+        view = match.view_name if match else "-"
+
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={counter.duration * 1000:.1f};desc="{counter.count} queries"',
+                f"render;dur={render * 1000:.1f}",
+                f"total;dur={total * 1000:.1f}",
+            ]
+        )
+        logger.info(
+            "view=%s method=%s status=%s queries=%d db_ms=%.1f render_ms=%.1f "
+            "total_ms=%.1f bytes=%s",
+            view,
+            request.method,
+            response.status_code,
+            counter.count,
+            counter.duration * 1000,
+            render * 1000,
+            total * 1000,
+            "-" if size is None else size,
+        )
+        return response
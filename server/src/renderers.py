@@ -0,0 +1,48 @@
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from rest_framework.renderers import JSONRenderer
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    `JSONRenderer` producing the same bytes through orjson.
+
+    Dates and times are handed back to DRF's encoder, so they come out as
+    before; UUIDs are `str(uuid)` either way. Indented
+    output (the browsable API, `; indent=`), non-compact or ASCII-only
+    settings, and anything orjson refuses fall back to `JSONRenderer`.
+
+    Known differences: floats below 1e-4 or from 1e16 up are written without
+    the `+`/leading zero of Python's exponent (`1e-5`, not `1e-05`), and NaN
+    or infinity become `null` instead of raising.
+    """
+
+    options = orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        if (
+            orjson is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+            is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default, option=self.options
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same strict javascript subset as JSONRenderer
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
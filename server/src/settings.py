@@ -20,7 +20,30 @@ if path.isfile(dotenv_file):
 DEVELOPMENT_MODE = getenv('DEVELOPMENT_MODE', 'False') == 'True'
 
 APIKEY = getenv('OPENAI_APIKEY')
-PROXY_URL = getenv('PROXY_URL')
+# Empty in a copy of .env.example, which means no proxy
+PROXY_URL = getenv('PROXY_URL') or None
+OPENAI_BASE_URL = getenv('OPENAI_BASE_URL')
+
+# Upstream OpenAI HTTP transport (connection pool, timeouts, retries)
+OPENAI_HTTP = {
+    'MAX_CONNECTIONS': int(getenv('OPENAI_MAX_CONNECTIONS', 200)),
+    'MAX_KEEPALIVE_CONNECTIONS': int(getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 50)),
+    'KEEPALIVE_EXPIRY': float(getenv('OPENAI_KEEPALIVE_EXPIRY', 120)),
+    'HTTP2': getenv('OPENAI_HTTP2', 'True') == 'True',
+    'CONNECT_TIMEOUT': float(getenv('OPENAI_CONNECT_TIMEOUT', 5)),
+    # Max gap between two chunks of a streamed answer, not the whole answer
+    'READ_TIMEOUT': float(getenv('OPENAI_READ_TIMEOUT', 60)),
+    'WRITE_TIMEOUT': float(getenv('OPENAI_WRITE_TIMEOUT', 10)),
+    'POOL_TIMEOUT': float(getenv('OPENAI_POOL_TIMEOUT', 10)),
+    'CONNECT_RETRIES': int(getenv('OPENAI_CONNECT_RETRIES', 3)),
+    'RETRY_BACKOFF': float(getenv('OPENAI_RETRY_BACKOFF', 0.25)),
+}
+
+# Conversation titles: the opening words of the first reply, optionally
+# replaced by a summary generated in a background thread pool
+TITLE_SUMMARY = getenv('TITLE_SUMMARY', 'False') == 'True'
+TITLE_MODEL = getenv('TITLE_MODEL', 'gpt-3.5-turbo')
+TITLE_WORKERS = int(getenv('TITLE_WORKERS', 2))
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
@@ -61,6 +84,12 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Query count / timing per request in Server-Timing headers and logs
+REQUEST_INSTRUMENTATION = getenv('REQUEST_INSTRUMENTATION', 'False') == 'True'
+
+if REQUEST_INSTRUMENTATION:
+    MIDDLEWARE.insert(0, 'src.middleware.RequestInstrumentationMiddleware')
+
 ROOT_URLCONF = 'src.urls'
 
 TEMPLATES = [
@@ -95,7 +124,7 @@ if DEVELOPMENT_MODE is True:
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
+            'NAME': getenv('SQLITE_NAME', BASE_DIR / 'db.sqlite3'),
         }
     }
 else:
@@ -110,6 +139,61 @@ else:
         }
     }
 
+# Database connections:
+# `none` - a new connection per request;
+# `persistent` - reused by the same thread for DB_CONN_MAX_AGE seconds, suits
+#   WSGI workers and management commands (under ASGI every request runs in
+#   its own context and opens its own connection anyway);
+# `pool` - Postgres only, a bounded pool shared by all requests of a worker
+#   process, see src/db/postgresql/base.py.
+DB_POOL_MODE = getenv('DB_POOL_MODE', 'none')
+
+if DB_POOL_MODE == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = int(getenv('DB_CONN_MAX_AGE', 60))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+elif DB_POOL_MODE == 'pool' and not DEVELOPMENT_MODE:
+    DATABASES['default']['ENGINE'] = 'src.db.postgresql'
+    DATABASES['default']['POOL'] = {
+        'max_size': int(getenv('DB_POOL_MAX_SIZE', 20)),
+        'timeout': float(getenv('DB_POOL_TIMEOUT', 10)),
+        'max_lifetime': float(getenv('DB_POOL_MAX_LIFETIME', 3600)),
+        'max_idle': float(getenv('DB_POOL_MAX_IDLE', 300)),
+        'check_after': float(getenv('DB_POOL_CHECK_AFTER', 30)),
+    }
+
+
+# Cache
+# Shared by all workers: Redis when REDIS_URL is set, otherwise a file cache
+# on local disk. `db` and `locmem` are available for tests and single workers.
+REDIS_URL = getenv('REDIS_URL')
+CACHE_BACKEND = getenv('CACHE_BACKEND', 'redis' if REDIS_URL else 'file')
+
+CACHE_BACKENDS = {
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': getenv('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': getenv('CACHE_LOCATION', 'cache_table'),
+    },
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+CACHES = {
+    'default': {
+        **CACHE_BACKENDS[CACHE_BACKEND],
+        'KEY_PREFIX': getenv('CACHE_KEY_PREFIX', 'ai'),
+        'TIMEOUT': 300,
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -171,7 +255,7 @@ CORS_ALLOW_CREDENTIALS = True
 REST_FRAMEWORK = {
     'DATETIME_FORMAT': '%Y-%m-%dT%H:%M:%S.%fZ',
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'src.renderers.FastJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -183,15 +267,81 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
-        'rest_framework.throttling.ScopedRateThrottle',
+        'src.throttling.SlidingWindowAnonRateThrottle',
+        'src.throttling.SlidingWindowUserRateThrottle',
+        'src.throttling.SlidingWindowScopedRateThrottle',
     ],
-    'DEFAULT_THROTTLE_RATES': {'anon': '100/second', 'user': '1000/second', 'subscribe': '60/minute'},
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': '100/second',
+        'user': '1000/second',
+        'subscribe': '60/minute',
+        'stream': getenv('STREAM_CONCURRENCY', '3') + '/concurrent',
+    },
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.openapi.AutoSchema',
 }
 
+# Open completion streams slot lifetime, in case a worker dies mid-stream
+STREAM_SLOT_TIMEOUT = int(getenv('STREAM_SLOT_TIMEOUT', 600))
+
+# Identical completions in flight share one upstream request: `local` within a
+# worker, `shared` also across workers through the cache (needs Redis)
+STREAM_BROKER = getenv('STREAM_BROKER', 'local')
+STREAM_BROKER_POLL = float(getenv('STREAM_BROKER_POLL', 0.05))
+STREAM_BROKER_TTL = int(getenv('STREAM_BROKER_TTL', 300))
+
+# Streams are resumable with Last-Event-ID: the last frames of a generation are
+# kept for replay until this long after it ends; the upstream request outlives
+# its last client by a grace period, for it to reconnect
+STREAM_REPLAY_FRAMES = int(getenv('STREAM_REPLAY_FRAMES', 2048))
+STREAM_REPLAY_TTL = int(getenv('STREAM_REPLAY_TTL', 60))
+STREAM_RESUME_GRACE = float(getenv('STREAM_RESUME_GRACE', 5))
+
+# Upstream deltas are merged into one SSE frame per window (seconds) or size;
+# a `: ping` comment is sent after a heartbeat interval of upstream silence
+STREAM_FRAME_WINDOW = float(getenv('STREAM_FRAME_WINDOW', 0.02))
+STREAM_FRAME_BYTES = int(getenv('STREAM_FRAME_BYTES', 1024))
+STREAM_HEARTBEAT = float(getenv('STREAM_HEARTBEAT', 15))
+
+# Completions with temperature 0 are replayed from a per-process cache of this
+# many bytes, least recently used evicted first, for this many seconds; the
+# frames are sent with their original chunking, an interval (seconds) apart
+COMPLETION_CACHE = getenv('COMPLETION_CACHE', 'False') == 'True'
+COMPLETION_CACHE_BYTES = int(getenv('COMPLETION_CACHE_BYTES', 32 * 1024 * 1024))
+COMPLETION_CACHE_TTL = int(getenv('COMPLETION_CACHE_TTL', 3600))
+COMPLETION_CACHE_REPLAY_INTERVAL = float(
+    getenv('COMPLETION_CACHE_REPLAY_INTERVAL', 0.005)
+)
+
+# Upstream admission per model and worker process: concurrent completions and
+# tokens per minute (0 - unlimited), as `model=concurrency:tpm,...` for the
+# models with their own limits; queued requests are served fairly across users
+# and get their queue position in `queue` events every interval (seconds)
+UPSTREAM_CONCURRENCY = int(getenv('UPSTREAM_CONCURRENCY', 32))
+UPSTREAM_TPM = int(getenv('UPSTREAM_TPM', 0))
+UPSTREAM_MODEL_LIMITS = {
+    model: tuple(int(limit) for limit in limits.split(':'))
+    for model, _, limits in (
+        item.partition('=') for item in getenv('UPSTREAM_MODEL_LIMITS', '').split(',')
+        if item
+    )
+}
+UPSTREAM_QUEUE_STATUS_INTERVAL = float(getenv('UPSTREAM_QUEUE_STATUS_INTERVAL', 1))
+# Share of the upstream a user gets in the queue relative to others (default 1),
+# as `user_id=weight,...`
+UPSTREAM_USER_WEIGHTS = {
+    int(user): float(weight)
+    for user, _, weight in (
+        item.partition('=') for item in getenv('UPSTREAM_USER_WEIGHTS', '').split(',')
+        if item
+    )
+}
+
+# Messages are deleted in batches of this size, each in its own transaction;
+# chats with more messages than the threshold are deleted in the background
+DELETE_BATCH_SIZE = int(getenv('DELETE_BATCH_SIZE', 5000))
+BACKGROUND_DELETE_THRESHOLD = int(getenv('BACKGROUND_DELETE_THRESHOLD', 10000))
+
 # DJOSER Config
 DJOSER = {
     'PASSWORD_RESET_CONFIRM_URL': 'password-reset/{uid}/{token}',
@@ -225,6 +375,9 @@ AUTH_COOKIE_SAMESITE = 'None'
 
 AUTH_USER_MODEL = 'users.UserAccount'
 
+# How long the user behind an access token is cached
+JWT_USER_CACHE_TTL = int(getenv('JWT_USER_CACHE_TTL', 60))
+
 AUTHENTICATION_BACKENDS = [
     'social_core.backends.vk.VKOAuth2',
     'social_core.backends.google.GoogleOAuth2',
@@ -0,0 +1,48 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+# Upper bound of SQL queries per endpoint, authentication and transaction
+# statements included (with a warm JWT user cache).
+QUERY_BUDGETS = {
+    "chats-list-create": 2,
+    "chat-config-update": 3,
+    "chat-delete": 7,
+    "delete-messages-in-chat": 3,
+    "chat-messages-list": 2,
+    "chat-messages-page": 2,
+    "message-create": 6,
+    "messages-bulk-create": 6,
+    "message-delete": 3,
+    "systemprompt-list": 1,
+    "systemprompt-detail": 1,
+    "useraccount-me": 0,
+}
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin asserting that an endpoint stays within its query budget.
+
+        response = self.assertQueryBudget(
+            "message-create", "post", conversation_id=chat.id, data={...}
+        )
+    """
+
+    def assertQueryBudget(self, url_name, method="get", budget=None, **kwargs):
+        data = kwargs.pop("data", None)
+        url = reverse(url_name, kwargs=kwargs or None)
+        budget = QUERY_BUDGETS[url_name] if budget is None else budget
+
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data=data, format="json")
+            if response.streaming:
+                b"".join(response.streaming_content)
+
+        executed = "\n".join(query["sql"] for query in queries.captured_queries)
+        self.assertLessEqual(
+            len(queries),
+            budget,
+            f"{url_name} ran {len(queries)} queries, budget is {budget}:\n{executed}",
+        )
+        return response
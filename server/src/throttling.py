@@ -0,0 +1,134 @@
+from django.conf import settings
+from rest_framework.throttling import (
+    AnonRateThrottle,
+    BaseThrottle,
+    ScopedRateThrottle,
+    SimpleRateThrottle,
+    UserRateThrottle,
+)
+
+
+class SlidingWindowMixin:
+    """
+    Sliding window counter for `SimpleRateThrottle` subclasses.
+
+    Instead of a list of request timestamps per client, keeps one counter per
+    fixed window and estimates the rate over the last `duration` seconds as
+    `current + previous * (share of the previous window still in range)`.
+    Counters are bumped with `cache.add` + `cache.incr`, which are atomic on
+    Redis, so the limit holds across workers and containers.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        current_key = f"{self.key}:{window}"
+        previous_key = f"{self.key}:{window - 1}"
+
+        self.cache.add(current_key, 0, self.duration * 2)
+        try:
+            self.current = self.cache.incr(current_key)
+        except ValueError:
+            # Evicted between add() and incr()
+            self.cache.set(current_key, 1, self.duration * 2)
+            self.current = 1
+        self.previous = self.cache.get(previous_key, 0)
+
+        self.elapsed = self.now - window * self.duration
+        weight = 1 - self.elapsed / self.duration
+        if self.current + self.previous * weight > self.num_requests:
+            return self.throttle_failure()
+        return True
+
+    def wait(self):
+        """
+        Seconds until the estimated rate drops below the limit.
+        """
+        remaining = self.duration - self.elapsed
+        if self.current >= self.num_requests or not self.previous:
+            return remaining
+        # Wait until the previous window's weight has decayed enough
+        weight = (self.num_requests - self.current) / self.previous
+        return max(0.0, (1 - weight) * self.duration - self.elapsed)
+
+
+class SlidingWindowAnonRateThrottle(SlidingWindowMixin, AnonRateThrottle):
+    pass
+
+
+class SlidingWindowUserRateThrottle(SlidingWindowMixin, UserRateThrottle):
+    pass
+
+
+class SlidingWindowScopedRateThrottle(SlidingWindowMixin, ScopedRateThrottle):
+    def allow_request(self, request, view):
+        # Same scope resolution as ScopedRateThrottle.allow_request
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return True
+
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+
+class ConcurrentStreamThrottle(BaseThrottle):
+    """
+    Limits how many completion streams a user may have open at once.
+
+    The rate is configured as `"<number>/concurrent"` under the `stream`
+    scope. A slot taken in `allow_request` must be given back with
+    `release_stream_slot` when the stream ends; the counter also expires
+    after `STREAM_SLOT_TIMEOUT` in case a worker dies mid-stream.
+    """
+
+    scope = "stream"
+    cache = SimpleRateThrottle.cache
+    cache_format = "throttle_%(scope)s_%(ident)s"
+
+    def __init__(self):
+        rate = SimpleRateThrottle.THROTTLE_RATES.get(self.scope)
+        self.max_streams = int(rate.split("/")[0]) if rate else None
+
+    def allow_request(self, request, view):
+        if self.max_streams is None or not request.user.is_authenticated:
+            return True
+
+        key = self.cache_format % {"scope": self.scope, "ident": request.user.pk}
+        timeout = settings.STREAM_SLOT_TIMEOUT
+        self.cache.add(key, 0, timeout)
+        try:
+            count = self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, timeout)
+            count = 1
+
+        if count > self.max_streams:
+            self.cache.decr(key)
+            return False
+
+        request.stream_slot_key = key
+        return True
+
+
+def release_stream_slot(request):
+    """
+    Give back the slot taken by `ConcurrentStreamThrottle`, if any.
+    """
+    key = getattr(request, "stream_slot_key", None)
+    if key is None:
+        return
+    request.stream_slot_key = None
+    try:
+        if ConcurrentStreamThrottle.cache.decr(key) < 0:
+            ConcurrentStreamThrottle.cache.set(key, 0, settings.STREAM_SLOT_TIMEOUT)
+    except ValueError:
+        # Already expired
+        pass
@@ -7,6 +7,7 @@ from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
 from .custom_schema import CustomSchemaGenerator
+from .views import MetricsView
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -29,6 +30,7 @@ urlpatterns = [
     path("api/v1/users/", include("users.urls")),
     path("api/v1/prompts/", include("prompts.urls")),
     path("api/v1/conversations/", include("conversations.urls")),
+    path("api/v1/metrics/", MetricsView.as_view(), name="metrics"),
     path("api-auth/", include("rest_framework.urls")),
     path(
         "docs/",
@@ -0,0 +1,23 @@
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from src import metrics
+
+
+class MetricsView(APIView):
+    """
+    Process metrics for staff users.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        tags=["Metrics"],
+        operation_summary="Метрики текущего процесса.",
+        operation_description="### Счетчики и показатели (пулы соединений и т.д.) "
+        "процесса, обработавшего запрос. Доступно только администраторам.",
+    )
+    def get(self, request, *args, **kwargs):
+        return Response(metrics.snapshot())